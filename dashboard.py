@@ -5,6 +5,7 @@ import streamlit as st
 from pathlib import Path
 import pandas as pd # <-- 新增
 import sys          # <-- 新增
+import matplotlib.pyplot as plt
 
 # --- 關鍵設定：將專案根目錄加入 Python 路徑 ---
 # 這能確保 streamlit 能找到 'src' 和 'utils' 資料夾
@@ -19,7 +20,8 @@ try:
     from src.visualization.step_05_visualize_alignment import visualize_team_alignment
     from src.evaluation.step_07_compare_initial_vs_optimal import compare_initial_vs_optimal
     # 導入我們剛剛建立的輔助工具
-    from src.utils.dashboard_utils import get_player_lists
+    from src.utils.dashboard_utils import get_player_lists, get_league_matrix, get_whatif_session
+    from src.visualization.step_05_visualize_alignment import draw_baseball_field_v2
 except ImportError as e:
     st.error(f"**啟動失敗**：找不到必要的 'src' 或 'utils' 模組。\n錯誤: {e}")
     st.warning("請確認您的 `dashboard.py` 檔案是放在專案的根目錄中 (與 `src` 和 `data` 資料夾在同一層)。")
@@ -48,6 +50,8 @@ selected_lf = st.sidebar.selectbox("選擇左外野手 (LF):", [""] + lfs)
 selected_cf = st.sidebar.selectbox("選擇中外野手 (CF):", [""] + cfs)
 selected_rf = st.sidebar.selectbox("選擇右外野手 (RF):", [""] + rfs)
 
+show_surface = st.sidebar.checkbox("顯示站位熱區 (各外野手移動時的期望出局數變化)", value=True)
+
 # 執行按鈕
 run_button = st.sidebar.button("執行分析")
 
@@ -75,9 +79,11 @@ if run_button:
                 
                 # 3. 執行視覺化 (Step 5)
                 #    (這會讀取 .json 並回傳圖表)
-                fig = visualize_team_alignment(selected_batter, fielder_names)
+                fig = visualize_team_alignment(selected_batter, fielder_names, show_surface=show_surface)
                 
                 st.success("分析完成！")
+                # 記住這組對戰，下方的 what-if 區塊在滑桿觸發重新執行時仍可使用
+                st.session_state["whatif_matchup"] = (selected_batter, fielder_names)
 
                 # --- 4. 顯示結果 (使用雙欄位佈局) ---
                 col1, col2 = st.columns([1, 2]) # 建立兩個欄位，右邊是左邊的 2 倍寬
@@ -142,6 +148,16 @@ if run_button:
                                   help="最佳化站位 vs. 初始站位的平均接殺機率差異。")
                     # --- ▲▲▲ 【更新結束】 ▲▲▲ ---
 
+                    # 從全聯盟矩陣直接查表：各守備員在預設站位下對此打者的個人期望接殺
+                    league = get_league_matrix()
+                    if league is not None:
+                        st.subheader("預設站位個人期望接殺 (全聯盟矩陣):")
+                        for pos, name in fielder_names.items():
+                            try:
+                                st.text(f"{pos} ({name}): {league.lookup(name, selected_batter, pos):.2f} 球")
+                            except KeyError:
+                                st.text(f"{pos} ({name}): N/A")
+
                 # --- 在右側欄位 (col2) 顯示 Step 05 的圖表 ---
                 with col2:
                     st.pyplot(fig) # 使用 st.pyplot() 來顯示 Matplotlib 圖表
@@ -157,3 +173,45 @@ if run_button:
                     st.error(f"分析過程中發生錯誤: {e}")
             '''
 
+# --- 5. What-if 站位調整 (滑桿即時重算) ---
+if "whatif_matchup" in st.session_state:
+    whatif_batter, whatif_fielders = st.session_state["whatif_matchup"]
+    st.header(f"What-if 站位調整: {whatif_batter}")
+    try:
+        session = get_whatif_session(whatif_batter, whatif_fielders)
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        st.error(f"無法建立 what-if 評估: {e}")
+        st.stop()
+
+    start_positions = session.reference.get("optimal") or session.positions
+    slider_cols = st.columns(3)
+    new_positions = {}
+    for col, pos in zip(slider_cols, ["LF", "CF", "RF"]):
+        with col:
+            st.subheader(f"{pos} ({whatif_fielders[pos]})")
+            x = st.slider(f"{pos} X (ft)", -280.0, 280.0, float(start_positions[pos][0]), 1.0, key=f"whatif_{pos}_x")
+            y = st.slider(f"{pos} Y (ft)", 0.0, 420.0, float(start_positions[pos][1]), 1.0, key=f"whatif_{pos}_y")
+            new_positions[pos] = [x, y]
+    whatif = session.set_positions(new_positions)
+
+    metric_cols = st.columns(4)
+    metric_cols[0].metric("預期總接殺", f"{whatif['score']:.2f} / {session.num_batted_balls} 球")
+    metric_cols[1].metric("平均團隊接殺機率", f"{whatif['avg_prob']:.2f}%")
+    if whatif["diff_vs_optimal"] is not None:
+        metric_cols[2].metric("vs. 最佳站位", f"{whatif['diff_vs_optimal']:+.2f} 球")
+    if whatif["diff_vs_initial"] is not None:
+        metric_cols[3].metric("vs. 初始站位", f"{whatif['diff_vs_initial']:+.2f} 球")
+    st.caption(f"重算耗時 {whatif['elapsed_ms']:.2f} ms")
+
+    fig_whatif, ax_whatif = plt.subplots(figsize=(7, 6))
+    draw_baseball_field_v2(ax_whatif)
+    ax_whatif.scatter(session.kernel.ball_x, session.kernel.ball_y, c=session.ball_probabilities(), cmap="RdYlGn",
+                      vmin=0, vmax=1, s=15, zorder=3)
+    for pos, (x, y) in whatif["positions"].items():
+        ax_whatif.scatter([x], [y], c='red', s=150, marker='*', zorder=5)
+        ax_whatif.annotate(pos, (x, y), textcoords="offset points", xytext=(0, 8), ha='center', fontweight='bold')
+    ax_whatif.set_xlim(-280, 280)
+    ax_whatif.set_ylim(0, 420)
+    ax_whatif.set_aspect('equal', adjustable='box')
+    st.pyplot(fig_whatif)
+    plt.close(fig_whatif)
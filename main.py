@@ -5,11 +5,19 @@ import argparse
 # 導入各個步驟的主執行函式
 from src.data.step_01_split_player_data import run_all_splits
 from src.data.step_02_preprocess_batted_balls import run_all_preprocessing
-from src.modeling.step_03_train_catch_model import run_all_modeling
-from src.optimization.step_04_find_optimal_position import run_team_optimization
+from src.data.step_08_incremental_ingest import ingest_new_games
+from src.modeling.step_03_train_catch_model import run_all_modeling, benchmark_compile_reuse, benchmark_nuts_samplers
+from src.modeling.step_13_onboard_new_players import onboard_players
+from src.optimization.step_04_find_optimal_position import run_team_optimization, benchmark_optimization_modes
 from src.visualization.step_05_visualize_alignment import visualize_team_alignment
 # 假設 step_07 在 src/evaluation/step_07... 且主函式為 compare_initial_vs_optimal
 from src.evaluation.step_07_compare_initial_vs_optimal import compare_initial_vs_optimal 
+from src.evaluation.step_09_league_catch_matrix import build_league_catch_matrix
+from src.evaluation.step_11_actual_defender_evaluation import evaluate_actual_defenders
+from src.evaluation.step_12_backtest_alignment import run_alignment_backtest
+from src.optimization.step_10_batter_archetypes import build_batter_archetypes, print_archetype_lookup, load_trios
+from src.utils.sweep_runner import run_sweep
+from src.utils.stream_runner import run_stream
 
 def main():
     """
@@ -27,16 +35,89 @@ def main():
                         help='(步驟 2) 執行資料預處理與特徵工程')
     parser.add_argument('--train', action='store_true', 
                         help='(步驟 3) 訓練階層式貝氏回歸模型')
+    parser.add_argument('--extend-draws', type=int, default=0, metavar='N',
+                        help='與 --train 併用：在既有的抽樣檢查點後，每條鏈再追加 N 個樣本 (不重新暖機)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='與 --train 併用：分回合抽樣，球員層級參數的 R-hat 與 ESS 達標即停止')
+    parser.add_argument('--streaming', action='store_true',
+                        help='與 --train 併用：串流讀取資料並以小批次 ADVI 訓練 (多季大量資料用)')
+    parser.add_argument('--fresh-train', action='store_true',
+                        help='與 --train 併用：忽略既有的抽樣檢查點，從頭開始抽樣')
+    parser.add_argument('--benchmark-compile', action='store_true',
+                        help='量測各守備位置冷編譯、每個抽樣區塊重新編譯與沿用已編譯 logp/梯度的耗時')
+    parser.add_argument('--nuts-sampler', type=str, choices=['pymc', 'nutpie', 'numpyro', 'blackjax'],
+                        help='與 --train 併用：NUTS 取樣後端 (未安裝時自動退回 pymc)')
+    parser.add_argument('--benchmark-samplers', action='store_true',
+                        help='比較已安裝的各個 NUTS 後端在三個守備位置上的每秒有效樣本數')
+    parser.add_argument('--onboard', type=str, nargs='*', metavar='PLAYER',
+                        help='新球員快速上線：超參數固定於既有後驗，只估計新球員的參數 (數秒內完成，不需重新訓練)。\n'
+                             '未指定球員時，自動找出處理後資料中所有尚未建模的球員')
     parser.add_argument('--optimize', action='store_true',
                         help='(步驟 4) 執行「指定團隊」站位最佳化。\n'
                              '必須同時提供 --batter, --lf-player, --cf-player, --rf-player')
+    parser.add_argument('--lineup', type=str, nargs='+', metavar='BATTER[=W]',
+                        help='與 --optimize 併用 (取代 --batter)：以打線中各打者的上場權重 W (預設 1) 混合擊球，\n'
+                             '求出一組涵蓋整個打線的站位，例如 --lineup "Abrams, CJ=0.3" "Abreu, Wilyer=0.2"')
+    parser.add_argument('--opt-mode', type=str, choices=['slsqp', 'polar'],
+                        help='與 --optimize 併用：slsqp (x/y + 扇形約束) 或 polar (半徑/角度 + 邊界、解析梯度)')
+    parser.add_argument('--benchmark-optimizer', action='store_true',
+                        help='比較各最佳化模式的函式呼叫次數與求解時間。\n'
+                             '必須同時提供 --batter, --lf-player, --cf-player, --rf-player')
     parser.add_argument('--visualize', action='store_true',
                         help='(步驟 5) 將指定團隊的最佳站位視覺化。\n'
                              '必須同時提供 --batter, --lf-player, --cf-player, --rf-player')
+    parser.add_argument('--surface', action='store_true',
+                        help='與 --visualize 併用：疊上各外野手移動時團隊期望出局數變化的熱區')
     # ✨ [確認] 指令名稱是 --compare
     parser.add_argument('--compare', action='store_true', 
                         help='(步驟 7) 比較初始站位與最佳站位的效益。\n'
                              '必須同時提供 --batter, --lf-player, --cf-player, --rf-player')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help='與 --compare 併用：以 N 次自助法重抽樣估計增益的信賴區間')
+    parser.add_argument('--reoptimize', action='store_true',
+                        help='與 --bootstrap 併用：對部分重抽樣重新最佳化，得到最佳站位座標的信賴區間 (可搭配 --workers)')
+
+    parser.add_argument('--league-matrix', action='store_true',
+                        help='(批次) 建立全聯盟「守備員 × 打者 × 位置」預設站位期望接殺矩陣')
+    parser.add_argument('--actual-defense', action='store_true',
+                        help='(批次) 以每筆擊球實際在場的外野手 (fielder_7/8/9) 評估全資料庫，\n'
+                             '依比賽、球隊、球季彙總預設站位 / 最佳站位 / 實際的接殺數 (可搭配 --workers)')
+    parser.add_argument('--season', type=int, nargs='+', help='與 --actual-defense 併用：只評估指定球季')
+    parser.add_argument('--no-solve', action='store_true',
+                        help='與 --actual-defense 併用：只使用已存的最佳站位，不求解缺少的組合')
+    parser.add_argument('--backtest', action='store_true',
+                        help='(批次) 時間切分回測：以較早的擊球最佳化、在之後的擊球上比較最佳與初始站位 (可搭配 --workers)。\n'
+                             '必須同時提供 --lf-player, --cf-player, --rf-player')
+    parser.add_argument('--split-date', type=str, metavar='YYYY-MM-DD',
+                        help='與 --backtest 併用：此日 (含) 之後為測試窗 (預設: 每位打者前 70%% 的擊球為訓練窗)')
+    parser.add_argument('--build-archetypes', type=str, nargs='?', const='', metavar='TRIOS_CSV',
+                        help='(批次) 將打者依擊球分佈分群，並為清單中的每個外野組合預先解出原型站位。\n'
+                             '清單欄位: lf_player, cf_player, rf_player；另可用 --lf/cf/rf-player 指定一組')
+    parser.add_argument('--archetype-lookup', type=str, nargs='*', metavar='BATTER',
+                        help='以原型站位快速取得打者 (預設為 --batter) 對指定外野組合的近似最佳站位。\n'
+                             '外野組合由 --lf/cf/rf-player 或 --trios 清單提供')
+    parser.add_argument('--trios', type=str, metavar='TRIOS_CSV', help='與 --archetype-lookup 併用：外野組合清單')
+    parser.add_argument('--archetype-score', action='store_true',
+                        help='與 --archetype-lookup 併用：另外計算原型站位在打者擊球上的期望出局數，以及與完整解的差距')
+    parser.add_argument('--ingest', type=str, nargs='+', metavar='CSV',
+                        help='(增量) 匯入新一天的 Statcast 原始資料，\n'
+                             '只更新受影響的打者/守備員檔案，並列出過期的最佳化結果')
+
+    parser.add_argument('--sweep', type=str, metavar='TASKS_CSV',
+                        help='(批次) 依任務清單批次執行 step_04 或 step_07，可中斷後接續。\n'
+                             '清單欄位: batter, lf_player, cf_player, rf_player [, 情境欄位...]')
+    parser.add_argument('--sweep-job', type=str, default='optimize', choices=['optimize', 'compare'],
+                        help='批次工作的任務類型 (預設: optimize)')
+    parser.add_argument('--sweep-name', type=str, help='批次資料夾名稱 (同名即接續執行)')
+    parser.add_argument('--serve-jsonl', type=str, nargs='?', const='-', metavar='JSONL',
+                        help='(常駐) 管線模式：從 stdin (或指定檔案) 逐行讀入 JSONL 對戰請求並求解最佳站位，\n'
+                             '每完成一個請求就輸出一行 JSONL 結果 (可搭配 --workers、--serve-jsonl-out)。\n'
+                             '請求欄位: batter, lf_player, cf_player, rf_player (或 fielders) [, situation, mode, id]')
+    parser.add_argument('--serve-jsonl-out', type=str, metavar='JSONL', help='與 --serve-jsonl 併用：結果附加寫入此檔 (預設: stdout)')
+    parser.add_argument('--workers', type=int, help='本機平行行程數 (預設: CPU 核心數)')
+    parser.add_argument('--shard', type=str, default='1/1', metavar='I/N',
+                        help='多台機器靜態分工時，本機負責第 I 片 (共 N 片)')
+    parser.add_argument('--retry-failed', action='store_true', help='重新執行先前失敗的任務')
 
     # --- 執行所需參數 ---
     parser.add_argument('--batter', type=str, help='指定目標打者姓名')
@@ -55,18 +136,44 @@ def main():
         print("\n--- 任務: 執行資料預處理 ---")
         run_all_preprocessing()
 
+    if args.ingest:
+        print("\n--- 任務: 增量匯入新資料 ---")
+        ingest_new_games(args.ingest)
+
     if args.train:
         print("\n--- 任務: 執行模型訓練 ---")
-        run_all_modeling()
+        run_all_modeling(resume=not args.fresh_train, extra_draws=args.extend_draws, adaptive=args.adaptive,
+                         streaming=args.streaming, nuts_sampler=args.nuts_sampler)
+
+    if args.onboard is not None:
+        print("\n--- 任務: 新球員快速上線 ---")
+        onboard_players(args.onboard or None)
+
+    if args.benchmark_compile:
+        print("\n--- 任務: 量測模型編譯時間 ---")
+        benchmark_compile_reuse()
+
+    if args.benchmark_samplers:
+        print("\n--- 任務: 比較 NUTS 取樣後端 ---")
+        benchmark_nuts_samplers()
 
     if args.optimize:
-        required_args = [args.batter, args.lf_player, args.cf_player, args.rf_player]
+        required_args = [args.batter or args.lineup, args.lf_player, args.cf_player, args.rf_player]
         if not all(required_args):
             print("\n❌ [錯誤] 使用 --optimize 時，必須同時提供所有球員姓名。")
         else:
             print("\n--- 任務: 執行團隊站位最佳化 ---")
             fielder_names = {"LF": args.lf_player, "CF": args.cf_player, "RF": args.rf_player}
-            run_team_optimization(batter_name=args.batter, fielder_names=fielder_names)
+            run_team_optimization(batter_name=args.lineup or args.batter, fielder_names=fielder_names, mode=args.opt_mode)
+
+    if args.benchmark_optimizer:
+        required_args = [args.batter, args.lf_player, args.cf_player, args.rf_player]
+        if not all(required_args):
+            print("\n❌ [錯誤] 使用 --benchmark-optimizer 時，必須同時提供所有球員姓名。")
+        else:
+            print("\n--- 任務: 比較最佳化模式 ---")
+            fielder_names = {"LF": args.lf_player, "CF": args.cf_player, "RF": args.rf_player}
+            benchmark_optimization_modes(batter_name=args.batter, fielder_names=fielder_names)
 
     if args.visualize:
         required_args = [args.batter, args.lf_player, args.cf_player, args.rf_player]
@@ -75,7 +182,7 @@ def main():
         else:
             print("\n--- 任務: 執行團隊站位視覺化 ---")
             fielder_names = {"LF": args.lf_player, "CF": args.cf_player, "RF": args.rf_player}
-            visualize_team_alignment(batter_name=args.batter, fielder_names=fielder_names)
+            visualize_team_alignment(batter_name=args.batter, fielder_names=fielder_names, show_surface=args.surface)
             
     # ✨ [確認] 判斷條件是 args.compare
     if args.compare:
@@ -85,11 +192,63 @@ def main():
         else:
             print("\n--- 任務: 比較初始站位 vs. 最佳站位 ---")
             fielder_names = {"LF": args.lf_player, "CF": args.cf_player, "RF": args.rf_player}
-            compare_initial_vs_optimal(batter_name=args.batter, fielder_names=fielder_names)
+            compare_initial_vs_optimal(batter_name=args.batter, fielder_names=fielder_names,
+                                       bootstrap=args.bootstrap, reoptimize=args.reoptimize, workers=args.workers)
+
+    if args.sweep:
+        print("\n--- 任務: 執行批次工作 ---")
+        try:
+            shard_index, shard_count = (int(v) for v in args.shard.split('/'))
+            if not 1 <= shard_index <= shard_count:
+                raise ValueError
+        except ValueError:
+            print(f"\n❌ [錯誤] --shard 格式應為 I/N (1 <= I <= N)，收到: {args.shard}")
+        else:
+            run_sweep(args.sweep, job=args.sweep_job, sweep_name=args.sweep_name, workers=args.workers,
+                      shard=(shard_index - 1, shard_count), retry_failed=args.retry_failed)
+
+    if args.serve_jsonl is not None:
+        run_stream(args.serve_jsonl, output=args.serve_jsonl_out, workers=args.workers)
+
+    if args.league_matrix:
+        print("\n--- 任務: 建立全聯盟期望接殺矩陣 ---")
+        build_league_catch_matrix()
+
+    if args.actual_defense:
+        print("\n--- 任務: 以實際在場的外野手評估 ---")
+        evaluate_actual_defenders(seasons=args.season, solve_missing=not args.no_solve, workers=args.workers)
+
+    if args.backtest:
+        if not all([args.lf_player, args.cf_player, args.rf_player]):
+            print("\n❌ [錯誤] 使用 --backtest 時，必須同時提供三位外野手姓名。")
+        else:
+            print("\n--- 任務: 時間切分回測 ---")
+            fielder_names = {"LF": args.lf_player, "CF": args.cf_player, "RF": args.rf_player}
+            run_alignment_backtest(fielder_names, split_date=args.split_date, workers=args.workers)
+
+    if args.build_archetypes is not None or args.archetype_lookup is not None:
+        trios = []
+        if all([args.lf_player, args.cf_player, args.rf_player]):
+            trios.append({"LF": args.lf_player, "CF": args.cf_player, "RF": args.rf_player})
+        for trio_csv in [args.build_archetypes, args.trios]:
+            if trio_csv:
+                trios.extend(load_trios(trio_csv))
+
+        if args.build_archetypes is not None:
+            print("\n--- 任務: 建立打者原型與原型站位 ---")
+            build_batter_archetypes(trios)
+
+        if args.archetype_lookup is not None:
+            batters = args.archetype_lookup or ([args.batter] if args.batter else [])
+            if not batters or not trios:
+                print("\n❌ [錯誤] 使用 --archetype-lookup 時，必須提供打者與至少一組外野組合。")
+            else:
+                print("\n--- 任務: 查詢原型站位 ---")
+                print_archetype_lookup(batters, trios, score=args.archetype_score)
 
     # --- 完整流程執行 ---
     # ✨ [核心修正] 確保 active_flags 列表包含所有正確的旗標
-    active_flags = [args.split, args.preprocess, args.train, args.optimize, args.visualize, args.compare] 
+    active_flags = [args.split, args.preprocess, args.train, args.onboard is not None, args.benchmark_compile, args.benchmark_samplers, args.optimize, args.benchmark_optimizer, args.visualize, args.compare, args.ingest, args.league_matrix, args.sweep, args.serve_jsonl is not None, args.actual_defense, args.backtest, args.build_archetypes is not None, args.archetype_lookup is not None] 
     if not any(active_flags):
         print("=== 未指定特定任務，將執行預設的基礎流程 (步驟 1-3) ===")
         print("\n--- 任務: 執行資料分割 ---")
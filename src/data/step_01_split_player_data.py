@@ -11,6 +11,26 @@ sys.path.append(str(PROJECT_ROOT))
 # 從 config 匯入我們需要的路徑
 from config import RAW_DATA_DIR, PROCESSED_DATA_DIR
 
+# 各守備位置的分割檔只包含打向該位置的擊球 (Statcast hit_location: 7=LF, 8=CF, 9=RF)
+HIT_LOCATIONS = {"LF": 7, "CF": 8, "RF": 9}
+# 外野的騰空球型態 (含內野高飛 popup，與原始匯出資料一致)
+AIR_BB_TYPES = ["fly_ball", "line_drive", "popup"]
+COL_HIT_LOCATION = "hit_location"
+COL_BB_TYPE = "bb_type"
+
+def filter_position_rows(df: pd.DataFrame, position_code: str = None) -> pd.DataFrame:
+    """
+    保留屬於該守備位置分割檔的擊球：騰空球型態，且 hit_location 為該位置
+    (position_code 為 None 時為任一外野位置)。缺少的欄位不篩選 (原始匯出資料已預先篩選過)。
+    step_08 的增量匯入也使用同一個篩選，增量結果才會與完整重建一致。
+    """
+    if COL_BB_TYPE in df.columns:
+        df = df[df[COL_BB_TYPE].isin(AIR_BB_TYPES)]
+    if COL_HIT_LOCATION in df.columns:
+        locations = list(HIT_LOCATIONS.values()) if position_code is None else [HIT_LOCATIONS[position_code]]
+        df = df[df[COL_HIT_LOCATION].isin(locations)]
+    return df
+
 def split_data_for_position(position_code: str):
     """
     根據指定的守備位置代碼 (例如 "CF", "LF")，讀取對應的原始資料，
@@ -36,7 +56,7 @@ def split_data_for_position(position_code: str):
 
     # 2. 執行與之前完全相同的資料處理邏輯
     print(f"讀取資料: {input_file}")
-    df = pd.read_csv(input_file, encoding='utf-8')
+    df = filter_position_rows(pd.read_csv(input_file, encoding='utf-8'), position_code)
     
     print(f"開始按球員姓名分割檔案並儲存至: {output_dir}")
     for player, g in df.groupby("player_name", dropna=False):
@@ -0,0 +1,242 @@
+# 檔案位置: src/data/step_08_incremental_ingest.py
+# 每日增量匯入：只處理新進的 Statcast 擊球，不必重跑 step_00 ~ step_02
+
+import sys
+import json
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+# 將專案根目錄加到 Python 的搜尋路徑中
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(PROJECT_ROOT))
+
+from config import RAW_DATA_DIR, PROCESSED_DATA_DIR, INPUTS_DATA_DIR, RESULTS_DIR
+from src.utils.feature_engineering import (
+    calculate_batted_ball_features,
+    add_fielder_features,
+    convert_positioning_to_xy,
+    make_ball_id,
+    BALL_KEY_COLS, COL_PLAYER_NAME
+)
+from src.utils.player_registry import get_player_registry
+from src.data.step_01_split_player_data import filter_position_rows
+
+# --- 1. 設定 ---
+# 已匯入擊球 ID 的索引，依 game_pk 分區，每個分區是一個排序過的 int64 .npy 檔
+BALL_ID_INDEX_DIR = PROCESSED_DATA_DIR / "ingested_ball_ids"
+# 每個分區涵蓋的 game_pk 範圍；一天的比賽只會碰到少數幾個分區
+GAME_PK_PARTITION_SIZE = 1000
+
+BATTER_OUTPUT_DIR = INPUTS_DATA_DIR / "batter_spray_charts"
+OPTIMIZATIONS_DIR = RESULTS_DIR / "optimizations"
+
+# 各守備位置在 Statcast 中對應的守備員 ID 欄位
+FIELDER_ID_COLS = {"LF": "fielder_7", "CF": "fielder_8", "RF": "fielder_9"}
+COL_FIELDER_ID = "fielder_id"
+COL_FIELDER_NAME = "name_fielder"
+COL_BATTER_ID = "batter"
+
+# --- 2. 擊球 ID 索引 ---
+def _partition_path(partition: int) -> Path:
+    return BALL_ID_INDEX_DIR / f"{partition}.npy"
+
+def load_seen_ball_ids(ball_ids: np.ndarray) -> np.ndarray:
+    """只載入與這批 ball_ids 相關的分區，回傳已匯入過的 ID (排序後)。"""
+    partitions = np.unique(ball_ids // 100_000 // GAME_PK_PARTITION_SIZE)
+    seen = [np.load(_partition_path(p)) for p in partitions if _partition_path(p).exists()]
+    return np.concatenate(seen) if seen else np.array([], dtype=np.int64)
+
+def record_ball_ids(ball_ids: np.ndarray):
+    """把新匯入的 ID 合併進對應分區 (只改寫受影響的分區)。"""
+    BALL_ID_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    partitions = ball_ids // 100_000 // GAME_PK_PARTITION_SIZE
+    for p in np.unique(partitions):
+        path = _partition_path(p)
+        new_ids = ball_ids[partitions == p]
+        if path.exists():
+            new_ids = np.concatenate([np.load(path), new_ids])
+        np.save(path, np.unique(new_ids))
+
+def rebuild_ball_id_index():
+    """
+    一次性地從現有的打者檔案重建擊球 ID 索引。
+    只有在第一次使用增量匯入 (索引尚不存在) 時需要執行。
+    """
+    print(f"  - 正在從 {BATTER_OUTPUT_DIR} 重建擊球 ID 索引...")
+    all_ids = []
+    for f in BATTER_OUTPUT_DIR.glob("*.csv"):
+        df = pd.read_csv(f, usecols=lambda c: c in BALL_KEY_COLS, encoding='utf-8')
+        if all(c in df.columns for c in BALL_KEY_COLS):
+            ids = make_ball_id(df)
+            all_ids.append(ids[ids >= 0])
+    if all_ids:
+        record_ball_ids(np.concatenate(all_ids))
+    print(f"  - 索引重建完成，共 {sum(len(a) for a in all_ids)} 筆擊球。")
+
+# --- 3. 輔助函式 ---
+def _append_rows(df_new: pd.DataFrame, out_path: Path) -> int:
+    """
+    將新資料附加到既有 CSV 尾端，欄位順序對齊既有檔頭；檔案不存在時直接建立。
+    檔案中已有的擊球 (依 BALL_KEY_COLS) 不會重複附加，因此中途失敗後重新匯入是安全的。
+
+    Returns:
+        int: 實際附加的筆數。
+    """
+    if out_path.exists():
+        existing_cols = pd.read_csv(out_path, nrows=0, encoding='utf-8').columns
+        if all(c in existing_cols for c in BALL_KEY_COLS):
+            existing = pd.read_csv(out_path, usecols=BALL_KEY_COLS, encoding='utf-8')
+            df_new = df_new[~np.isin(make_ball_id(df_new), make_ball_id(existing))]
+        if df_new.empty:
+            return 0
+        df_new.reindex(columns=existing_cols).to_csv(out_path, mode='a', header=False, index=False, encoding='utf-8')
+    else:
+        df_new.to_csv(out_path, index=False, encoding='utf-8')
+    return len(df_new)
+
+def _load_fielder_positioning(position_code: str) -> pd.DataFrame:
+    positioning_file = RAW_DATA_DIR / f"{position_code}_positioning.csv"
+    if not positioning_file.exists():
+        print(f"[警告] 找不到站位檔案: {positioning_file}。守備員相關特徵將為空。")
+        return pd.DataFrame()
+    return convert_positioning_to_xy(pd.read_csv(positioning_file, encoding='utf-8'))
+
+def find_stale_matchups(affected_batters, affected_batter_ids=()) -> list:
+    """
+    列出打者資料有變動、因此快取的最佳站位已過期的對戰組合。
+    結果檔名以打者 ID 開頭 (見 player_registry.matchup_stem)；舊的姓名命名檔案也一併比對。
+    """
+    if not OPTIMIZATIONS_DIR.exists():
+        return []
+    affected = {str(int(i)) for i in affected_batter_ids}
+    affected |= {b.replace(" ", "_").replace(",", "") for b in affected_batters}
+    stale = []
+    for f in sorted(OPTIMIZATIONS_DIR.glob("*_optimal.json")):
+        batter_str = f.name.split("_vs_", 1)[0]
+        if batter_str in affected:
+            stale.append(f.name)
+    return stale
+
+# --- 4. 主程式 ---
+def ingest_new_games(input_files: list) -> dict:
+    """
+    讀取新的 Statcast 原始資料 (打者視角，player_name 為打者)，
+    以 (game_pk, at_bat_number, pitch_number) 去重後，
+    只附加到受影響的打者與守備員分割檔，並只對新資料計算衍生特徵。
+
+    Returns:
+        dict: 新增筆數、受影響的打者/守備員，以及已過期的最佳化結果檔名。
+    """
+    print("==========================================")
+    print("開始執行增量資料匯入...")
+    print("==========================================")
+
+    summary = {"new_rows": 0, "affected_batters": [], "affected_fielders": {}, "stale_matchups": []}
+
+    df_list = []
+    for file_path in map(Path, input_files):
+        if not file_path.exists():
+            print(f"⚠️ [警告] 找不到輸入檔案: {file_path}，已跳過。")
+            continue
+        print(f"  - 正在讀取: {file_path.name}")
+        df_list.append(pd.read_csv(file_path, encoding='utf-8'))
+    if not df_list:
+        print("❌ [錯誤] 沒有成功讀取到任何新資料檔案。")
+        return summary
+    df = pd.concat(df_list, ignore_index=True)
+
+    missing = [c for c in BALL_KEY_COLS + [COL_PLAYER_NAME] if c not in df.columns]
+    if missing:
+        print(f"❌ [錯誤] 新資料缺少必要欄位: {missing}")
+        return summary
+
+    # 1. 篩選外野擊球 (與 step_01 相同的條件) 並去除無鍵值的列
+    df = filter_position_rows(df)
+    ball_ids = make_ball_id(df)
+    df = df[ball_ids >= 0]
+    ball_ids = ball_ids[ball_ids >= 0]
+
+    # 2. 去重：先去除新資料內部重複，再排除已匯入過的擊球
+    if not BALL_ID_INDEX_DIR.exists():
+        rebuild_ball_id_index()
+    _, first_idx = np.unique(ball_ids, return_index=True)
+    keep = np.zeros(len(df), dtype=bool)
+    keep[first_idx] = True
+    keep &= ~np.isin(ball_ids, load_seen_ball_ids(ball_ids))
+    df_new = df[keep]
+    new_ids = ball_ids[keep]
+    print(f"  - 共 {len(df)} 筆外野擊球，其中 {len(df_new)} 筆為新資料。")
+    if df_new.empty:
+        return summary
+
+    # 3. 更新受影響的打者分割檔：已知打者依 ID 找到既有檔案，新打者沿用 step_00 的命名
+    BATTER_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    registry = get_player_registry()
+    affected_batters = []
+    group_col = COL_BATTER_ID if COL_BATTER_ID in df_new.columns else COL_PLAYER_NAME
+    for batter_key, g in df_new.groupby(group_col):
+        batter_name = g[COL_PLAYER_NAME].iloc[0]
+        if group_col == COL_BATTER_ID and int(batter_key) in registry and str(registry.batter_files[registry.row_of(int(batter_key))]):
+            out_path = registry.batter_file(int(batter_key))
+        else:
+            safe_name = str(batter_name).replace("/", "_").replace("\\", "_")
+            out_path = BATTER_OUTPUT_DIR / f"{safe_name}.csv"
+        _append_rows(g, out_path)
+        affected_batters.append(batter_name)
+    print(f"  - 已更新 {len(affected_batters)} 位打者的資料。")
+
+    # 4. 更新受影響的守備員分割檔，並只對新資料計算特徵 (同 step_01/02 的命名)
+    for pos_code, id_col in FIELDER_ID_COLS.items():
+        if id_col not in df_new.columns:
+            continue
+        df_pos_xy = _load_fielder_positioning(pos_code)
+        if df_pos_xy.empty:
+            continue
+        id_to_name = df_pos_xy.drop_duplicates(COL_FIELDER_ID).set_index(COL_FIELDER_ID)[COL_FIELDER_NAME]
+        # 只附加打向這個位置的擊球 (同 step_01 的分割檔)
+        df_hit = filter_position_rows(df_new, pos_code)
+        fielder_names = df_hit[id_col].map(id_to_name)
+        unknown = fielder_names.isna().sum()
+        if unknown:
+            print(f"  - [警告] {pos_code}: 有 {unknown} 筆擊球的守備員不在站位檔案中，已略過。")
+
+        original_dir = PROCESSED_DATA_DIR / f"{pos_code}_original_data"
+        modified_dir = PROCESSED_DATA_DIR / f"{pos_code}_modified_data"
+        original_dir.mkdir(parents=True, exist_ok=True)
+        modified_dir.mkdir(parents=True, exist_ok=True)
+
+        affected_fielders = []
+        for fielder_name, g in df_hit.assign(**{COL_PLAYER_NAME: fielder_names}).dropna(subset=[COL_PLAYER_NAME]).groupby(COL_PLAYER_NAME):
+            base = fielder_name.replace(" ", "_").replace(".", "")
+            _append_rows(g, original_dir / f"{base}_{pos_code}.csv")
+            df_final = add_fielder_features(calculate_batted_ball_features(g), df_pos_xy)
+            _append_rows(df_final, modified_dir / f"{base}_{pos_code}_with_all.csv")
+            affected_fielders.append(fielder_name)
+        summary["affected_fielders"][pos_code] = affected_fielders
+        print(f"  - {pos_code}: 已更新 {len(affected_fielders)} 位守備員的資料與特徵。")
+
+    # 5. 所有分割檔寫入成功後，才把新的擊球 ID 記入索引。
+    #    若在此之前中斷，重新匯入時這些擊球仍視為新資料，但 _append_rows 會略過各分割檔中已存在的列
+    record_ball_ids(new_ids)
+
+    # 6. 列出需要重新最佳化的對戰組合
+    affected_ids = df_new[COL_BATTER_ID].dropna().unique() if COL_BATTER_ID in df_new.columns else []
+    stale = find_stale_matchups(affected_batters, affected_ids)
+    summary.update(new_rows=len(df_new), affected_batters=affected_batters, stale_matchups=stale)
+    if stale:
+        print(f"\n  - 以下 {len(stale)} 個最佳站位結果已過期，建議重新執行 --optimize:")
+        for name in stale:
+            print(f"    * {name}")
+    if any(summary["affected_fielders"].values()):
+        print("  - 守備員資料已更新；若要讓新資料反映在模型中，請重新執行 --train。")
+
+    print(f"\n--- ✅ 增量匯入完成，共新增 {len(df_new)} 筆擊球 ---")
+    return summary
+
+# 讓這個腳本可以直接被執行
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python src/data/step_08_incremental_ingest.py <新資料.csv> [...]")
+    else:
+        print(json.dumps(ingest_new_games(sys.argv[1:]), indent=2, ensure_ascii=False))
@@ -1,105 +1,151 @@
 # 檔案位置: src/evaluation/step_07_compare_initial_vs_optimal.py
 # (✨ 已更新：會計算並回傳「實際接殺球數」以及「最佳 vs 實際」的差異)
 
+import os
+import time
 import pandas as pd
 import numpy as np
 import json
 from pathlib import Path
-import joblib
+from concurrent.futures import ProcessPoolExecutor
 
 # --- 導入我們在專案中已經建立好的工具 ---
-from config import INPUTS_DATA_DIR, RESULTS_DIR, MODELS_DIR, RAW_DATA_DIR # 導入 RAW_DATA_DIR
+from config import RESULTS_DIR
 from src.utils.feature_engineering import (
-    calculate_batted_ball_features, convert_positioning_to_xy,
-    COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME, COL_PLAYER_NAME,
-    COL_FIELDER_NAME, COL_FIELDER_X, COL_FIELDER_Y
-)
-from src.optimization.step_04_find_optimal_position import (
-    load_model_scaler_and_params, load_player_params,
-    predict_catch_probability_scaled
+    calculate_batted_ball_features, filter_by_situation,
+    COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME, COL_PLAYER_NAME
 )
+from src.optimization.step_04_find_optimal_position import build_team_kernel, solve_team_positions
+from src.utils.catch_kernel import TeamCatchKernel, POSITION_CODES
+from src.utils.data_plane import DataPlane, publish_ball_arrays
+# 初始站位改由球員註冊表提供 (與 step_05 共用同一份實作)
+from src.utils.player_registry import load_initial_positions, batter_file_path, optimization_result_path, matchup_stem
 
-# --- 1. 輔助函式：載入球員的「初始」站位 ---
-# (此函式維持不變)
-def load_initial_positions(fielder_names: dict) -> dict:
-    """
-    從 positioning.csv 檔案中讀取指定球員的平均站位，並轉換為 XY 座標。
-    """
-    initial_positions = {}
-    for pos_code, player_name in fielder_names.items():
-        positioning_file = RAW_DATA_DIR / f"{pos_code}_positioning.csv"
-        if not positioning_file.exists():
-            raise FileNotFoundError(f"找不到初始站位檔案: {positioning_file}")
-            
-        df_pos_original = pd.read_csv(positioning_file, encoding='utf-8')
-        df_pos_xy = convert_positioning_to_xy(df_pos_original)
-        
-        player_pos_data = df_pos_xy[df_pos_xy[COL_FIELDER_NAME] == player_name]
-        
-        if player_pos_data.empty:
-            print(f"[警告] 在 {positioning_file.name} 中找不到球員 '{player_name}' 的初始站位。將使用該位置的平均站位。")
-            avg_x = df_pos_xy[COL_FIELDER_X].mean()
-            avg_y = df_pos_xy[COL_FIELDER_Y].mean()
-            if pd.isna(avg_x) or pd.isna(avg_y):
-                 avg_x, avg_y = {'LF': (-150, 220), 'CF': (0, 250), 'RF': (150, 220)}.get(pos_code, (0,0))
-            initial_positions[pos_code] = [avg_x, avg_y]
-        else:
-            initial_positions[pos_code] = [
-                player_pos_data.iloc[0][COL_FIELDER_X],
-                player_pos_data.iloc[0][COL_FIELDER_Y]
-            ]
-    return initial_positions
-
-# --- 2. 輔助函式：計算給定站位下的團隊表現 ---
-# (此函式維持不變)
-def calculate_team_performance(positions: dict, batter_df: pd.DataFrame, scalers: dict, player_params: dict, fielder_names: dict) -> tuple:
+# --- 0. 常數定義區 ---
+BOOTSTRAP_DIR = RESULTS_DIR / "bootstrap"
+BOOTSTRAP_REPLICATES = 2000          # 重新計分 (站位固定) 的重抽樣次數
+BOOTSTRAP_REOPT_REPLICATES = 200     # 重新最佳化的重抽樣次數 (每次都要解一次最佳化)
+BOOTSTRAP_CI_LEVEL = 0.95
+BOOTSTRAP_SEED = 42
+# 索引矩陣每塊最多的 (重抽樣 × 擊球) 元素數，控制記憶體用量
+BOOTSTRAP_CHUNK_ELEMENTS = 4_000_000
+BOOTSTRAP_OPT_MODE = "polar"
+
+# --- 1. 輔助函式：計算給定站位下的團隊表現 ---
+def calculate_team_performance(positions: dict, kernel: TeamCatchKernel) -> tuple:
     """
     計算在給定站位下，團隊的總接殺分數和平均接殺機率。
     """
-    lf_x, lf_y = positions['LF']
-    cf_x, cf_y = positions['CF']
-    rf_x, rf_y = positions['RF']
-
-    ball_x = batter_df[COL_X_COORD].to_numpy()
-    ball_y = batter_df[COL_Y_COORD].to_numpy()
-    flight_time_raw = batter_df[COL_FLIGHT_TIME].to_numpy()
-
-    # 計算原始距離
-    dist_lf_raw = np.sqrt((ball_x - lf_x)**2 + (ball_y - lf_y)**2)
-    dist_cf_raw = np.sqrt((ball_x - cf_x)**2 + (ball_y - cf_y)**2)
-    dist_rf_raw = np.sqrt((ball_x - rf_x)**2 + (ball_y - rf_y)**2)
-    
-    # 應用標準化
-    features_lf = np.stack([dist_lf_raw, flight_time_raw], axis=1)
-    features_cf = np.stack([dist_cf_raw, flight_time_raw], axis=1)
-    features_rf = np.stack([dist_rf_raw, flight_time_raw], axis=1)
-    
-    scaled_features_lf = scalers["LF"].transform(features_lf)
-    scaled_features_cf = scalers["CF"].transform(features_cf)
-    scaled_features_rf = scalers["RF"].transform(features_rf)
-
-    dist_lf_scaled, time_lf_scaled = scaled_features_lf[:, 0], scaled_features_lf[:, 1]
-    dist_cf_scaled, time_cf_scaled = scaled_features_cf[:, 0], scaled_features_cf[:, 1]
-    dist_rf_scaled, time_rf_scaled = scaled_features_rf[:, 0], scaled_features_rf[:, 1]
-
-    # 預測個人機率
-    prob_lf = predict_catch_probability_scaled(dist_lf_scaled, time_lf_scaled, player_params["LF"])
-    prob_cf = predict_catch_probability_scaled(dist_cf_scaled, time_cf_scaled, player_params["CF"])
-    prob_rf = predict_catch_probability_scaled(dist_rf_scaled, time_rf_scaled, player_params["RF"])
-
-    # 計算團隊機率
-    prob_team_per_ball = 1 - (1 - prob_lf) * (1 - prob_cf) * (1 - prob_rf)
+    prob_team_per_ball = kernel.team_probabilities(positions)
     
     total_score = np.sum(prob_team_per_ball)
     avg_prob = np.mean(prob_team_per_ball) * 100
     
     return total_score, avg_prob
 
-# --- 3. 主流程函式 (返回一個結果字典) ---
-def compare_initial_vs_optimal(batter_name: str, fielder_names: dict) -> dict:
+# --- 1b. 自助法 (bootstrap) 信賴區間 ---
+def _interval(samples: np.ndarray, estimate: float, level: float) -> dict:
+    """百分位數信賴區間。"""
+    lower, upper = np.nanpercentile(samples, [(1 - level) / 2 * 100, (1 + level) / 2 * 100], axis=0)
+    return {"estimate": estimate, "lower": lower.tolist() if np.ndim(lower) else float(lower),
+            "upper": upper.tolist() if np.ndim(upper) else float(upper),
+            "std": np.nanstd(samples, axis=0).tolist() if np.ndim(lower) else float(np.nanstd(samples))}
+
+def _bootstrap_index_blocks(n_balls: int, n_replicates: int, rng: np.random.Generator):
+    """逐塊產生 (重抽樣數, 擊球數) 的重抽樣索引矩陣，每塊不超過 BOOTSTRAP_CHUNK_ELEMENTS 個元素。"""
+    rows = max(BOOTSTRAP_CHUNK_ELEMENTS // max(n_balls, 1), 1)
+    for start in range(0, n_replicates, rows):
+        yield rng.integers(0, n_balls, size=(min(rows, n_replicates - start), n_balls), dtype=np.int32)
+
+def _reoptimize_block(task: tuple) -> tuple:
+    """
+    行程池工作：對資料平面上重抽樣索引矩陣的 [r0, r1) 列，逐一以重抽樣的擊球重新最佳化，
+    回傳 (站位 (k, 6), 期望出局數 (k,))。
+    """
+    plane, r0, r1, coefs, x0 = task
+    ball_x, ball_y, flight_time = plane["ball_x"], plane["ball_y"], plane["flight_time"]
+    index_block = plane["resample_index"][r0:r1]
+    positions = np.full((r1 - r0, 6), np.nan)
+    scores = np.full(r1 - r0, np.nan)
+    for r, idx in enumerate(index_block):
+        kernel = TeamCatchKernel(ball_x[idx], ball_y[idx], flight_time[idx], coefs)
+        xy, result = solve_team_positions(kernel, BOOTSTRAP_OPT_MODE, initial_guess=x0)
+        if result.success:
+            positions[r] = xy
+            scores[r] = kernel.expected_catches(xy)
+    return positions, scores
+
+def bootstrap_alignment_gain(kernel: TeamCatchKernel, initial_positions: dict, optimal_positions: dict,
+                             n_replicates: int = None, reoptimize: bool = False, n_reopt: int = None,
+                             level: float = None, seed: int = None, workers: int = None) -> dict:
+    """
+    以自助法估計「最佳 - 初始」期望出局數差距的信賴區間。
+
+    站位固定時，每顆球的團隊接殺機率只需算一次；每個重抽樣就是索引矩陣對機率向量的加總，
+    整批以向量化完成。reoptimize=True 時，另外對 n_reopt 個重抽樣重新最佳化
+    (起點為原本的最佳站位)，由行程池分塊執行，得到最佳站位座標與「重新最佳化後增益」的區間。
+
+    Returns:
+        dict: {"n_replicates", "level", "initial_score", "optimal_score", "score_diff_vs_initial",
+               ["reoptimized": {"n_replicates", "gain", "positions" {"LF": {"x", "y"}, ...}}]}，
+              各項為 {"estimate", "lower", "upper", "std"}。
+    """
+    n_replicates = n_replicates or BOOTSTRAP_REPLICATES
+    level = level or BOOTSTRAP_CI_LEVEL
+    rng = np.random.default_rng(BOOTSTRAP_SEED if seed is None else seed)
+    p_initial = kernel.team_probabilities(initial_positions).copy()
+    p_optimal = kernel.team_probabilities(optimal_positions).copy()
+    initial_scores, optimal_scores = [], []
+    for block in _bootstrap_index_blocks(kernel.n_balls, n_replicates, rng):
+        initial_scores.append(p_initial[block].sum(axis=1))
+        optimal_scores.append(p_optimal[block].sum(axis=1))
+    initial_scores, optimal_scores = np.concatenate(initial_scores), np.concatenate(optimal_scores)
+    result = {
+        "n_replicates": n_replicates, "level": level,
+        "initial_score": _interval(initial_scores, float(p_initial.sum()), level),
+        "optimal_score": _interval(optimal_scores, float(p_optimal.sum()), level),
+        "score_diff_vs_initial": _interval(optimal_scores - initial_scores, float(p_optimal.sum() - p_initial.sum()), level),
+    }
+    if not reoptimize:
+        return result
+
+    n_reopt = n_reopt or BOOTSTRAP_REOPT_REPLICATES
+    x0 = np.array([c for p in POSITION_CODES for c in optimal_positions[p]], dtype=float)
+    index = rng.integers(0, kernel.n_balls, size=(n_reopt, kernel.n_balls), dtype=np.int32)
+    workers = min(workers or os.cpu_count() or 1, n_reopt)
+    bounds = np.linspace(0, n_reopt, (workers * 4 if workers > 1 else 1) + 1).astype(int)
+    if workers > 1:
+        # 擊球陣列與索引矩陣只寫一次到共享記憶體，子行程依列區間讀取
+        with DataPlane.create("bootstrap") as plane, ProcessPoolExecutor(max_workers=workers) as pool:
+            publish_ball_arrays(plane, kernel.ball_x, kernel.ball_y, kernel.flight_time, resample_index=index)
+            tasks = [(plane, r0, r1, kernel.coefs, x0) for r0, r1 in zip(bounds[:-1], bounds[1:]) if r1 > r0]
+            blocks = list(pool.map(_reoptimize_block, tasks))
+    else:
+        local = {"ball_x": kernel.ball_x, "ball_y": kernel.ball_y, "flight_time": kernel.flight_time,
+                 "resample_index": index}
+        blocks = [_reoptimize_block((local, 0, n_reopt, kernel.coefs, x0))]
+    positions = np.concatenate([b[0] for b in blocks])
+    reopt_scores = np.concatenate([b[1] for b in blocks])
+    initial_reopt = p_initial[index].sum(axis=1)
+    result["reoptimized"] = {
+        "n_replicates": n_reopt,
+        "n_failed": int(np.isnan(reopt_scores).sum()),
+        "gain": _interval(reopt_scores - initial_reopt, result["score_diff_vs_initial"]["estimate"], level),
+        "positions": {p: {axis: _interval(positions[:, 2 * k + a], float(x0[2 * k + a]), level)
+                          for a, axis in enumerate(("x", "y"))}
+                      for k, p in enumerate(POSITION_CODES)},
+    }
+    return result
+
+# --- 2. 主流程函式 (返回一個結果字典) ---
+def compare_initial_vs_optimal(batter_name: str, fielder_names: dict, situation: dict = None,
+                               bootstrap: int = 0, reoptimize: bool = False, workers: int = None) -> dict:
     """
     比較初始站位和最佳站位下的團隊接殺表現。
     [修改] 此版本返回一個包含結果的字典，而不是列印它們。
+    指定 situation 時，只評估符合該比賽情境的擊球 (最佳站位仍讀取全樣本的結果檔)。
+    bootstrap > 0 時，另外以該次數的自助法估計增益的信賴區間 (見 bootstrap_alignment_gain)，
+    結果放在 results["bootstrap"]，並另存於 BOOTSTRAP_DIR。
     """
     print("=== 開始比較初始站位 vs. 最佳站位的團隊表現 ===")
     print(f"打者: {batter_name}")
@@ -109,6 +155,7 @@ def compare_initial_vs_optimal(batter_name: str, fielder_names: dict) -> dict:
     results = {
         "batter": batter_name,
         "fielders": fielder_names,
+        "situation": situation or {},
         "num_batted_balls": 0,
         "actual_catches": "N/A", # <-- 【新功能】新增欄位
         "initial": {},
@@ -121,27 +168,17 @@ def compare_initial_vs_optimal(batter_name: str, fielder_names: dict) -> dict:
     try:
         # 1. 載入打者原始數據
         # (路徑來自您上傳的程式碼)
-        batter_file = INPUTS_DATA_DIR / "batter_spray_charts" / f"{batter_name}.csv"
-        batter_df_raw = pd.read_csv(batter_file, encoding='utf-8')
+        batter_file = batter_file_path(batter_name)
+        batter_df_raw = filter_by_situation(pd.read_csv(batter_file, encoding='utf-8'), situation)
         
         # 2. 載入「最佳」站位座標
-        team_str = f"LF_{fielder_names['LF']}_CF_{fielder_names['CF']}_RF_{fielder_names['RF']}".replace(" ", "_").replace(",", "")
-        batter_str = batter_name.replace(" ", "_").replace(",", "")
-        positions_filename = f"{batter_str}_vs_{team_str}_optimal.json"
-        positions_file = RESULTS_DIR / "optimizations" / positions_filename
+        positions_file = optimization_result_path(batter_name, fielder_names)
         with open(positions_file, 'r') as f:
             optimal_positions = json.load(f)
             
         # 3. 載入「初始」站位座標
         initial_positions = load_initial_positions(fielder_names)
 
-        # 4. 載入 Scalers 和 個人化模型參數
-        scalers = {}
-        player_params = {}
-        for pos_code in ["LF", "CF", "RF"]:
-            scalers[pos_code], params_all = load_model_scaler_and_params(pos_code)
-            player_params[pos_code] = load_player_params(params_all, fielder_names[pos_code])
-
         print("  - 所有必要資料載入成功。")
         
     except (FileNotFoundError, ValueError, KeyError) as e:
@@ -159,6 +196,13 @@ def compare_initial_vs_optimal(batter_name: str, fielder_names: dict) -> dict:
     results["num_batted_balls"] = num_batted_balls # ✨ [新增] 儲存擊球總數
     print(f"  - 處理完成，共 {num_batted_balls} 筆有效擊球數據。")
 
+    # 建立與 step_04 共用的融合預測核心 (已包含 Scaler 與個人化模型參數)
+    try:
+        kernel = build_team_kernel(batter_df, fielder_names)
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        print(f"❌ [錯誤] 載入模型係數失敗: {e}")
+        return None
+
     # --- ▼▼▼ 【新功能】計算實際接殺球數 ▼▼▼ ---
     # 我們在這裡使用 batter_df_raw (原始資料) 來計算，
     # 這樣可以包含所有擊球，而不僅僅是模型能處理的球
@@ -177,9 +221,7 @@ def compare_initial_vs_optimal(batter_name: str, fielder_names: dict) -> dict:
     # --- 步驟 C: 計算兩種情境下的表現 ---
     print("\n--- 步驟 C: 計算表現指標 ---")
     # 1. 計算初始站位下的表現
-    initial_score, initial_avg_prob = calculate_team_performance(
-        initial_positions, batter_df, scalers, player_params, fielder_names
-    )
+    initial_score, initial_avg_prob = calculate_team_performance(initial_positions, kernel)
     # 儲存初始站位結果
     results["initial"] = {
         "positions": initial_positions,
@@ -189,9 +231,7 @@ def compare_initial_vs_optimal(batter_name: str, fielder_names: dict) -> dict:
     print("  - 初始站位表現計算完成。")
     
     # 2. 計算最佳站位下的表現
-    optimal_score, optimal_avg_prob = calculate_team_performance(
-        optimal_positions, batter_df, scalers, player_params, fielder_names
-    )
+    optimal_score, optimal_avg_prob = calculate_team_performance(optimal_positions, kernel)
     # 儲存最佳站位結果
     results["optimal"] = {
         "positions": optimal_positions,
@@ -221,6 +261,27 @@ def compare_initial_vs_optimal(batter_name: str, fielder_names: dict) -> dict:
         "prob_diff": prob_diff
     }
 
+    if bootstrap:
+        print(f"\n--- 步驟 E: 自助法信賴區間 ({bootstrap} 次重抽樣{'，含重新最佳化' if reoptimize else ''}) ---")
+        start = time.perf_counter()
+        boot = bootstrap_alignment_gain(kernel, initial_positions, optimal_positions, n_replicates=bootstrap,
+                                        reoptimize=reoptimize, workers=workers)
+        results["bootstrap"] = boot
+        diff = boot["score_diff_vs_initial"]
+        print(f"  - 最佳 vs 初始: {diff['estimate']:.2f} 球，{boot['level']:.0%} 信賴區間 [{diff['lower']:.2f}, {diff['upper']:.2f}]")
+        if "reoptimized" in boot:
+            gain = boot["reoptimized"]["gain"]
+            print(f"  - 重新最佳化後增益: {boot['level']:.0%} 信賴區間 [{gain['lower']:.2f}, {gain['upper']:.2f}]")
+            for pos_code, ci in boot["reoptimized"]["positions"].items():
+                print(f"  - {pos_code}: X [{ci['x']['lower']:.1f}, {ci['x']['upper']:.1f}], Y [{ci['y']['lower']:.1f}, {ci['y']['upper']:.1f}]")
+        print(f"  - 耗時 {time.perf_counter() - start:.2f} 秒。")
+        if not situation:
+            BOOTSTRAP_DIR.mkdir(parents=True, exist_ok=True)
+            output_path = BOOTSTRAP_DIR / f"{matchup_stem(batter_name, fielder_names)}_bootstrap.json"
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(boot, f, indent=2)
+            print(f"💾 信賴區間已儲存至: {output_path}")
+
     # 移除所有原本在終端機顯示結果的 print() 敘述
     
     print("=======================================================")
@@ -231,6 +292,98 @@ def compare_initial_vs_optimal(batter_name: str, fielder_names: dict) -> dict:
     return results
 
 
+# --- 3. 互動式 what-if 評估 ---
+class WhatIfSession:
+    """
+    在一次互動中常駐打者的擊球陣列與外野組合的融合係數，讓教練拖動單一守備員時即時重算團隊表現。
+    每位守備員的「漏接機率」向量 (1 - p_k) 各自快取；移動一人時只重算他的向量，
+    再與另外兩人的快取向量相乘得到團隊機率，不必重讀檔案或重算其他人。
+    """
+
+    def __init__(self, batter_name: str, fielder_names: dict, situation: dict = None, positions: dict = None):
+        """
+        Args:
+            positions (dict, optional): 起始站位 {"LF": [x, y], ...}；預設為最佳站位 (沒有時用初始站位)。
+        """
+        self.batter_name = batter_name
+        self.fielder_names = dict(fielder_names)
+        batter_df = calculate_batted_ball_features(
+            filter_by_situation(pd.read_csv(batter_file_path(batter_name), encoding='utf-8'), situation))
+        batter_df = batter_df.dropna(subset=[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME])
+        if batter_df.empty:
+            raise ValueError(f"打者 [{batter_name}] 沒有可用於評估的擊球數據。")
+        self.kernel = build_team_kernel(batter_df, fielder_names)
+        self.num_batted_balls = self.kernel.n_balls
+
+        self.reference = {}
+        optimal_path = optimization_result_path(batter_name, fielder_names)
+        if optimal_path.exists():
+            with open(optimal_path, 'r') as f:
+                self.reference["optimal"] = json.load(f)
+        try:
+            self.reference["initial"] = load_initial_positions(fielder_names)
+        except FileNotFoundError:
+            pass
+        start = positions or self.reference.get("optimal") or self.reference.get("initial")
+        if start is None:
+            raise FileNotFoundError("沒有最佳站位或初始站位可作為起點，請指定 positions。")
+        self.reference_scores = {name: float(calculate_team_performance(pos, self.kernel)[0])
+                                 for name, pos in self.reference.items()}
+
+        self.positions = {}
+        self._miss = np.empty((len(POSITION_CODES), self.num_batted_balls))
+        self._team = np.empty(self.num_batted_balls)
+        for pos_code in POSITION_CODES:
+            self._update_fielder(pos_code, start[pos_code])
+
+    def _update_fielder(self, pos_code: str, xy):
+        k = POSITION_CODES.index(pos_code)
+        self.kernel.single_fielder_probability(k, xy, out=self._miss[k])
+        np.subtract(1.0, self._miss[k], out=self._miss[k])
+        self.positions[pos_code] = [float(xy[0]), float(xy[1])]
+
+    def move(self, pos_code: str, xy) -> dict:
+        """把一位守備員移到 xy，只重算他的機率向量，回傳新的團隊表現 (見 score)。"""
+        if pos_code not in POSITION_CODES:
+            raise KeyError(f"未知的守備位置 '{pos_code}' (可用: {POSITION_CODES})")
+        start = time.perf_counter()
+        self._update_fielder(pos_code, xy)
+        result = self.score()
+        result["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+    def set_positions(self, positions: dict) -> dict:
+        """一次套用多位守備員的站位；只有座標真的改變的人會重算。"""
+        start = time.perf_counter()
+        for pos_code, xy in positions.items():
+            if list(map(float, xy)) != self.positions[pos_code]:
+                self._update_fielder(pos_code, xy)
+        result = self.score()
+        result["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+    def score(self) -> dict:
+        """
+        目前站位的團隊表現：{"positions", "score" (期望出局數), "avg_prob" (%),
+        "diff_vs_optimal", "diff_vs_initial" (沒有參考站位時為 None)}。
+        """
+        np.prod(self._miss, axis=0, out=self._team)
+        np.subtract(1.0, self._team, out=self._team)
+        score = float(np.sum(self._team))
+        return {
+            "positions": {p: list(xy) for p, xy in self.positions.items()},
+            "score": score,
+            "avg_prob": score / self.num_batted_balls * 100,
+            "diff_vs_optimal": score - self.reference_scores["optimal"] if "optimal" in self.reference_scores else None,
+            "diff_vs_initial": score - self.reference_scores["initial"] if "initial" in self.reference_scores else None,
+        }
+
+    def ball_probabilities(self) -> np.ndarray:
+        """目前站位下每顆球的團隊接殺機率 (複本)。"""
+        self.score()
+        return self._team.copy()
+
+
 if __name__ == "__main__":
     # 範例：請替換為您想分析的組合
     example_batter = "Kwan, Steven"
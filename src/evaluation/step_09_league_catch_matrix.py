@@ -0,0 +1,158 @@
+# 檔案位置: src/evaluation/step_09_league_catch_matrix.py
+# 全聯盟「守備員 × 打者 × 守備位置」期望接殺矩陣 (預設站位下)
+
+import json
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+from config import RESULTS_DIR
+from src.utils.feature_engineering import (
+    calculate_batted_ball_features,
+    COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME
+)
+from src.utils.player_registry import get_player_registry
+from src.utils.catch_kernel import COEF_INTERCEPT, COEF_DIST, COEF_TIME, LOGIT_CLIP, POSITION_CODES
+from src.optimization.step_04_find_optimal_position import load_fused_params
+
+# --- 1. 常數定義區 ---
+MATRIX_DIR = RESULTS_DIR / "league_matrix"
+MATRIX_FILE = "expected_catches.npy"
+INDEX_FILE = "index.json"
+# 每個向量化區塊最多處理的 (守備員 × 擊球) 元素數，控制記憶體用量
+CHUNK_ELEMENTS = 4_000_000
+
+# --- 2. 輔助函式 ---
+def load_all_batter_balls() -> tuple:
+    """
+    一次讀入所有打者的擊球並計算特徵。
+
+    Returns:
+        tuple: (打者名單, 每位打者的擊球起始位置 offsets (長度 = 打者數 + 1),
+                ball_x, ball_y, flight_time)，擊球依打者排列。
+    """
+    registry = get_player_registry()
+    batters, xs, ys, ts = [], [], [], []
+    for batter_name in registry.batter_names():
+        df = calculate_batted_ball_features(pd.read_csv(registry.batter_file(batter_name), encoding='utf-8'))
+        df = df.dropna(subset=[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME])
+        batters.append(batter_name)
+        xs.append(df[COL_X_COORD].to_numpy())
+        ys.append(df[COL_Y_COORD].to_numpy())
+        ts.append(df[COL_FLIGHT_TIME].to_numpy())
+    offsets = np.concatenate([[0], np.cumsum([len(x) for x in xs])]).astype(np.int64)
+    cat = lambda arrs: np.concatenate(arrs) if arrs else np.array([])
+    return batters, offsets, cat(xs), cat(ys), cat(ts)
+
+def _batter_chunks(offsets: np.ndarray, n_fielders: int):
+    """把連續的打者分成區塊，使每塊的 (守備員 × 擊球) 元素數不超過 CHUNK_ELEMENTS。"""
+    max_balls = max(CHUNK_ELEMENTS // max(n_fielders, 1), 1)
+    start = 0
+    n_batters = len(offsets) - 1
+    while start < n_batters:
+        end = start + 1
+        while end < n_batters and offsets[end + 1] - offsets[start] <= max_balls:
+            end += 1
+        yield start, end
+        start = end
+
+# --- 3. 主流程函式 ---
+def build_league_catch_matrix() -> Path:
+    """
+    計算每位外野手在其預設站位下、對每位打者所有擊球的個人期望接殺數，
+    寫入 (守備員, 打者, 守備位置) 的 float32 記憶體映射陣列，並另存名稱索引。
+    沒有該位置模型的守備員，對應格子為 NaN。
+    """
+    print("==========================================")
+    print("開始建立全聯盟期望接殺矩陣...")
+    print("==========================================")
+
+    batters, offsets, ball_x, ball_y, flight_time = load_all_batter_balls()
+    n_balls_per_batter = np.diff(offsets)
+    print(f"  - 已載入 {len(batters)} 位打者、共 {len(ball_x)} 筆有效擊球。")
+
+    fused = {}
+    for pos_code in POSITION_CODES:
+        try:
+            fused[pos_code] = load_fused_params(pos_code)
+        except FileNotFoundError as e:
+            print(f"  - [警告] {e}，{pos_code} 欄位將為 NaN。")
+    fielders = sorted({p for params in fused.values() for p in params['players']})
+    fielder_index = {name: i for i, name in enumerate(fielders)}
+    registry = get_player_registry()
+
+    MATRIX_DIR.mkdir(parents=True, exist_ok=True)
+    matrix = np.lib.format.open_memmap(MATRIX_DIR / MATRIX_FILE, mode='w+', dtype=np.float32,
+                                       shape=(len(fielders), len(batters), len(POSITION_CODES)))
+    matrix[:] = np.nan
+
+    for k, pos_code in enumerate(POSITION_CODES):
+        if pos_code not in fused:
+            continue
+        players = fused[pos_code]['players']
+        coefs = fused[pos_code]['coefs']
+        rows = np.array([fielder_index[p] for p in players])
+        fxy = registry.default_positions(players, pos_code)
+        print(f"  - {pos_code}: {len(players)} 位守備員，開始分塊計算...")
+
+        for b0, b1 in _batter_chunks(offsets, len(players)):
+            s, e = offsets[b0], offsets[b1]
+            if e == s:
+                matrix[rows, b0:b1, k] = 0.0
+                continue
+            # (守備員, 擊球) 的原始尺度 logit，一次向量化計算
+            dist = np.hypot(ball_x[None, s:e] - fxy[:, 0:1], ball_y[None, s:e] - fxy[:, 1:2])
+            logit = coefs[:, COEF_INTERCEPT, None] + coefs[:, COEF_DIST, None] * dist + coefs[:, COEF_TIME, None] * flight_time[None, s:e]
+            prob = 1 / (1 + np.exp(-np.clip(logit, -LOGIT_CLIP, LOGIT_CLIP)))
+            # 依打者邊界加總；沒有擊球的打者另外補 0
+            local = offsets[b0:b1] - s
+            has_balls = n_balls_per_batter[b0:b1] > 0
+            sums = np.zeros((len(players), b1 - b0))
+            sums[:, has_balls] = np.add.reduceat(prob, local[has_balls], axis=1)
+            matrix[rows, b0:b1, k] = sums
+
+    matrix.flush()
+    index = {"fielders": fielders, "batters": batters, "positions": POSITION_CODES,
+             "num_batted_balls": n_balls_per_batter.tolist()}
+    with open(MATRIX_DIR / INDEX_FILE, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+
+    print(f"\n💾 期望接殺矩陣 {matrix.shape} 已儲存至: {MATRIX_DIR}")
+    return MATRIX_DIR
+
+# --- 4. 查詢介面 ---
+class CatchExpectationMatrix:
+    """
+    以記憶體映射方式開啟期望接殺矩陣；名稱到索引都是字典查詢，
+    任何一格的查詢都是常數時間，且不會把整個矩陣讀進記憶體。
+    """
+
+    def __init__(self, matrix_dir: Path = MATRIX_DIR):
+        with open(matrix_dir / INDEX_FILE, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.fielders = index["fielders"]
+        self.batters = index["batters"]
+        self.positions = index["positions"]
+        self.num_batted_balls = index["num_batted_balls"]
+        self._fielder_idx = {name: i for i, name in enumerate(self.fielders)}
+        self._batter_idx = {name: i for i, name in enumerate(self.batters)}
+        self._position_idx = {code: i for i, code in enumerate(self.positions)}
+        self.values = np.load(matrix_dir / MATRIX_FILE, mmap_mode='r')
+
+    def lookup(self, fielder_name: str, batter_name: str, position_code: str) -> float:
+        """回傳該守備員在預設站位下，對該打者所有擊球的期望接殺數 (無模型時為 NaN)。"""
+        try:
+            return float(self.values[self._fielder_idx[fielder_name], self._batter_idx[batter_name], self._position_idx[position_code]])
+        except KeyError as e:
+            raise KeyError(f"在期望接殺矩陣中找不到: {e}")
+
+    def batter_table(self, batter_name: str) -> pd.DataFrame:
+        """回傳某位打者對所有守備員 × 位置的期望接殺數表格。"""
+        return pd.DataFrame(np.asarray(self.values[:, self._batter_idx[batter_name], :]),
+                            index=self.fielders, columns=self.positions)
+
+
+if __name__ == "__main__":
+    build_league_catch_matrix()
+    league = CatchExpectationMatrix()
+    print(league.lookup("Harris II, Michael", "Kwan, Steven", "CF"))
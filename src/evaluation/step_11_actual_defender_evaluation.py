@@ -0,0 +1,269 @@
+# 檔案位置: src/evaluation/step_11_actual_defender_evaluation.py
+# 實際守備員評估：依每筆擊球的 fielder_7/8/9 找出當時真正在場上的外野手，
+# 以他們的模型計算「預設站位」與「最佳站位」下的團隊期望接殺，再依比賽、球隊、球季彙總。
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from config import RESULTS_DIR, MODELS_DIR
+from src.utils.feature_engineering import (
+    calculate_batted_ball_features, COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME, COL_CAUGHT, COL_GAME_PK
+)
+from src.utils.catch_kernel import TeamCatchKernel, COEF_INTERCEPT, COEF_DIST, COEF_TIME, LOGIT_CLIP, POSITION_CODES
+from src.utils.player_registry import get_player_registry, optimization_result_path, FIELDER_ID_COLS, COL_BATTER_ID
+from src.utils.data_plane import DataPlane, publish_ball_arrays, ball_slice
+from src.optimization.step_04_find_optimal_position import load_fused_params, solve_team_positions
+
+# --- 1. 常數定義區 ---
+ACTUAL_DEFENSE_DIR = RESULTS_DIR / "actual_defense"
+OPTIMA_CACHE_FILE = "optima_cache.csv"
+BALLS_FILE = "balls.csv"
+# 彙總層級: 檔名 -> 分組欄位
+SUMMARY_LEVELS = {
+    "by_game.csv": ["game_year", COL_GAME_PK, "fielding_team"],
+    "by_team.csv": ["game_year", "fielding_team"],
+    "by_season.csv": ["game_year"],
+    "by_alignment.csv": ["game_year", "of_fielding_alignment"],
+}
+COL_SEASON = "game_year"
+COL_OF_ALIGNMENT = "of_fielding_alignment"
+CONTEXT_COLS = [COL_SEASON, COL_GAME_PK, "home_team", "away_team", "inning_topbot", COL_OF_ALIGNMENT]
+TRIO_COLS = [FIELDER_ID_COLS[p] for p in POSITION_CODES]
+OPTIMA_COLS = [f"{p.lower()}_{axis}" for p in POSITION_CODES for axis in ("x", "y")]
+ACTUAL_DEFENSE_OPT_MODE = "polar"
+
+# --- 2. 載入所有擊球 ---
+def load_league_balls(seasons: list = None) -> pd.DataFrame:
+    """
+    讀入整個打者資料庫的有效擊球 (有落點與飛行時間，且三位外野手 ID 齊全)，
+    只保留評估需要的欄位，並加上守備方球隊 (上半局為主隊守備)。
+    """
+    registry = get_player_registry()
+    frames = []
+    for batter_name in registry.batter_names():
+        df = calculate_batted_ball_features(pd.read_csv(registry.batter_file(batter_name), encoding='utf-8'))
+        if seasons:
+            df = df[df[COL_SEASON].isin(seasons)]
+        keep = [COL_BATTER_ID] + TRIO_COLS + [c for c in CONTEXT_COLS if c in df.columns] + \
+               [COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME, COL_CAUGHT]
+        frames.append(df[keep].dropna(subset=[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME] + TRIO_COLS))
+    balls = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    for col in [COL_BATTER_ID] + TRIO_COLS:
+        balls[col] = balls[col].astype(np.int64)
+    # 同一位打者的擊球必須連續排列，求解時才能以 [start, stop) 區間取用資料平面上的陣列
+    balls = balls.sort_values(COL_BATTER_ID, kind="stable").reset_index(drop=True)
+    balls["fielding_team"] = np.where(balls["inning_topbot"] == "Top", balls["home_team"], balls["away_team"])
+    if COL_OF_ALIGNMENT not in balls.columns:
+        balls[COL_OF_ALIGNMENT] = "Unknown"
+    balls[COL_OF_ALIGNMENT] = balls[COL_OF_ALIGNMENT].fillna("Unknown")
+    return balls
+
+def attach_fielder_models(balls: pd.DataFrame) -> tuple:
+    """
+    以註冊表把每筆擊球的 fielder_7/8/9 對應到融合係數與預設站位 (全部為陣列索引，無逐列迴圈)。
+
+    Returns:
+        tuple: (有模型的擊球 DataFrame, coefs (球數, 3, 3), default_xy (球數, 3, 2))；
+            任一位外野手沒有該位置模型的擊球會被剔除。
+    """
+    registry = get_player_registry()
+    n = len(balls)
+    model_rows = np.full((n, len(POSITION_CODES)), -1, dtype=np.int64)
+    registry_rows = np.full((n, len(POSITION_CODES)), -1, dtype=np.int64)
+    for k, col in enumerate(TRIO_COLS):
+        rows = registry.rows_of_ids(balls[col].to_numpy())
+        registry_rows[:, k] = rows
+        model_rows[:, k] = np.where(rows >= 0, registry.model_rows[np.maximum(rows, 0), k], -1)
+    covered = (model_rows >= 0).all(axis=1)
+    if not covered.all():
+        print(f"  - [警告] {int((~covered).sum())} 筆擊球的外野手沒有對應位置的模型，已略過。")
+    balls = balls[covered].reset_index(drop=True)
+    model_rows, registry_rows = model_rows[covered], registry_rows[covered]
+
+    coefs = np.empty((len(balls), len(POSITION_CODES), 3))
+    default_xy = np.empty((len(balls), len(POSITION_CODES), 2))
+    for k, pos_code in enumerate(POSITION_CODES):
+        coefs[:, k] = load_fused_params(pos_code)["coefs"][model_rows[:, k]]
+        default_xy[:, k] = registry.default_xy[registry_rows[:, k], k]
+    return balls, coefs, default_xy
+
+def team_probabilities(ball_x, ball_y, flight_time, coefs, positions) -> np.ndarray:
+    """
+    每顆球各自的外野組合與站位下的團隊接殺機率。
+    coefs 為 (球數, 3, 3)、positions 為 (球數, 3, 2)；一次向量化算完。
+    """
+    dist = np.hypot(ball_x[:, None] - positions[..., 0], ball_y[:, None] - positions[..., 1])
+    logit = coefs[..., COEF_INTERCEPT] + coefs[..., COEF_DIST] * dist + coefs[..., COEF_TIME] * flight_time[:, None]
+    miss = 1 / (1 + np.exp(np.clip(logit, -LOGIT_CLIP, LOGIT_CLIP)))
+    return 1 - np.prod(miss, axis=1)
+
+# --- 3. 每個 (打者, 實際外野組合) 的最佳站位 ---
+def _optima_signature() -> list:
+    """三個位置融合係數檔的修改時間；模型更新後，快取的最佳站位作廢。"""
+    return [os.path.getmtime(MODELS_DIR / p / f"{p}_fused_coefs.npz") for p in POSITION_CODES]
+
+def _load_optima_cache() -> pd.DataFrame:
+    path = ACTUAL_DEFENSE_DIR / OPTIMA_CACHE_FILE
+    meta_path = path.with_suffix(".json")
+    if path.exists() and meta_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f).get("signature") == _optima_signature():
+                return pd.read_csv(path, encoding='utf-8')
+    return pd.DataFrame(columns=[COL_BATTER_ID] + TRIO_COLS + OPTIMA_COLS)
+
+def _save_optima_cache(optima: pd.DataFrame):
+    ACTUAL_DEFENSE_DIR.mkdir(parents=True, exist_ok=True)
+    path = ACTUAL_DEFENSE_DIR / OPTIMA_CACHE_FILE
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    optima.to_csv(tmp, index=False, encoding='utf-8')
+    os.replace(tmp, path)
+    with open(path.with_suffix(".json"), 'w', encoding='utf-8') as f:
+        json.dump({"signature": _optima_signature()}, f)
+
+def _stored_optimum(batter_id: int, trio_ids) -> list:
+    """step_04 已存的最佳站位 (6 維)；沒有時回傳 None。"""
+    registry = get_player_registry()
+    try:
+        fielder_names = {p: registry.name_of(fid) for p, fid in zip(POSITION_CODES, trio_ids)}
+        path = optimization_result_path(registry.name_of(batter_id), fielder_names)
+    except KeyError:
+        return None
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        positions = json.load(f)
+    return [c for p in POSITION_CODES for c in positions[p]]
+
+def _solve_batter_optima(task: tuple) -> list:
+    """行程池工作：對一位打者的所有擊球 (資料平面上的 [start, stop) 區間)，依序解出每個外野組合的最佳站位。"""
+    plane, start, stop, trios = task
+    ball_x, ball_y, flight_time = ball_slice(plane, start, stop)
+    solved = []
+    for coefs, x0 in trios:
+        positions, result = solve_team_positions(TeamCatchKernel(ball_x, ball_y, flight_time, coefs),
+                                                 ACTUAL_DEFENSE_OPT_MODE, initial_guess=x0)
+        solved.append(positions.tolist() if result.success else [np.nan] * 6)
+    return solved
+
+def resolve_optima(balls: pd.DataFrame, coefs: np.ndarray, default_xy: np.ndarray,
+                   solve_missing: bool = True, workers: int = None) -> pd.DataFrame:
+    """
+    為資料中出現過的每個 (打者, 實際外野組合) 取得最佳站位：依序使用本步驟的快取、
+    step_04 已存的結果，其餘在打者「全部」擊球上以極座標模式求解 (與 step_04 的定義一致)，
+    起點為該組合的預設站位。求解以打者為單位分給多個行程。
+
+    Returns:
+        pd.DataFrame: batter, fielder_7/8/9, lf_x ... rf_y (無法求解時為 NaN)。
+    """
+    keys = [COL_BATTER_ID] + TRIO_COLS
+    groups = balls[keys].drop_duplicates().reset_index()   # index 欄位 = 該組合第一筆擊球的列號
+    cache = _load_optima_cache()
+    groups = groups.merge(cache, on=keys, how="left")
+    missing = groups[OPTIMA_COLS[0]].isna()
+    print(f"  - 共 {len(groups)} 個 (打者, 外野組合)，快取命中 {int((~missing).sum())} 個。")
+
+    for i in np.flatnonzero(missing.to_numpy()):
+        stored = _stored_optimum(groups.at[i, COL_BATTER_ID], groups.loc[i, TRIO_COLS].tolist())
+        if stored is not None:
+            groups.loc[i, OPTIMA_COLS] = stored
+    missing = groups[OPTIMA_COLS[0]].isna()
+
+    if solve_missing and missing.any():
+        print(f"  - 需要求解 {int(missing.sum())} 個組合的最佳站位...")
+        todo = groups[missing]
+        by_batter = {b: g for b, g in todo.groupby(COL_BATTER_ID)}
+        tasks, order = [], []
+        ball_rows = balls.groupby(COL_BATTER_ID).indices
+        workers = workers or os.cpu_count() or 1
+        with DataPlane.create("actual_defense") as plane:
+            # 擊球陣列只寫入資料平面一次，子行程以區間附加，不必序列化每位打者的陣列
+            publish_ball_arrays(plane, *(balls[c].to_numpy(dtype=float) for c in (COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME)))
+            for batter_id, g in by_batter.items():
+                rows = ball_rows[batter_id]
+                tasks.append((plane, int(rows[0]), int(rows[-1]) + 1,
+                              [(coefs[r], default_xy[r].ravel()) for r in g["index"].to_numpy()]))
+                order.append(g.index.to_numpy())
+            if workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(_solve_batter_optima, tasks, chunksize=max(len(tasks) // (workers * 4), 1)))
+            else:
+                results = [_solve_batter_optima(t) for t in tasks]
+        for idx, solved in zip(order, results):
+            groups.loc[idx, OPTIMA_COLS] = np.asarray(solved, dtype=float)
+        _save_optima_cache(pd.concat([cache, groups.loc[missing, keys + OPTIMA_COLS]], ignore_index=True)
+                           .drop_duplicates(subset=keys, keep="last"))
+    return groups.drop(columns=["index"])
+
+# --- 4. 主流程函式 ---
+def evaluate_actual_defenders(seasons: list = None, solve_missing: bool = True, workers: int = None) -> dict:
+    """
+    對整個打者資料庫的每顆擊球，以當時真正在場的外野手計算：
+      - expected_default: 三人都站在各自的預設 (平均) 站位時的團隊接殺機率
+        (Statcast 沒有逐球的守備員站位，以平均站位代表實際站位)
+      - expected_optimal: 三人站在此打者 × 此外野組合的最佳站位時的團隊接殺機率
+      - caught: 實際是否被接殺
+    並依比賽、球隊 (守備方)、球季與外野佈陣類型彙總，寫入 ACTUAL_DEFENSE_DIR。
+
+    Returns:
+        dict: {檔名: 彙總 DataFrame}，另含 "balls" (逐球結果)。
+    """
+    print("==========================================")
+    print("開始以實際在場的外野手評估所有擊球...")
+    print("==========================================")
+    balls = load_league_balls(seasons)
+    if balls.empty:
+        print("❌ [錯誤] 沒有可用於評估的擊球數據。")
+        return {}
+    print(f"  - 已載入 {len(balls)} 筆擊球 ({balls[COL_BATTER_ID].nunique()} 位打者)。")
+    balls, coefs, default_xy = attach_fielder_models(balls)
+
+    optima = resolve_optima(balls, coefs, default_xy, solve_missing=solve_missing, workers=workers)
+    optimal_xy = balls[[COL_BATTER_ID] + TRIO_COLS].merge(optima, on=[COL_BATTER_ID] + TRIO_COLS, how="left")[OPTIMA_COLS]
+    optimal_xy = optimal_xy.to_numpy(dtype=float).reshape(len(balls), len(POSITION_CODES), 2)
+
+    ball_x, ball_y, flight_time = (balls[c].to_numpy(dtype=float) for c in (COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME))
+    balls["expected_default"] = team_probabilities(ball_x, ball_y, flight_time, coefs, default_xy)
+    balls["expected_optimal"] = team_probabilities(ball_x, ball_y, flight_time, coefs, optimal_xy)
+    balls["has_optimum"] = ~np.isnan(balls["expected_optimal"].to_numpy())
+
+    ACTUAL_DEFENSE_DIR.mkdir(parents=True, exist_ok=True)
+    balls.to_csv(ACTUAL_DEFENSE_DIR / BALLS_FILE, index=False, encoding='utf-8')
+    outputs = {"balls": balls}
+    for file_name, group_cols in SUMMARY_LEVELS.items():
+        summary = summarize_actual_defense(balls, group_cols)
+        summary.to_csv(ACTUAL_DEFENSE_DIR / file_name, index=False, encoding='utf-8')
+        outputs[file_name] = summary
+
+    print("\n--- 各球季彙總 ---")
+    print(outputs["by_season.csv"].round(3).to_string(index=False))
+    print(f"\n💾 逐球結果與彙總表已儲存至: {ACTUAL_DEFENSE_DIR}")
+    return outputs
+
+def summarize_actual_defense(balls: pd.DataFrame, group_cols: list) -> pd.DataFrame:
+    """
+    依 group_cols 彙總：擊球數、實際接殺數、預設站位與最佳站位的期望接殺數，
+    以及最佳站位相對於預設站位 / 實際結果的差距。沒有最佳站位的擊球不計入最佳站位相關欄位。
+    """
+    with_opt = balls["has_optimum"]
+    summary = balls.assign(
+        expected_default_opt=balls["expected_default"].where(with_opt),
+        caught_opt=balls[COL_CAUGHT].where(with_opt),
+    ).groupby(group_cols, dropna=False).agg(
+        n_balls=(COL_CAUGHT, "size"),
+        actual_catches=(COL_CAUGHT, "sum"),
+        expected_default=("expected_default", "sum"),
+        n_balls_with_optimum=("has_optimum", "sum"),
+        expected_optimal=("expected_optimal", "sum"),
+        expected_default_opt=("expected_default_opt", "sum"),
+        actual_catches_opt=("caught_opt", "sum"),
+    ).reset_index()
+    summary["optimal_vs_default"] = summary["expected_optimal"] - summary["expected_default_opt"]
+    summary["optimal_vs_actual"] = summary["expected_optimal"] - summary["actual_catches_opt"]
+    return summary.drop(columns=["expected_default_opt", "actual_catches_opt"])
+
+
+if __name__ == "__main__":
+    evaluate_actual_defenders()
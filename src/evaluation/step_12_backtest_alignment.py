@@ -0,0 +1,220 @@
+# 檔案位置: src/evaluation/step_12_backtest_alignment.py
+# 時間切分回測：以每位打者較早的擊球最佳化站位，在之後的擊球上比較最佳站位與初始站位，
+# 量測站位建議的樣本外 (out-of-sample) 效益。
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from config import RESULTS_DIR
+from src.utils.feature_engineering import calculate_batted_ball_features, COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME
+from src.utils.catch_kernel import TeamCatchKernel, POSITION_CODES
+from src.utils.player_registry import get_player_registry, load_initial_positions, team_stem, BATTER_DIR
+from src.utils.data_plane import DataPlane, publish_ball_arrays, ball_slice
+from src.optimization.step_04_find_optimal_position import load_fused_params, load_fused_player_coefs, solve_team_positions
+
+# --- 1. 常數定義區 ---
+BACKTEST_DIR = RESULTS_DIR / "backtest"
+DATE_INDEX_DIR = BACKTEST_DIR / "date_index"
+COL_GAME_DATE = "game_date"
+TRAIN_FRACTION = 0.7        # 未指定切分日期時，每位打者依日期排序後前 70% 的擊球作為訓練窗
+MIN_TRAIN_BALLS = 30
+MIN_TEST_BALLS = 10
+BACKTEST_OPT_MODE = "polar"
+
+# --- 2. 預先計算的日期索引 ---
+def _batter_store_signature() -> list:
+    files = sorted(BATTER_DIR.glob("*.csv"))
+    return [len(files), max((int(f.stat().st_mtime) for f in files), default=0)]
+
+def build_date_index(rebuild: bool = False) -> DataPlane:
+    """
+    把所有打者的有效擊球 (落點、飛行時間、比賽日期) 依打者串接、打者內依日期排序，
+    存成可記憶體映射的資料平面 (DATE_INDEX_DIR 下的 .npy)；之後任何切分日期都只需對每位打者做一次
+    searchsorted，回測的子行程也直接以路徑附加同一份陣列。打者資料夾的檔案數或最新修改時間改變時自動重建。
+
+    Returns:
+        DataPlane: 陣列 "offsets" (打者數 + 1)、"ball_x"、"ball_y"、"flight_time"、"game_day" (1970 起算的日數)；
+            manifest 含 "batters" 與來源簽章。
+    """
+    plane = DataPlane(DATE_INDEX_DIR)
+    signature = _batter_store_signature()
+    if not rebuild and plane.read_manifest().get("signature") == signature:
+        return plane
+
+    print("  - 正在建立擊球日期索引...")
+    registry = get_player_registry()
+    batters, xs, ys, ts, days = [], [], [], [], []
+    for batter_name in registry.batter_names():
+        df = calculate_batted_ball_features(pd.read_csv(registry.batter_file(batter_name), encoding='utf-8'))
+        df = df.dropna(subset=[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME, COL_GAME_DATE])
+        day = pd.to_datetime(df[COL_GAME_DATE]).to_numpy(dtype="datetime64[D]").astype(np.int32)
+        order = np.argsort(day, kind="stable")
+        batters.append(batter_name)
+        xs.append(df[COL_X_COORD].to_numpy()[order])
+        ys.append(df[COL_Y_COORD].to_numpy()[order])
+        ts.append(df[COL_FLIGHT_TIME].to_numpy()[order])
+        days.append(day[order])
+    cat = lambda arrs, dtype: np.concatenate(arrs).astype(dtype) if arrs else np.array([], dtype=dtype)
+
+    DATE_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    plane.write_manifest({})   # 重建期間先清掉簽章，中斷時下次會重建
+    publish_ball_arrays(plane, cat(xs, float), cat(ys, float), cat(ts, float),
+                        offsets=np.concatenate([[0], np.cumsum([len(x) for x in xs])]).astype(np.int64),
+                        game_day=cat(days, np.int32))
+    plane.write_manifest({"signature": signature, "batters": batters})
+    print(f"  - 日期索引建立完成：{len(batters)} 位打者、{len(plane['ball_x'])} 筆擊球。")
+    return plane
+
+def split_points(index: DataPlane, split_date: str = None, train_fraction: float = None) -> np.ndarray:
+    """
+    每位打者訓練窗與測試窗的分界 (在串接陣列中的絕對位置)。
+    指定 split_date 時，該日 (含) 之後的擊球為測試窗；否則依每位打者自己的 train_fraction 分位日期切分，
+    同一天的擊球不會被拆到兩邊。
+    """
+    offsets, game_day = np.asarray(index["offsets"]), index["game_day"]
+    cuts = np.empty(len(offsets) - 1, dtype=np.int64)
+    cutoff_day = None if split_date is None else np.datetime64(split_date, "D").astype(np.int32)
+    fraction = train_fraction or TRAIN_FRACTION
+    for b, (s, e) in enumerate(zip(offsets[:-1], offsets[1:])):
+        days = game_day[s:e]
+        if cutoff_day is None:
+            if e == s:
+                cuts[b] = s
+                continue
+            day = days[min(int(np.floor(fraction * (e - s))), e - s - 1)]
+        else:
+            day = cutoff_day
+        cuts[b] = s + np.searchsorted(days, day, side="left")
+    return cuts
+
+# --- 3. 回測 ---
+def backtest_stem(fielder_names: dict, split_date: str = None, train_fraction: float = None) -> str:
+    """
+    回測結果的檔名主幹：外野三人組 (見 player_registry.team_stem) 加上切分方式，
+    例: LF_677951_CF_671739_RF_660670_split_2024-07-01 或 ..._frac_0.70。不同組合與切分的結果不會互相覆蓋。
+    """
+    split = f"split_{split_date}" if split_date else f"frac_{(train_fraction or TRAIN_FRACTION):.2f}"
+    return f"{team_stem(fielder_names)}_{split}"
+
+def _backtest_batters(task: tuple) -> list:
+    """行程池工作：對一批打者 (日期索引上的區間)，在訓練窗最佳化、在訓練窗與測試窗上計分。"""
+    index, batch, coefs, initial_xy = task
+    game_day = index["game_day"]
+    rows = []
+    for batter_name, start, cut, stop in batch:
+        train = TeamCatchKernel(*ball_slice(index, start, cut), coefs)
+        test = TeamCatchKernel(*ball_slice(index, cut, stop), coefs)
+        optimal_xy, result = solve_team_positions(train, BACKTEST_OPT_MODE, initial_guess=initial_xy)
+        first_test_day = game_day[cut]
+        row = {"batter": batter_name, "n_train": train.n_balls, "n_test": test.n_balls,
+               "test_start": str(np.datetime64(int(first_test_day), "D")), "converged": bool(result.success),
+               "train_initial": train.expected_catches(initial_xy), "train_optimal": train.expected_catches(optimal_xy),
+               "test_initial": test.expected_catches(initial_xy), "test_optimal": test.expected_catches(optimal_xy)}
+        row["train_gain"] = row["train_optimal"] - row["train_initial"]
+        row["test_gain"] = row["test_optimal"] - row["test_initial"]
+        row["test_gain_per_100"] = row["test_gain"] / test.n_balls * 100
+        rows.append(row)
+    return rows
+
+def run_alignment_backtest(fielder_names: dict, split_date: str = None, train_fraction: float = None,
+                           workers: int = None) -> pd.DataFrame:
+    """
+    對所有打者做時間切分回測：固定一組外野手，以訓練窗的擊球最佳化站位，
+    在測試窗上比較最佳站位與初始 (預設) 站位的團隊期望出局數。
+    訓練窗或測試窗球數不足 (MIN_TRAIN_BALLS / MIN_TEST_BALLS) 的打者略過。
+    各打者的結果與全聯盟彙總寫入 BACKTEST_DIR/{backtest_stem}_batters.csv 與 _summary.json。
+    最佳化未收斂的打者保留在各打者結果中 (converged=False)，但不計入彙總的增益。
+    """
+    print("==========================================")
+    print("開始時間切分回測 (訓練窗最佳化、測試窗評估)...")
+    print(f"  - LF: {fielder_names['LF']}, CF: {fielder_names['CF']}, RF: {fielder_names['RF']}")
+    print("==========================================")
+    try:
+        coefs = np.stack([load_fused_player_coefs(load_fused_params(p), fielder_names[p]) for p in POSITION_CODES])
+        initial = load_initial_positions(fielder_names)
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        print(f"❌ [錯誤] 載入模型係數或初始站位失敗: {e}")
+        return pd.DataFrame()
+    initial_xy = np.array([c for p in POSITION_CODES for c in initial[p]], dtype=float)
+
+    index = build_date_index()
+    cuts = split_points(index, split_date, train_fraction)
+    offsets = index["offsets"]
+    batters = index.read_manifest()["batters"]
+    jobs = []
+    for b, batter_name in enumerate(batters):
+        s, cut, e = int(offsets[b]), int(cuts[b]), int(offsets[b + 1])
+        if cut - s < MIN_TRAIN_BALLS or e - cut < MIN_TEST_BALLS:
+            continue
+        jobs.append((batter_name, s, cut, e))
+    print(f"  - {len(jobs)} / {len(batters)} 位打者的訓練窗與測試窗球數足夠，開始回測...")
+    if not jobs:
+        print("❌ [錯誤] 沒有可回測的打者。")
+        return pd.DataFrame()
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    batches = [jobs[i::workers * 4] for i in range(workers * 4)] if workers > 1 else [jobs]
+    # 子行程只收到日期索引的路徑與區間，擊球陣列以記憶體映射共用
+    tasks = [(index, batch, coefs, initial_xy) for batch in batches if batch]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_backtest_batters, tasks))
+    else:
+        results = [_backtest_batters(t) for t in tasks]
+    df = pd.DataFrame([row for rows in results for row in rows]).sort_values("batter").reset_index(drop=True)
+
+    summary = summarize_backtest(df)
+    summary.update({"fielders": fielder_names, "split_date": split_date,
+                    "train_fraction": None if split_date else (train_fraction or TRAIN_FRACTION)})
+    BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+    stem = backtest_stem(fielder_names, split_date, train_fraction)
+    df.to_csv(BACKTEST_DIR / f"{stem}_batters.csv", index=False, encoding='utf-8')
+    with open(BACKTEST_DIR / f"{stem}_summary.json", 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print("\n--- 全聯盟樣本外效益 ---")
+    print(f"  - 打者數: {summary['n_batters']}，測試窗擊球: {summary['n_test_balls']}")
+    print(f"  - 訓練窗 (樣本內) 增益: {summary['train_gain_per_100']:.2f} 出局 / 100 球")
+    print(f"  - 測試窗 (樣本外) 增益: {summary['test_gain_per_100']:.2f} 出局 / 100 球 "
+          f"(保留樣本內增益的 {summary['retention']:.0%})")
+    print(f"  - 樣本外增益為正的打者: {summary['share_positive']:.0%}")
+    if summary["n_not_converged"]:
+        nc = summary["not_converged"]
+        print(f"  - [警告] {summary['n_not_converged']} 位打者的最佳化未收斂，已排除於上述彙總之外 "
+              f"(其測試窗增益: {nc['test_gain_per_100']:.2f} 出局 / 100 球)。")
+    print(f"\n💾 回測結果已儲存至: {BACKTEST_DIR / stem}_*")
+    return df
+
+def _gain_stats(df: pd.DataFrame) -> dict:
+    n_train, n_test = int(df["n_train"].sum()), int(df["n_test"].sum())
+    train_per_100 = df["train_gain"].sum() / n_train * 100 if n_train else float("nan")
+    test_per_100 = df["test_gain"].sum() / n_test * 100 if n_test else float("nan")
+    return {
+        "n_batters": int(len(df)),
+        "n_train_balls": n_train,
+        "n_test_balls": n_test,
+        "train_gain_per_100": float(train_per_100),
+        "test_gain_per_100": float(test_per_100),
+        "test_gain_total": float(df["test_gain"].sum()),
+        "retention": float(test_per_100 / train_per_100) if train_per_100 else float("nan"),
+        "share_positive": float((df["test_gain"] > 0).mean()) if len(df) else float("nan"),
+    }
+
+def summarize_backtest(df: pd.DataFrame) -> dict:
+    """
+    全聯盟彙總：以球數加權的每 100 球增益、樣本外 / 樣本內的保留比例、增益為正的打者比例。
+    只計入最佳化收斂的打者；未收斂的打者 (站位不是最佳解) 另外彙總於 "not_converged"。
+    """
+    converged = df["converged"].astype(bool)
+    summary = _gain_stats(df[converged])
+    summary["n_not_converged"] = int((~converged).sum())
+    summary["not_converged"] = _gain_stats(df[~converged])
+    return summary
+
+
+if __name__ == "__main__":
+    example_fielders = {"LF": "Profar, Jurickson", "CF": "Harris II, Michael", "RF": "Acuña Jr., Ronald"}
+    run_alignment_backtest(example_fielders)
@@ -1,16 +1,34 @@
 # 檔案位置: src/modeling/step_03_train_catch_model.py
 
+import os
+import json
+import time
+import shutil
+import hashlib
 import pandas as pd
 import numpy as np
 import pymc as pm
+import pytensor.tensor as pt
 import arviz as az
+import xarray as xr
 from pathlib import Path
 import glob
+import sys
+import tempfile
+import subprocess
+import importlib.util
+from pymc.blocking import DictToArrayBijection
+from pymc.initial_point import make_initial_point_fn
+from pymc.step_methods.hmc.quadpotential import QuadPotentialDiag, QuadPotentialDiagAdapt
 from sklearn.preprocessing import StandardScaler
 import joblib # 用於儲存 scaler 物件
 
 # 從 config 匯入專案路徑
 from config import PROCESSED_DATA_DIR, MODELS_DIR
+from src.utils.catch_kernel import fold_scaler_into_coefficients, save_fused_params
+from src.utils.trace_store import save_trace, TRACE_DTYPE, TRACE_THIN
+from src.utils.training_stream import build_training_stream, sample_minibatch
+from src.modeling.step_13_onboard_new_players import merge_onboarded_players
 
 # --- 1. 常數定義區 ---
 # 輸入欄位
@@ -27,24 +45,342 @@ CHAINS = 4
 TARGET_ACCEPT = 0.9
 CORES = 4 # 根據您的 CPU 核心數設定
 
-# --- 2. 主模型訓練函式區 ---
-def define_and_run_model(position_code: str):
+# 檢查點：每抽完 CHECKPOINT_DRAWS 個樣本 (每條鏈) 就存一個區塊，中斷後可從最後一個區塊接續
+CHECKPOINT_DRAWS = 250
+CHECKPOINT_MANIFEST = "manifest.json"
+
+# 自適應抽樣：以回合為單位抽樣，球員層級參數達到收斂標準就停止
+ADAPTIVE_SAMPLING = False
+CONVERGENCE_VARS = ["alpha", "beta_dist", "beta_time"]
+RHAT_TARGET = 1.01
+ESS_BULK_TARGET = 400
+ESS_TAIL_TARGET = 400
+ADAPTIVE_ROUND_DRAWS = 500   # 每回合每條鏈追加的樣本數
+MAX_DRAWS = 8000             # 每條鏈的樣本數上限，超過仍未收斂即回報失敗
+
+# 串流小批次 ADVI (多季資料)
+ADVI_BATCH_SIZE = 2048
+ADVI_ITERATIONS = 50_000
+ADVI_LEARNING_RATE = 0.01
+ADVI_TOLERANCE = 1e-3        # 參數 (平均/標準差) 變動小於此值即視為收斂並提前停止
+ADVI_DRAWS = 2000            # 從近似後驗抽出的樣本數 (存成與 MCMC 相同格式的 Trace)
+
+# 模型圖與 logp/梯度函式每個球員維度只編譯一次，同一位置的所有抽樣區塊與重新訓練共用。
+# 球員維度就是實際人數，不為了跨位置共用而補位 (補位球員是每人 3 個的額外自由參數)
+TRAINING_POSITIONS = ["CF", "LF", "RF"]
+PAD_PLAYER_PREFIX = "__pad_"
+COMPILE_BENCHMARK_FILE = "compile_benchmark.csv"
+
+# NUTS 取樣後端："pymc" (預設) 或 PyMC 支援的編譯式 CPU 取樣器；未安裝時自動退回 "pymc"
+NUTS_SAMPLER = "pymc"
+NUTS_SAMPLER_REQUIREMENTS = {
+    "pymc": [],
+    "nutpie": ["nutpie"],
+    "numpyro": ["jax", "numpyro"],
+    "blackjax": ["jax", "blackjax"],
+}
+# 後端效能量測 (每個後端、每個守備位置各跑一次完整的暖機 + 抽樣)
+SAMPLER_BENCHMARK_DRAWS = 1000
+SAMPLER_BENCHMARK_TUNE = 1000
+SAMPLER_BENCHMARK_FILE = "sampler_benchmark.csv"
+
+# --- 2. 檢查點輔助函式 ---
+def _data_fingerprint(df_model: pd.DataFrame, players) -> str:
+    """訓練資料的指紋；資料變動時舊的檢查點不能再接續使用。"""
+    h = hashlib.sha1()
+    h.update(json.dumps(list(map(str, players)), ensure_ascii=False).encode("utf-8"))
+    h.update(np.ascontiguousarray(df_model.drop(columns=[COL_PLAYER_NAME]).to_numpy(dtype=float)).tobytes())
+    return h.hexdigest()
+
+def _atomic_write_json(path: Path, payload: dict):
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp, path)
+
+def load_checkpoint_manifest(checkpoint_dir: Path, fingerprint: str) -> dict:
+    """讀取檢查點清單；不存在或資料指紋不符時回傳 None (並清除舊的區塊)。"""
+    manifest_path = checkpoint_dir / CHECKPOINT_MANIFEST
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("fingerprint") != fingerprint:
+        print("  - [警告] 訓練資料已變動，舊的抽樣檢查點作廢，將重新抽樣。")
+        shutil.rmtree(checkpoint_dir)
+        return None
+    return manifest
+
+def extract_sampler_state(model: pm.Model, idata: az.InferenceData, previous: dict = None) -> dict:
     """
-    對指定守備位置的資料進行完整的階層式貝氏回歸模型訓練，
-    使用標準化 (Standardization) 對特徵進行縮放，並儲存 Scaler。
+    從一個區塊的結果取出接續抽樣所需的狀態：
+    每條鏈最後一個樣本 (作為下一區塊的起點)、調整後的步長，
+    以及由無約束空間樣本變異數估計的對角質量矩陣。
+    變異數以 (樣本數, 平均, 平方差和) 跨區塊累積，區塊越多估計越穩定。
     """
-    print(f"--- 開始訓練守備位置: {position_code} 的接殺機率模型 ---")
+    posterior = idata.posterior
+    initvals = [{rv.name: posterior[rv.name].values[c, -1].tolist() for rv in model.free_RVs}
+                for c in range(posterior.sizes["chain"])]
 
-    # 1. 動態建立路徑
-    input_dir = PROCESSED_DATA_DIR / f"{position_code}_modified_data"
-    output_dir = MODELS_DIR / position_code
-    output_dir.mkdir(parents=True, exist_ok=True)
+    # 第一個區塊另外納入暖機後半段的樣本 (與 PyMC 自身估計質量矩陣所用的視窗相近)
+    if previous is None and "warmup_posterior" in idata.groups():
+        warmup = idata.warmup_posterior
+        posterior = xr.concat([warmup.isel(draw=slice(warmup.sizes["draw"] // 2, None)), posterior], dim="draw")
+
+    # 轉換到 NUTS 實際抽樣的無約束空間 (例如 sigma 取 log)，順序與 model.value_vars 一致
+    columns = []
+    for value_var in model.value_vars:
+        rv = model.values_to_rvs[value_var]
+        draws = posterior[rv.name].values
+        transform = model.rvs_to_transforms.get(rv)
+        if transform is not None:
+            draws = transform.forward(pt.as_tensor(draws), *rv.owner.inputs).eval()
+        columns.append(draws.reshape(draws.shape[0], draws.shape[1], -1))
+    unconstrained = np.concatenate(columns, axis=-1).reshape(-1, sum(c.shape[-1] for c in columns))
+
+    # 與先前區塊的統計量合併 (Chan et al. 的平行變異數公式)
+    n, mean, m2 = len(unconstrained), unconstrained.mean(axis=0), unconstrained.var(axis=0) * len(unconstrained)
+    if previous is not None:
+        n_a, mean_a, m2_a = previous["n_samples"], np.asarray(previous["mean"]), np.asarray(previous["m2"])
+        delta = mean - mean_a
+        total = n_a + n
+        mean, m2 = mean_a + delta * n / total, m2_a + m2 + delta ** 2 * n_a * n / total
+        n = total
+
+    # 暖機結束後實際使用的步長：PyMC 在抽樣階段用的是對偶平均的平滑值 step_size_bar，
+    # 而 step_size 只是暖機最後一次帶噪聲的迭代值 (各鏈不同，取中位數)。
+    # numpyro / blackjax 的結果只有 step_size，且抽樣階段即為暖機後固定的步長，直接沿用。
+    stats = idata.sample_stats
+    step_stat = "step_size_bar" if "step_size_bar" in stats else "step_size"
+    step_size = float(np.median(stats[step_stat].values[:, -1]))
+    return {"initvals": initvals, "step_size": step_size, "n_samples": int(n),
+            "mean": mean.tolist(), "m2": m2.tolist(), "mass_diag": (m2 / n).tolist()}
+
+def resolve_nuts_sampler(requested: str = None) -> str:
+    """
+    確認要求的 NUTS 後端可用 (套件已安裝)；不認得或未安裝時印出警告並退回 "pymc"。
+    """
+    requested = (requested or NUTS_SAMPLER).lower()
+    if requested not in NUTS_SAMPLER_REQUIREMENTS:
+        print(f"  - [警告] 不支援的取樣後端 '{requested}' (可用: {list(NUTS_SAMPLER_REQUIREMENTS)})，改用 PyMC 預設取樣器。")
+        return "pymc"
+    missing = [pkg for pkg in NUTS_SAMPLER_REQUIREMENTS[requested] if importlib.util.find_spec(pkg) is None]
+    if missing:
+        print(f"  - [警告] 取樣後端 '{requested}' 需要的套件未安裝 ({', '.join(missing)})，改用 PyMC 預設取樣器。")
+        return "pymc"
+    return requested
+
+def available_nuts_samplers() -> list:
+    """目前環境中可用的所有 NUTS 後端。"""
+    return [name for name, pkgs in NUTS_SAMPLER_REQUIREMENTS.items()
+            if all(importlib.util.find_spec(pkg) is not None for pkg in pkgs)]
+
+def sample_block(sampler: "CatchModelSampler", n_draws: int, block_index: int, state: dict = None,
+                 backend: str = "pymc") -> az.InferenceData:
+    """
+    抽一個區塊。第一個區塊包含暖機 (TUNE)；之後的區塊沿用上一個區塊的步長與質量矩陣，
+    從每條鏈的最後一個樣本繼續抽樣，不再重複暖機。
+
+    backend 不是 "pymc" 時，第一個區塊 (暖機 + 抽樣) 交給外部編譯式取樣器執行。
+    外部後端無法從指定的步長與質量矩陣接續，因此之後的區塊一律以已編譯的 PyMC 取樣器接續，
+    抽的仍是同一個後驗分佈。
+    """
+    if state is None:
+        if backend != "pymc":
+            with sampler.model:
+                return pm.sample(draws=n_draws, tune=TUNE, chains=CHAINS, target_accept=TARGET_ACCEPT,
+                                 random_seed=RANDOM_SEED, nuts_sampler=backend)
+        return sampler.sample(n_draws, tune=TUNE, random_seed=RANDOM_SEED, discard_tuned_samples=False)
+    return sampler.sample(n_draws, state=state, random_seed=RANDOM_SEED + block_index)
+
+def strip_padding(idata: az.InferenceData, n_players: int) -> az.InferenceData:
+    """去掉補位球員，只保留真實球員的參數 (存檔與收斂診斷都只看真實球員)。"""
+    groups = {}
+    for group in idata.groups():
+        ds = idata[group]
+        groups[group] = ds.isel(player=slice(0, n_players)) if "player" in ds.dims else ds
+    return az.InferenceData(**groups)
+
+def save_block(checkpoint_dir: Path, block_index: int, idata: az.InferenceData, draw_offset: int):
+    """把區塊的 draw 座標改成全域編號後寫檔 (先寫暫存檔再更名)。"""
+    n = idata.posterior.sizes["draw"]
+    # pm.Data 容器會出現在 constant_data，內容就是訓練資料本身，不必每個區塊重存一份
+    idata = az.InferenceData(**{g: idata[g] for g in idata.groups()
+                                if not g.startswith("warmup_") and g != "constant_data"})
+    idata = idata.assign_coords(draw=np.arange(draw_offset, draw_offset + n), groups=["posterior", "sample_stats"])
+    path = checkpoint_dir / f"block_{block_index:04d}.nc"
+    tmp = path.with_name(f".{path.name}.tmp")
+    idata.to_netcdf(tmp)
+    os.replace(tmp, path)
+
+def check_convergence(trace: az.InferenceData) -> dict:
+    """
+    只針對球員層級參數 (CONVERGENCE_VARS) 計算 R-hat 與 bulk/tail ESS，
+    回傳最差的數值、最差的參數，以及是否達到收斂標準。
+    """
+    posterior = trace.posterior[CONVERGENCE_VARS]
+    rhat = az.rhat(posterior)
+    ess_bulk = az.ess(posterior, method="bulk")
+    ess_tail = az.ess(posterior, method="tail")
+
+    def worst(ds, pick):
+        values = {v: ds[v].values.ravel() for v in CONVERGENCE_VARS}
+        var = pick(values, key=lambda v: pick(values[v]))
+        i = int(np.argmax(values[var]) if pick is max else np.argmin(values[var]))
+        player = str(ds[var]["player"].values.ravel()[i]) if "player" in ds[var].dims else None
+        return float(values[var][i]), f"{var}[{player}]" if player else var
+
+    max_rhat, worst_rhat = worst(rhat, max)
+    min_bulk, worst_bulk = worst(ess_bulk, min)
+    min_tail, worst_tail = worst(ess_tail, min)
+    return {
+        "draws_per_chain": int(posterior.sizes["draw"]),
+        "max_rhat": max_rhat, "worst_rhat_param": worst_rhat,
+        "min_ess_bulk": min_bulk, "worst_ess_bulk_param": worst_bulk,
+        "min_ess_tail": min_tail, "worst_ess_tail_param": worst_tail,
+        "converged": bool(max_rhat <= RHAT_TARGET and min_bulk >= ESS_BULK_TARGET and min_tail >= ESS_TAIL_TARGET),
+    }
+
+def load_blocks(checkpoint_dir: Path, n_blocks: int) -> az.InferenceData:
+    """依序讀入所有區塊並沿 draw 維度串接成單一 InferenceData。"""
+    blocks = [az.from_netcdf(checkpoint_dir / f"block_{i:04d}.nc") for i in range(n_blocks)]
+    if len(blocks) == 1:
+        return blocks[0]
+    trace = az.concat(*[az.InferenceData(posterior=b.posterior, sample_stats=b.sample_stats) for b in blocks], dim="draw")
+    if "observed_data" in blocks[0].groups():
+        trace.add_groups(observed_data=blocks[0].observed_data)
+    return trace
 
-    # 2. 載入並準備資料
+# --- 3. 可重複使用的模型圖與取樣器 ---
+def _padded_players(players, capacity: int) -> list:
+    return [str(p) for p in players] + [f"{PAD_PLAYER_PREFIX}{i}" for i in range(capacity - len(players))]
+
+def build_catch_model(players, data: dict, capacity: int = None, total_size: int = None) -> pm.Model:
+    """
+    建立階層式接殺機率模型。特徵、球員索引與觀測值都放在 pm.Data 容器中，
+    之後換入其他守備位置、新資料或小批次時不需要重建模型。
+
+    球員維度補齊到 capacity (預設為實際人數)。補位的球員沒有任何資料，
+    以 player_mask 讓其參數脫離階層先驗 (改為獨立的標準常態)，不影響超參數的後驗，
+    抽樣時也不會形成漏斗。
+
+    Args:
+        players: 真實球員名單 (索引 0 ~ len(players)-1)。
+        data (dict): {"dist", "time": 標準化後的特徵, "player": 球員索引, "caught": 0/1 觀測}
+        total_size (int): 小批次訓練時的資料總筆數，似然會依此放大。
+    """
+    capacity = capacity or len(players)
+    with pm.Model(coords={"player": _padded_players(players, capacity)}) as model:
+        dist_data = pm.Data('dist_scaled', data["dist"])
+        time_data = pm.Data('time_scaled', data["time"])
+        player_data = pm.Data('player_idx', data["player"])
+        caught_data = pm.Data('caught', data["caught"])
+        mask = pm.Data('player_mask', (np.arange(capacity) < len(players)).astype(float))
+
+        mu_alpha = pm.Normal('mu_alpha', mu=0, sigma=1)
+        sigma_alpha = pm.HalfNormal('sigma_alpha', sigma=1)
+        mu_beta_dist = pm.Normal('mu_beta_dist', mu=0, sigma=1)
+        sigma_beta_dist = pm.HalfNormal('sigma_beta_dist', sigma=1)
+        mu_beta_time = pm.Normal('mu_beta_time', mu=0, sigma=1)
+        sigma_beta_time = pm.HalfNormal('sigma_beta_time', sigma=1)
+
+        alpha = pm.Normal('alpha', mu=mu_alpha * mask, sigma=sigma_alpha * mask + (1 - mask), dims="player")
+        beta_dist = pm.Normal('beta_dist', mu=mu_beta_dist * mask, sigma=sigma_beta_dist * mask + (1 - mask), dims="player")
+        beta_time = pm.Normal('beta_time', mu=mu_beta_time * mask, sigma=sigma_beta_time * mask + (1 - mask), dims="player")
+
+        logit_p = alpha[player_data] + beta_dist[player_data] * dist_data + beta_time[player_data] * time_data
+        pm.Bernoulli('y_obs', logit_p=logit_p, observed=caught_data, total_size=total_size)
+    return model
+
+class CatchModelSampler:
+    """
+    重複使用的模型圖與 NUTS 取樣設定。
+    建構時建立一次 build_catch_model 的模型，並以 Model.logp_dlogp_function 編譯一次 logp/梯度，
+    之後以 set_data 換入新資料 (同樣的球員人數)。每次抽樣都以公開的
+    pm.NUTS(potential=..., step_scale=..., logp_dlogp_func=...) 建立取樣步驟並傳入已編譯的函式，
+    區塊之間不再重新編譯，也不改寫 PyMC 的內部屬性。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        placeholder = {"dist": np.zeros(1), "time": np.zeros(1),
+                       "player": np.zeros(1, dtype=np.int64), "caught": np.zeros(1, dtype=np.int64)}
+        self.model = build_catch_model([], placeholder, capacity)
+        self.players = []
+        # 與 pm.sample 預設的 jitter+adapt_diag 相同：起點在無約束空間加上 [-1, 1] 的擾動
+        jitter_rvs = set(self.model.free_RVs)
+        self._initial_point = make_initial_point_fn(model=self.model, jitter_rvs=jitter_rvs, return_transformed=False)
+        self._initial_point_raw = make_initial_point_fn(model=self.model, jitter_rvs=jitter_rvs, return_transformed=True)
+        # 與 NUTS 自行編譯時相同的設定 (攤平的輸入、略過輸入檢查)；資料放在 pm.Data 中，set_data 後仍然有效
+        self.logp_dlogp_func = self.model.logp_dlogp_function(ravel_inputs=True)
+        self.logp_dlogp_func.trust_input = True
+
+    def set_data(self, players, data: dict):
+        """換入新的資料與球員名單 (人數不可超過 capacity)。"""
+        if len(players) > self.capacity:
+            raise ValueError(f"球員數 {len(players)} 超過取樣器的容量 {self.capacity}。")
+        values = {"dist_scaled": data["dist"], "time_scaled": data["time"], "player_idx": data["player"],
+                  "caught": data["caught"], "player_mask": (np.arange(self.capacity) < len(players)).astype(float)}
+        pm.set_data({name: np.asarray(v).astype(self.model[name].dtype) for name, v in values.items()}, model=self.model)
+        self.model.set_dim("player", self.capacity, _padded_players(players, self.capacity))
+        self.players = [str(p) for p in players]
+
+    def make_step(self, potential=None, step_scale: float = 0.25) -> pm.NUTS:
+        """
+        以指定的質量矩陣 (potential) 建立 NUTS 步驟，沿用建構時編譯好的 logp/梯度函式。
+        PyMC 的初始步長為 step_scale / n^(1/4)，不暖機時整段抽樣都使用這個步長
+        (對偶平均的 step_size_bar 由它起算)。
+        """
+        with self.model:
+            return pm.NUTS(target_accept=TARGET_ACCEPT, potential=potential, step_scale=step_scale,
+                           logp_dlogp_func=self.logp_dlogp_func)
+
+    def sample(self, n_draws: int, tune: int = 0, state: dict = None, random_seed: int = None,
+               chains: int = None, cores: int = None, **kwargs) -> az.InferenceData:
+        """
+        state 為 None 時從擾動後的起點重新暖機 (等同 pm.sample 的預設初始化)；
+        否則以 extract_sampler_state 的步長、質量矩陣與各鏈最後一個樣本接續抽樣。
+        未指定的 random_seed/chains/cores 使用模組常數。
+        """
+        random_seed = RANDOM_SEED if random_seed is None else random_seed
+        chains, cores = chains or CHAINS, cores or CORES
+        if state is None:
+            seeds = np.random.default_rng(random_seed).integers(2 ** 30, size=chains)
+            initvals = [self._initial_point(s) for s in seeds]
+            mean = np.mean([DictToArrayBijection.map(self._initial_point_raw(s)).data for s in seeds], axis=0)
+            n_dim = len(mean)
+            step = self.make_step(QuadPotentialDiagAdapt(n_dim, mean, np.ones(n_dim), 10))
+        else:
+            initvals, chains, tune = state["initvals"], len(state["initvals"]), 0
+            mass_diag = np.asarray(state["mass_diag"])
+            step = self.make_step(QuadPotentialDiag(mass_diag), state["step_size"] * len(mass_diag) ** 0.25)
+        with self.model:
+            return pm.sample(draws=n_draws, tune=tune, chains=chains, step=step, initvals=initvals,
+                             random_seed=random_seed, cores=cores, **kwargs)
+
+# 同一行程內依球員人數快取的模型 (同一位置的檢查點接續與重新訓練共用)
+_SAMPLER_CACHE = {}
+
+def get_catch_sampler(capacity: int) -> CatchModelSampler:
+    if capacity not in _SAMPLER_CACHE:
+        _SAMPLER_CACHE[capacity] = CatchModelSampler(capacity)
+    return _SAMPLER_CACHE[capacity]
+
+# --- 4. 主模型訓練函式區 ---
+def load_training_data(position_code: str) -> dict:
+    """
+    讀取並標準化某守備位置的訓練資料。
+
+    Returns:
+        dict: {"df_model", "scaler", "players", "scaled_feature_names",
+               "data" (build_catch_model / CatchModelSampler.set_data 所需的陣列)}；
+              沒有可用資料時回傳 None。
+    """
+    input_dir = PROCESSED_DATA_DIR / f"{position_code}_modified_data"
     file_list = glob.glob(str(input_dir / f"*_with_all.csv"))
     if not file_list:
         print(f"[警告] 在 {input_dir} 中找不到任何由 step_02 產生的檔案。已跳過 {position_code} 的訓練。")
-        return
+        return None
 
     df_list = [pd.read_csv(f, encoding='utf-8') for f in file_list]
     df = pd.concat(df_list, ignore_index=True)
@@ -54,11 +390,11 @@ def define_and_run_model(position_code: str):
     
     if df_model.empty:
         print(f"[警告] 清理 NaN 後，沒有可用於訓練 {position_code} 模型的數據。")
-        return
+        return None
         
     print(f"  - 資料載入完成，共 {len(df_model)} 筆有效數據，{df_model[COL_PLAYER_NAME].nunique()} 位球員。")
 
-    # 3. 使用 StandardScaler 進行標準化
+    # 使用 StandardScaler 進行標準化
     print("  - 正在對特徵進行標準化 (Standardization)...")
     features_to_scale = [COL_FIELDER_DIST, COL_FLIGHT_TIME]
     scaler = StandardScaler()
@@ -68,6 +404,40 @@ def define_and_run_model(position_code: str):
     print(f"    - '{COL_FIELDER_DIST}' 縮放後: mean={df_model[scaled_feature_names[0]].mean():.2f}, std={df_model[scaled_feature_names[0]].std():.2f}")
     print(f"    - '{COL_FLIGHT_TIME}' 縮放後: mean={df_model[scaled_feature_names[1]].mean():.2f}, std={df_model[scaled_feature_names[1]].std():.2f}")
 
+    # 將球員姓名轉換為整數索引
+    player_idx, players = pd.factorize(df_model[COL_PLAYER_NAME])
+    data = {"dist": df_model[scaled_feature_names[0]].to_numpy(), "time": df_model[scaled_feature_names[1]].to_numpy(),
+            "player": player_idx, "caught": df_model[COL_CAUGHT].to_numpy()}
+    return {"df_model": df_model, "scaler": scaler, "players": list(players),
+            "scaled_feature_names": scaled_feature_names, "data": data}
+
+def define_and_run_model(position_code: str, resume: bool = True, extra_draws: int = 0,
+                         adaptive: bool = ADAPTIVE_SAMPLING, nuts_sampler: str = None):
+    """
+    對指定守備位置的資料進行完整的階層式貝氏回歸模型訓練，
+    使用標準化 (Standardization) 對特徵進行縮放，並儲存 Scaler。
+
+    抽樣以區塊進行並逐塊存檔於 {position_code}_checkpoints/。
+    resume=True 時會從既有的檢查點接續；extra_draws > 0 時，在已完成的抽樣後
+    再追加指定數量的樣本 (每條鏈)，沿用既有的調整結果而不重新暖機。
+    adaptive=True 時以回合抽樣 (每回合 ADAPTIVE_ROUND_DRAWS)，每回合後檢查收斂，
+    達標即停止，到 MAX_DRAWS 仍未達標則回報未收斂。
+    收斂診斷一律寫入 {position_code}_convergence.json。
+    模型圖與 logp/梯度只在同一行程第一次遇到某個球員人數時編譯，之後的抽樣區塊與重新訓練沿用。
+    nuts_sampler 指定 NUTS 後端 (預設為 NUTS_SAMPLER)；外部後端一次抽完第一個區塊的全部樣本，
+    中途不存檢查點，之後追加的區塊則以 PyMC 取樣器接續 (見 sample_block)。
+    """
+    print(f"--- 開始訓練守備位置: {position_code} 的接殺機率模型 ---")
+    output_dir = MODELS_DIR / position_code
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # 1~3. 載入資料並標準化
+    prepared = load_training_data(position_code)
+    if prepared is None:
+        return
+    df_model, scaler, players = prepared["df_model"], prepared["scaler"], prepared["players"]
+    scaled_feature_names = prepared["scaled_feature_names"]
+
     # 4. 將 scaler 物件儲存起來，供後續步驟使用
     scaler_path = output_dir / f"{position_code}_scaler.joblib"
     try:
@@ -76,68 +446,325 @@ def define_and_run_model(position_code: str):
     except Exception as e:
         print(f"❌ [錯誤] 儲存 Scaler 失敗: {e}")
         return
-        
-    # 將球員姓名轉換為整數索引
-    player_idx, players = pd.factorize(df_model[COL_PLAYER_NAME])
     n_players = len(players)
 
-    # 5. 定義 PyMC 階層模型
-    print("  - 開始定義 PyMC 模型...")
-    with pm.Model(coords={"player": players}) as model:
-        mu_alpha = pm.Normal('mu_alpha', mu=0, sigma=1)
-        sigma_alpha = pm.HalfNormal('sigma_alpha', sigma=1)
-        mu_beta_dist = pm.Normal('mu_beta_dist', mu=0, sigma=1)
-        sigma_beta_dist = pm.HalfNormal('sigma_beta_dist', sigma=1)
-        mu_beta_time = pm.Normal('mu_beta_time', mu=0, sigma=1)
-        sigma_beta_time = pm.HalfNormal('sigma_beta_time', sigma=1)
+    # 5. 取得模型 (同人數只建立、編譯一次)，換入此守備位置的資料
+    capacity = n_players
+    reused = capacity in _SAMPLER_CACHE
+    start = time.time()
+    sampler = get_catch_sampler(capacity)
+    sampler.set_data(players, prepared["data"])
+    action = "沿用既有的模型，換入資料" if reused else "定義 PyMC 模型並編譯 logp/梯度"
+    print(f"  - {action} (球員維度 {n_players})，耗時 {time.time() - start:.1f} 秒。")
 
-        alpha = pm.Normal('alpha', mu=mu_alpha, sigma=sigma_alpha, dims="player")
-        beta_dist = pm.Normal('beta_dist', mu=mu_beta_dist, sigma=sigma_beta_dist, dims="player")
-        beta_time = pm.Normal('beta_time', mu=mu_beta_time, sigma=sigma_beta_time, dims="player")
-        
-        logit_p = (
-            alpha[player_idx] + 
-            beta_dist[player_idx] * df_model[scaled_feature_names[0]] + 
-            beta_time[player_idx] * df_model[scaled_feature_names[1]]
-        )
-        y_obs = pm.Bernoulli('y_obs', logit_p=logit_p, observed=df_model[COL_CAUGHT])
+    # 6. 執行模型推論 (分區塊抽樣，每塊寫入檢查點)
+    checkpoint_dir = output_dir / f"{position_code}_checkpoints"
+    fingerprint = _data_fingerprint(df_model[[COL_PLAYER_NAME, COL_CAUGHT] + scaled_feature_names],
+                                    _padded_players(players, capacity))
+    manifest = load_checkpoint_manifest(checkpoint_dir, fingerprint) if resume else None
+    if manifest is None:
+        if checkpoint_dir.exists():
+            shutil.rmtree(checkpoint_dir)
+        initial_draws = ADAPTIVE_ROUND_DRAWS if adaptive else DRAWS
+        manifest = {"fingerprint": fingerprint, "target_draws": initial_draws, "draws_done": 0, "n_blocks": 0,
+                    "state": None, "diagnostics": []}
+    manifest["target_draws"] = max(manifest["target_draws"], manifest["draws_done"] + extra_draws)
+    if manifest["draws_done"] > 0:
+        print(f"  - 找到檢查點：已完成 {manifest['draws_done']} / {manifest['target_draws']} 個樣本 (每條鏈)，將從此接續。")
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    backend = resolve_nuts_sampler(nuts_sampler)
 
-    # 6. 執行模型推論
-    print(f"  - 模型定義完成，開始使用 {CHAINS} 條鏈進行抽樣 (Draws={DRAWS}, Tune={TUNE}, Cores={CORES})...")
-    with model:
-        trace = pm.sample(
-            draws=DRAWS, 
-            tune=TUNE, 
-            chains=CHAINS, 
-            target_accept=TARGET_ACCEPT, 
-            random_seed=RANDOM_SEED,
-            cores=CORES 
-        )
+    mode_desc = f"自適應 (R-hat <= {RHAT_TARGET}, ESS >= {ESS_BULK_TARGET}/{ESS_TAIL_TARGET}, 上限 {MAX_DRAWS})" if adaptive else "固定"
+    print(f"  - 模型定義完成，開始使用 {CHAINS} 條鏈進行{mode_desc}抽樣 (後端={backend}, Draws={manifest['target_draws']}, Tune={TUNE}, Cores={CORES}, 每 {CHECKPOINT_DRAWS} 個樣本存檔一次)...")
+    manifest.setdefault("diagnostics", [])
+    sampling_start = time.time()
+    while True:
+        while manifest["draws_done"] < manifest["target_draws"]:
+            n_draws = manifest["target_draws"] - manifest["draws_done"]
+            if manifest["state"] is not None or backend == "pymc":
+                n_draws = min(CHECKPOINT_DRAWS, n_draws)
+            block = sample_block(sampler, n_draws, manifest["n_blocks"], manifest["state"], backend)
+            save_block(checkpoint_dir, manifest["n_blocks"], strip_padding(block, n_players), manifest["draws_done"])
+            manifest["state"] = extract_sampler_state(sampler.model, block, manifest["state"])
+            manifest["draws_done"] += n_draws
+            manifest["n_blocks"] += 1
+            _atomic_write_json(checkpoint_dir / CHECKPOINT_MANIFEST, manifest)
+            print(f"    - 檢查點已儲存：{manifest['draws_done']} / {manifest['target_draws']} 個樣本 (每條鏈)。")
+
+        trace = load_blocks(checkpoint_dir, manifest["n_blocks"])
+        diagnostics = check_convergence(trace)
+        if not manifest["diagnostics"] or manifest["diagnostics"][-1]["draws_per_chain"] != diagnostics["draws_per_chain"]:
+            manifest["diagnostics"].append(diagnostics)
+            _atomic_write_json(checkpoint_dir / CHECKPOINT_MANIFEST, manifest)
+        print(f"    - 收斂診斷 ({diagnostics['draws_per_chain']} 個樣本/鏈): "
+              f"最大 R-hat = {diagnostics['max_rhat']:.4f} ({diagnostics['worst_rhat_param']}), "
+              f"最小 ESS bulk = {diagnostics['min_ess_bulk']:.0f}, tail = {diagnostics['min_ess_tail']:.0f}")
+
+        if not adaptive or diagnostics["converged"]:
+            break
+        if manifest["draws_done"] >= MAX_DRAWS:
+            print(f"  - [警告] 已達每條鏈 {MAX_DRAWS} 個樣本的上限，{position_code} 模型仍未達到收斂標準。")
+            break
+        manifest["target_draws"] = min(manifest["draws_done"] + ADAPTIVE_ROUND_DRAWS, MAX_DRAWS)
+        print(f"  - 尚未收斂，追加下一回合抽樣至 {manifest['target_draws']} 個樣本 (每條鏈)...")
+
+    convergence_path = output_dir / f"{position_code}_convergence.json"
+    _atomic_write_json(convergence_path, {
+        "mode": "adaptive" if adaptive else "fixed",
+        "sampler": backend,
+        "converged": diagnostics["converged"],
+        "targets": {"rhat": RHAT_TARGET, "ess_bulk": ESS_BULK_TARGET, "ess_tail": ESS_TAIL_TARGET, "max_draws": MAX_DRAWS},
+        "variables": CONVERGENCE_VARS,
+        "chains": int(trace.posterior.sizes["chain"]),
+        "tune": TUNE,
+        "sampling_seconds_this_run": round(time.time() - sampling_start, 1),
+        "final": diagnostics,
+        "rounds": manifest["diagnostics"],
+    })
+    status = "✅ 已收斂" if diagnostics["converged"] else "⚠️ 未達收斂標準"
+    print(f"  - {status}；收斂診斷已儲存至: {convergence_path}")
 
     # 7. 儲存結果
     print("  - 抽樣完成，正在儲存結果...")
+    save_model_results(position_code, output_dir, trace, scaler)
+    print(f"--- {position_code} 模型訓練完成 ---\n")
+
+def save_model_results(position_code: str, output_dir: Path, trace: az.InferenceData, scaler, summary_kind: str = "all"):
+    """儲存參數摘要、Trace，以及把 Scaler 折進係數後的融合係數表 (MCMC 與 ADVI 共用)。"""
     try:
-        summary = az.summary(trace)
+        summary = az.summary(trace, kind=summary_kind)
         summary_path = output_dir / f"{position_code}_posterior_summary.csv"
         summary.to_csv(summary_path)
         print(f"  - 模型參數摘要已儲存至: {summary_path}")
 
         trace_path = output_dir / f"{position_code}_model_trace.nc"
-        trace.to_netcdf(trace_path)
-        print(f"  - 完整的模型訓練 Trace 已儲存至: {trace_path}")
+        save_trace(trace, trace_path)
+        print(f"  - 模型訓練 Trace 已儲存至: {trace_path} ({trace_path.stat().st_size / 1e6:.1f} MB, "
+              f"{TRACE_DTYPE or '原精度'}, 抽稀 {TRACE_THIN})")
+
+        # 匯出把 Scaler 折進係數後的原始尺度係數表，供 step_04/06/07 的融合核心使用
+        posterior_means = {v: trace.posterior[v].mean(dim=('chain', 'draw')).values for v in ['alpha', 'beta_dist', 'beta_time']}
+        players = trace.posterior['player'].values.tolist()
+        # 已快速上線 (step_13) 但這次訓練資料中沒有的球員保留在係數表中
+        params = merge_onboarded_players(position_code, {**posterior_means, 'players': players,
+                                                         'player_index': {p: i for i, p in enumerate(players)}}, scaler)
+        coefs = fold_scaler_into_coefficients(scaler, params['alpha'], params['beta_dist'], params['beta_time'])
+        fused_path = output_dir / f"{position_code}_fused_coefs.npz"
+        save_fused_params(fused_path, params['players'], coefs)
+        print(f"  - 融合係數表已儲存至: {fused_path}")
     except Exception as e:
         print(f"❌ [錯誤] 儲存模型結果時發生問題: {e}")
-    
+
+# --- 5. 串流資料 + 小批次變分推論 (多季資料用) ---
+def define_and_run_model_streaming(position_code: str):
+    """
+    可擴展的訓練模式：以 training_stream 逐塊把訓練資料寫成緊湊的磁碟陣列，
+    再以小批次 ADVI 擬合同一個階層模型。每次迭代只把一批 (ADVI_BATCH_SIZE 列) 資料
+    換進 pm.Data，似然以 total_size 放大回全體資料量，記憶體用量不隨資料量成長。
+    """
+    print(f"--- 開始以串流小批次 ADVI 訓練守備位置: {position_code} 的接殺機率模型 ---")
+    output_dir = MODELS_DIR / position_code
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        stream = build_training_stream(position_code)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"[警告] {e} 已跳過 {position_code} 的訓練。")
+        return
+    n_rows, players, scaler = stream["n_rows"], stream["players"], stream["scaler"]
+    print(f"  - 共 {n_rows} 筆有效數據，{len(players)} 位球員；每批 {ADVI_BATCH_SIZE} 筆。")
+
+    scaler_path = output_dir / f"{position_code}_scaler.joblib"
+    joblib.dump(scaler, scaler_path)
+    print(f"    - 標準化參數 (Scaler) 已儲存至: {scaler_path}")
+
+    rng = np.random.default_rng(RANDOM_SEED)
+    batch = sample_minibatch(stream, ADVI_BATCH_SIZE, rng)
+    model = build_catch_model(players, batch, total_size=n_rows)
+
+    def swap_minibatch(approx, losses, i):
+        """每次迭代前換入新的一批資料 (pm.fit 的 callback)。"""
+        new = sample_minibatch(stream, ADVI_BATCH_SIZE, rng)
+        for name, key in (("dist_scaled", "dist"), ("time_scaled", "time"), ("player_idx", "player"), ("caught", "caught")):
+            container = model[name]
+            container.set_value(new[key].astype(container.dtype))
+
+    print(f"  - 開始小批次 ADVI (最多 {ADVI_ITERATIONS} 次迭代，學習率 {ADVI_LEARNING_RATE})...")
+    start = time.time()
+    with model:
+        approx = pm.fit(
+            n=ADVI_ITERATIONS,
+            method='advi',
+            obj_optimizer=pm.adam(learning_rate=ADVI_LEARNING_RATE),
+            callbacks=[swap_minibatch, pm.callbacks.CheckParametersConvergence(tolerance=ADVI_TOLERANCE, diff='absolute')],
+            random_seed=RANDOM_SEED,
+            progressbar=True,
+        )
+        trace = approx.sample(ADVI_DRAWS, random_seed=RANDOM_SEED)
+    elapsed = time.time() - start
+    n_iter = len(approx.hist)
+    final_loss = float(np.mean(approx.hist[-min(n_iter, 500):]))
+    print(f"  - ADVI 完成：{n_iter} 次迭代，耗時 {elapsed:.1f} 秒，最後 500 次平均 -ELBO = {final_loss:.1f}")
+
+    _atomic_write_json(output_dir / f"{position_code}_convergence.json", {
+        "mode": "advi_minibatch",
+        "converged": n_iter < ADVI_ITERATIONS,
+        "iterations": n_iter,
+        "batch_size": ADVI_BATCH_SIZE,
+        "n_rows": n_rows,
+        "final_mean_loss": final_loss,
+        "fit_seconds": round(elapsed, 1),
+    })
+    save_model_results(position_code, output_dir, trace, scaler, summary_kind="stats")
     print(f"--- {position_code} 模型訓練完成 ---\n")
 
-def run_all_modeling():
-    positions_to_process = ["CF", "LF", "RF"]
+# --- 6. 編譯時間量測 ---
+# 在全新的 PyTensor 編譯目錄中建立模型並編譯 logp/梯度 (不受本機既有編譯快取影響)
+_COLD_COMPILE_SCRIPT = """
+import sys, time
+from src.modeling.step_03_train_catch_model import load_training_data, CatchModelSampler
+prepared = load_training_data(sys.argv[1])
+start = time.time()
+CatchModelSampler(len(prepared["players"])).set_data(prepared["players"], prepared["data"])
+print(f"COLD_COMPILE_SECONDS={time.time() - start}")
+"""
+
+def _time_cold_compile(position_code: str) -> float:
+    """在子行程中以空的 base_compiledir 量測建立模型 + 編譯的耗時 (秒)；失敗時回傳 NaN。"""
+    project_root = Path(__file__).resolve().parents[2]
+    with tempfile.TemporaryDirectory(prefix="pytensor_cold_") as compiledir:
+        env = dict(os.environ)
+        env["PYTENSOR_FLAGS"] = ",".join(filter(None, [env.get("PYTENSOR_FLAGS"), f"base_compiledir={compiledir}"]))
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(project_root), env.get("PYTHONPATH")]))
+        proc = subprocess.run([sys.executable, "-c", _COLD_COMPILE_SCRIPT, position_code], cwd=project_root,
+                              env=env, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("COLD_COMPILE_SECONDS="):
+            return float(line.split("=", 1)[1])
+    print(f"  - [警告] {position_code} 的冷編譯量測失敗: {proc.stderr.strip().splitlines()[-1:] or proc.returncode}")
+    return float("nan")
+
+def benchmark_compile_reuse(positions=("CF", "LF", "RF")) -> pd.DataFrame:
+    """
+    量測沿用已編譯的 logp/梯度所省下的時間。對每個守備位置列出：
+      - cold_compile_s: 在全新的編譯目錄中建立模型並編譯 (第一次訓練、沒有任何編譯快取時的成本)
+      - build_s: 在本行程中建立模型並編譯 (可命中本機的 PyTensor 編譯快取)；每個行程每個位置付一次
+      - recompile_step_s: 不傳入已編譯函式、讓 pm.NUTS 自行重新編譯 (舊做法每個抽樣區塊的成本)
+      - reuse_step_s: 以已編譯函式建立 NUTS 步驟 (目前每個抽樣區塊的成本)
+    只量測模型建立/編譯，不包含抽樣本身。結果寫入 MODELS_DIR / COMPILE_BENCHMARK_FILE。
+    """
+    rows = []
+    for pos in positions:
+        prepared = load_training_data(pos)
+        if prepared is None:
+            continue
+        players, data = prepared["players"], prepared["data"]
+        print(f"  - {pos}: 正在以全新的編譯目錄量測冷編譯 (可能需要數十秒)...")
+        cold_seconds = _time_cold_compile(pos)
+
+        start = time.time()
+        sampler = CatchModelSampler(len(players))
+        sampler.set_data(players, data)
+        build_seconds = time.time() - start
+        _SAMPLER_CACHE.setdefault(len(players), sampler)
+
+        start = time.time()
+        with sampler.model:
+            pm.NUTS(target_accept=TARGET_ACCEPT)
+        recompile_seconds = time.time() - start
+
+        start = time.time()
+        sampler.make_step()
+        reuse_seconds = time.time() - start
+        rows.append({"position": pos, "n_rows": len(data["caught"]), "n_players": len(players),
+                     "cold_compile_s": cold_seconds, "build_s": build_seconds,
+                     "recompile_step_s": recompile_seconds, "reuse_step_s": reuse_seconds})
+
+    result = pd.DataFrame(rows)
+    if result.empty:
+        print("[警告] 沒有任何守備位置的訓練資料，無法量測編譯時間。")
+        return result
+    result["saved_per_block_s"] = result["recompile_step_s"] - result["reuse_step_s"]
+    MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = MODELS_DIR / COMPILE_BENCHMARK_FILE
+    result.round(4).to_csv(out_path, index=False)
+    print("\n--- 編譯時間量測 (秒) ---")
+    print(result[["position", "n_players", "cold_compile_s", "build_s", "recompile_step_s", "reuse_step_s", "saved_per_block_s"]]
+          .round(3).to_string(index=False))
+    print(f"💾 量測結果已儲存至: {out_path}")
+    return result
+
+# --- 7. NUTS 後端效能量測 ---
+def benchmark_nuts_samplers(positions=("CF", "LF", "RF"), backends=None) -> pd.DataFrame:
+    """
+    以相同的模型、資料與抽樣設定 (SAMPLER_BENCHMARK_TUNE/DRAWS) 比較各個 NUTS 後端，
+    回報每秒有效樣本數 (球員層級參數中最小的 bulk ESS / 總耗時)。外部後端每次訓練都要重新編譯，
+    耗時包含編譯；PyMC 後端與實際訓練一樣沿用既有的模型圖。
+    所有後端都是精確的 MCMC 取樣器，差別只在速度；結果寫入 MODELS_DIR / SAMPLER_BENCHMARK_FILE。
+    """
+    requested = list(backends) if backends else list(NUTS_SAMPLER_REQUIREMENTS)
+    available = available_nuts_samplers()
+    skipped = [b for b in requested if b not in available]
+    if skipped:
+        print(f"  - [警告] 以下取樣後端未安裝，已略過: {skipped}")
+    backends = [b for b in requested if b in available]
+
+    rows = []
+    for pos in positions:
+        prepared = load_training_data(pos)
+        if prepared is None:
+            continue
+        players, data = prepared["players"], prepared["data"]
+        for backend in backends:
+            print(f"  - {pos} / {backend}: 暖機 {SAMPLER_BENCHMARK_TUNE}、抽樣 {SAMPLER_BENCHMARK_DRAWS} (每條鏈)...")
+            start = time.time()
+            if backend == "pymc":
+                sampler = get_catch_sampler(len(players))
+                sampler.set_data(players, data)
+                idata = sampler.sample(SAMPLER_BENCHMARK_DRAWS, tune=SAMPLER_BENCHMARK_TUNE)
+            else:
+                model = build_catch_model(players, data)
+                with model:
+                    idata = pm.sample(draws=SAMPLER_BENCHMARK_DRAWS, tune=SAMPLER_BENCHMARK_TUNE, chains=CHAINS,
+                                      target_accept=TARGET_ACCEPT, random_seed=RANDOM_SEED, nuts_sampler=backend)
+            seconds = time.time() - start
+            diagnostics = check_convergence(strip_padding(idata, len(players)))
+            rows.append({
+                "position": pos, "sampler": backend, "n_rows": len(data["caught"]), "n_players": len(players),
+                "seconds": seconds, "min_ess_bulk": diagnostics["min_ess_bulk"], "min_ess_tail": diagnostics["min_ess_tail"],
+                "max_rhat": diagnostics["max_rhat"], "divergences": int(idata.sample_stats["diverging"].values.sum()),
+                "ess_per_second": diagnostics["min_ess_bulk"] / seconds,
+            })
+
+    result = pd.DataFrame(rows)
+    if result.empty:
+        print("[警告] 沒有可量測的守備位置或取樣後端。")
+        return result
+    MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = MODELS_DIR / SAMPLER_BENCHMARK_FILE
+    result.round(4).to_csv(out_path, index=False)
+    print("\n--- NUTS 後端效能 (每秒有效樣本數) ---")
+    print(result[["position", "sampler", "seconds", "min_ess_bulk", "max_rhat", "divergences", "ess_per_second"]]
+          .round(3).to_string(index=False))
+    best = result.loc[result.groupby("position")["ess_per_second"].idxmax(), ["position", "sampler"]]
+    for _, row in best.iterrows():
+        print(f"  - {row['position']}: 最快的後端為 {row['sampler']}")
+    print(f"💾 量測結果已儲存至: {out_path}")
+    return result
+
+def run_all_modeling(resume: bool = True, extra_draws: int = 0, adaptive: bool = ADAPTIVE_SAMPLING,
+                     streaming: bool = False, nuts_sampler: str = None):
+    positions_to_process = TRAINING_POSITIONS
     print("==========================================")
     print("開始執行所有模型訓練任務...")
     print(f"目標守備位置: {positions_to_process}")
     print("==========================================")
     for pos in positions_to_process:
-        define_and_run_model(pos)
+        if streaming:
+            define_and_run_model_streaming(pos)
+        else:
+            define_and_run_model(pos, resume=resume, extra_draws=extra_draws, adaptive=adaptive,
+                                 nuts_sampler=nuts_sampler)
     print("所有模型訓練任務已全部完成！")
 
 if __name__ == "__main__":
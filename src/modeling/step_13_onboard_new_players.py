@@ -0,0 +1,224 @@
+# 檔案位置: src/modeling/step_13_onboard_new_players.py
+# 新球員快速上線：不重新訓練整個階層模型，把守備位置的超參數 (mu_*, sigma_*) 固定在後驗平均，
+# 只以新球員自己的少數擊球估計他的 alpha / beta_dist / beta_time (MAP + Laplace 近似)，
+# 結果附加到模型產物旁的 {pos}_onboarded.json，step_04 之後的所有載入器都會自動併入。
+
+import os
+import json
+import glob
+import time
+import numpy as np
+import pandas as pd
+import joblib
+from pathlib import Path
+
+from config import PROCESSED_DATA_DIR, MODELS_DIR
+from src.utils.catch_kernel import POSITION_CODES, COEF_INTERCEPT, COEF_DIST, COEF_TIME, fold_scaler_into_coefficients
+from src.utils.trace_store import read_trace_players, posterior_means
+
+# --- 1. 常數定義區 ---
+COL_CAUGHT = "caught"
+COL_PLAYER_NAME = "player_name"
+COL_FIELDER_DIST = "fielder_distance_to_ball"
+COL_FLIGHT_TIME = "flight_time_s"
+
+PARAM_VARS = ("alpha", "beta_dist", "beta_time")
+HYPER_VARS = ("mu_alpha", "sigma_alpha", "mu_beta_dist", "sigma_beta_dist", "mu_beta_time", "sigma_beta_time")
+MAP_MAX_ITER = 50
+MAP_TOL = 1e-8              # 牛頓法步長小於此值即視為收斂
+LOW_SAMPLE_WARNING = 20     # 擊球少於此數時提醒：估計值大多來自位置的先驗
+
+def onboarded_path(position_code: str) -> Path:
+    return MODELS_DIR / position_code / f"{position_code}_onboarded.json"
+
+def read_onboarded(position_code: str) -> dict:
+    """已上線的新球員 {姓名: {"alpha", "beta_dist", "beta_time", "coefs", "sd", "n_balls", ...}}；沒有檔案時為空。"""
+    path = onboarded_path(position_code)
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("players", {})
+
+def _write_onboarded(position_code: str, hyper: dict, players: dict):
+    path = onboarded_path(position_code)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({"hyperparameters": hyper, "players": players}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+# --- 2. 併入載入器 ---
+def merge_onboarded_players(position_code: str, params: dict, scaler) -> dict:
+    """
+    把已上線的新球員附加到 (標準化尺度的) 球員參數表 {"alpha", "beta_dist", "beta_time", "players", "player_index"}。
+    上線檔以原始尺度係數 ("coefs") 為準，依目前的 Scaler 換回標準化尺度，重新訓練換了 Scaler 也不會錯位。
+    已在 Trace 中的球員 (重新訓練後) 以 Trace 為準；Trace 比上線檔新時提醒重新上線，
+    因為新球員的估計是以舊的超參數為條件。
+    """
+    onboarded = {name: entry for name, entry in read_onboarded(position_code).items()
+                 if name not in params["player_index"]}
+    if not onboarded:
+        return params
+    trace_path = MODELS_DIR / position_code / f"{position_code}_model_trace.nc"
+    if trace_path.exists() and trace_path.stat().st_mtime > onboarded_path(position_code).stat().st_mtime:
+        print(f"  - [警告] {position_code} 的模型在新球員上線後重新訓練過，"
+              f"{len(onboarded)} 位上線球員仍沿用舊的超參數；可重新執行 --onboard 更新。")
+    names = list(onboarded)
+    coefs = np.array([onboarded[n]["coefs"] for n in names], dtype=float)
+    # fold_scaler_into_coefficients 的反運算
+    (mu_d, mu_t), (sd_d, sd_t) = scaler.mean_, scaler.scale_
+    added = {"alpha": coefs[:, COEF_INTERCEPT] + coefs[:, COEF_DIST] * mu_d + coefs[:, COEF_TIME] * mu_t,
+             "beta_dist": coefs[:, COEF_DIST] * sd_d,
+             "beta_time": coefs[:, COEF_TIME] * sd_t}
+    merged = {v: np.concatenate([np.asarray(params[v], dtype=float), added[v]]) for v in PARAM_VARS}
+    merged["players"] = list(params["players"]) + names
+    merged["player_index"] = {p: i for i, p in enumerate(merged["players"])}
+    return merged
+
+# --- 3. 條件式更新 (超參數固定) ---
+def load_hyperparameters(position_code: str) -> dict:
+    """該守備位置超參數的後驗平均 {mu_alpha, sigma_alpha, ...}。"""
+    trace_path = MODELS_DIR / position_code / f"{position_code}_model_trace.nc"
+    if not trace_path.exists():
+        raise FileNotFoundError(f"找不到 {position_code} 的模型 Trace 檔案: {trace_path}")
+    return {v: float(m) for v, m in posterior_means(trace_path, HYPER_VARS).items()}
+
+def fit_player_map(dist_scaled, time_scaled, caught, hyper: dict) -> dict:
+    """
+    在 alpha ~ N(mu_alpha, sigma_alpha)、beta_* ~ N(mu_beta_*, sigma_beta_*) 的先驗下，
+    以牛頓法求單一球員邏輯斯迴歸的後驗眾數 (MAP)；負對數後驗是凸函數，從先驗平均出發通常數步即收斂。
+    Laplace 近似的後驗標準差取自 MAP 處 Hessian 反矩陣的對角線。
+
+    Returns:
+        dict: {"alpha", "beta_dist", "beta_time", "sd" [3], "n_iter", "converged"}。
+    """
+    X = np.column_stack([np.ones(len(dist_scaled)), dist_scaled, time_scaled]).astype(float)
+    y = np.asarray(caught, dtype=float)
+    prior_mean = np.array([hyper["mu_alpha"], hyper["mu_beta_dist"], hyper["mu_beta_time"]])
+    prior_prec = 1.0 / np.array([hyper["sigma_alpha"], hyper["sigma_beta_dist"], hyper["sigma_beta_time"]]) ** 2
+
+    def neg_log_post(theta):
+        logit = X @ theta
+        # -Σ [y log σ(z) + (1 - y) log(1 - σ(z))] = Σ [log(1 + e^z) - y z]
+        return float(np.sum(np.logaddexp(0.0, logit) - y * logit) + 0.5 * np.sum(prior_prec * (theta - prior_mean) ** 2))
+
+    theta, converged, n_iter = prior_mean.copy(), False, 0
+    value = neg_log_post(theta)
+    for n_iter in range(1, MAP_MAX_ITER + 1):
+        p = 1.0 / (1.0 + np.exp(-np.clip(X @ theta, -700, 700)))
+        grad = X.T @ (p - y) + prior_prec * (theta - prior_mean)
+        hess = (X * (p * (1 - p))[:, None]).T @ X + np.diag(prior_prec)
+        step = np.linalg.solve(hess, grad)
+        # 步長減半直到目標函式下降 (凸函數，完整牛頓步幾乎總是被接受)
+        scale = 1.0
+        while scale > 1e-6 and neg_log_post(theta - scale * step) > value:
+            scale /= 2
+        theta = theta - scale * step
+        value = neg_log_post(theta)
+        if np.max(np.abs(scale * step)) < MAP_TOL:
+            converged = True
+            break
+
+    p = 1.0 / (1.0 + np.exp(-np.clip(X @ theta, -700, 700)))
+    hess = (X * (p * (1 - p))[:, None]).T @ X + np.diag(prior_prec)
+    sd = np.sqrt(np.diag(np.linalg.inv(hess)))
+    return {"alpha": float(theta[0]), "beta_dist": float(theta[1]), "beta_time": float(theta[2]),
+            "sd": sd.tolist(), "n_iter": n_iter, "converged": converged}
+
+def load_player_observations(position_code: str, player_names=None) -> dict:
+    """
+    從 step_02 的 *_with_all.csv 讀出球員的 (距離, 飛行時間, 是否接殺)，只讀需要的欄位。
+
+    Returns:
+        dict: {球員姓名: DataFrame}；player_names 為 None 時回傳所有球員。
+    """
+    input_dir = PROCESSED_DATA_DIR / f"{position_code}_modified_data"
+    cols = [COL_PLAYER_NAME, COL_FIELDER_DIST, COL_FLIGHT_TIME, COL_CAUGHT]
+    wanted = None if player_names is None else set(player_names)
+    frames = []
+    for f in sorted(glob.glob(str(input_dir / "*_with_all.csv"))):
+        df = pd.read_csv(f, usecols=lambda c: c in cols, encoding='utf-8')
+        if not set(cols).issubset(df.columns):
+            continue
+        if wanted is not None:
+            df = df[df[COL_PLAYER_NAME].isin(wanted)]
+        frames.append(df.dropna())
+    if not frames:
+        return {}
+    df = pd.concat(frames, ignore_index=True)
+    return {name: group for name, group in df.groupby(COL_PLAYER_NAME, sort=False)}
+
+def find_new_players(position_code: str) -> list:
+    """處理後資料中有守備紀錄、但 Trace 與上線檔中都沒有的球員。"""
+    trace_path = MODELS_DIR / position_code / f"{position_code}_model_trace.nc"
+    known = set(read_trace_players(trace_path)) | set(read_onboarded(position_code))
+    return sorted(name for name in load_player_observations(position_code) if name not in known)
+
+# --- 4. 主流程 ---
+def onboard_players(player_names: list = None, positions: list = None) -> pd.DataFrame:
+    """
+    為新球員估計模型參數並上線。player_names 為 None 時，自動找出各位置所有尚未建模的球員；
+    指定的球員若已在 Trace 中則略過 (以完整訓練的結果為準)，已上線過的會以最新資料重新估計。
+    完成後重建該位置的融合係數表，新球員立即可用於 step_04 之後的所有步驟。
+
+    Returns:
+        pd.DataFrame: 每位 (球員, 位置) 一列：球數、接殺數、參數估計值與 Laplace 標準差。
+    """
+    print("==========================================")
+    print("開始新球員快速上線 (超參數固定於後驗平均，只估計球員層級參數)...")
+    print("==========================================")
+    # 延遲匯入，避免與 step_04 互相匯入
+    from src.optimization.step_04_find_optimal_position import load_fused_params
+
+    rows = []
+    for pos_code in positions or POSITION_CODES:
+        start = time.time()
+        model_dir = MODELS_DIR / pos_code
+        trace_path = model_dir / f"{pos_code}_model_trace.nc"
+        scaler_path = model_dir / f"{pos_code}_scaler.joblib"
+        if not trace_path.exists() or not scaler_path.exists():
+            print(f"  - [警告] {pos_code} 尚未訓練模型 (缺少 Trace 或 Scaler)，已略過。")
+            continue
+        trace_players = set(read_trace_players(trace_path))
+        if player_names is None:
+            targets = find_new_players(pos_code)
+        else:
+            targets = [p for p in player_names if p not in trace_players]
+        if not targets:
+            continue
+
+        observations = load_player_observations(pos_code, targets)
+        targets = [p for p in targets if p in observations]
+        if not targets:
+            continue
+        hyper = load_hyperparameters(pos_code)
+        scaler = joblib.load(scaler_path)
+        onboarded = read_onboarded(pos_code)
+        print(f"\n--- {pos_code}: {len(targets)} 位新球員 ---")
+        for name in targets:
+            df = observations[name]
+            scaled = scaler.transform(df[[COL_FIELDER_DIST, COL_FLIGHT_TIME]])
+            fit = fit_player_map(scaled[:, 0], scaled[:, 1], df[COL_CAUGHT].to_numpy(), hyper)
+            if not fit["converged"]:
+                print(f"  - [警告] [{name}] 的 MAP 估計未在 {MAP_MAX_ITER} 步內收斂。")
+            coefs = fold_scaler_into_coefficients(scaler, [fit["alpha"]], [fit["beta_dist"]], [fit["beta_time"]])[0]
+            onboarded[name] = {**fit, "coefs": coefs.tolist(), "n_balls": int(len(df)), "n_caught": int(df[COL_CAUGHT].sum()),
+                               "onboarded_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+            note = " (擊球很少，估計值大多來自位置先驗)" if len(df) < LOW_SAMPLE_WARNING else ""
+            print(f"  - [{name}] {len(df)} 球 / {int(df[COL_CAUGHT].sum())} 接殺: "
+                  f"alpha={fit['alpha']:.3f}±{fit['sd'][0]:.3f}, beta_dist={fit['beta_dist']:.3f}±{fit['sd'][1]:.3f}, "
+                  f"beta_time={fit['beta_time']:.3f}±{fit['sd'][2]:.3f}{note}")
+            rows.append({"player": name, "position": pos_code, "n_balls": int(len(df)),
+                         "n_caught": int(df[COL_CAUGHT].sum()), **{v: fit[v] for v in PARAM_VARS},
+                         **{f"{v}_sd": s for v, s in zip(PARAM_VARS, fit["sd"])}})
+        _write_onboarded(pos_code, hyper, onboarded)
+        # 上線檔比融合係數表新，load_fused_params 會重新匯出 (含新球員)
+        load_fused_params(pos_code)
+        print(f"💾 {pos_code} 上線結果已儲存至: {onboarded_path(pos_code)} (耗時 {time.time() - start:.1f} 秒)")
+
+    if not rows:
+        print("\n✅ 沒有需要上線的新球員。")
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    onboard_players()
@@ -1,21 +1,24 @@
-# 檔案位置: src/optimization/step_04_find_optimal_position.py (使用 SLSQP)
+# 檔案位置: src/optimization/step_04_find_optimal_position.py (SLSQP 或極座標 L-BFGS-B)
 
 import pandas as pd
 import numpy as np
-import arviz as az
 from pathlib import Path
 import time
 import json
+import hashlib
 from scipy.optimize import minimize # 導入最佳化工具
 import joblib
-import warnings
-
-warnings.filterwarnings("ignore", category=UserWarning, message="X does not have valid feature names, but StandardScaler was fitted with feature names")
 
 # 從 config 匯入專案路徑
-from config import MODELS_DIR, INPUTS_DATA_DIR, RESULTS_DIR
+from config import MODELS_DIR, RESULTS_DIR
 # 從「中央廚房」導入共用函式和常數
-from src.utils.feature_engineering import calculate_batted_ball_features, COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME, COL_PLAYER_NAME, COL_FIELDER_DIST
+from src.utils.feature_engineering import calculate_batted_ball_features, filter_by_situation, COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME, COL_PLAYER_NAME, COL_FIELDER_DIST
+from src.utils.catch_kernel import TeamCatchKernel, fold_scaler_into_coefficients, save_fused_params, read_fused_params
+from src.utils.player_registry import batter_file_path, optimization_result_path
+from src.utils.trace_store import read_trace_players, posterior_means
+from src.utils.spray_index import spray_embedding, find_warm_start, get_spray_index
+from src.utils.data_plane import fused_params_from_plane
+from src.modeling.step_13_onboard_new_players import merge_onboarded_players, onboarded_path
 
 # --- 1. 常數定義區 ---
 # 定義扇形約束的邊界 (請根據您的球場實際情況調整)
@@ -24,6 +27,21 @@ MAX_RADIUS = 420.0   # 最大半徑 (例如：接近全壘打牆)
 MIN_ANGLE_DEG = -45.0 # 最小角度 (例如：左外野邊線，0度朝向中外野)
 MAX_ANGLE_DEG = 45.0  # 最大角度 (例如：右外野邊線)
 
+# 最佳化模式：
+#   "slsqp" - 在 (x, y) 座標上以 SLSQP 搭配 12 個非線性扇形約束 (數值微分)
+#   "polar" - 直接在每位守備員的 (半徑, 角度) 座標上以 L-BFGS-B 搭配簡單邊界與解析梯度
+OPTIMIZATION_MODE = "slsqp"
+OPTIMIZATION_MODES = ["slsqp", "polar"]
+INITIAL_GUESS = np.array([-150, 220, 0, 250, 150, 220]) # 初始猜測點 [lf_x, lf_y, cf_x, cf_y, rf_x, rf_y]
+MAX_ITER = 200
+# 以擊球分佈最相似的已解打者 (見 spray_index) 的最佳站位作為起點，而非固定的 INITIAL_GUESS
+USE_WARM_START = True
+# 觸及半徑剪枝：個人接殺機率必定低於此值的 (球, 守備員) 視為 0 (見 TeamCatchKernel)；None 代表不剪枝
+PRUNE_TOLERANCE = 1e-6
+# 打者加權混合 (打線) 最佳化的結果
+LINEUP_RESULTS_DIR = RESULTS_DIR / "lineup_optimizations"
+OPTIMIZER_BENCHMARK_FILE = RESULTS_DIR / "optimizer_benchmark.csv"
+
 # --- 2. 輔助函式區 ---
 # ... (load_model_scaler_and_params, load_player_params, predict_catch_probability_scaled 等函式維持不變) ...
 # (為求簡潔，此處省略未變動的程式碼)
@@ -33,22 +51,27 @@ def load_model_scaler_and_params(position_code: str) -> tuple:
     scaler_path = model_dir / f"{position_code}_scaler.joblib"
     if not trace_path.exists(): raise FileNotFoundError(f"找不到 {position_code} 的模型 Trace 檔案: {trace_path}")
     if not scaler_path.exists(): raise FileNotFoundError(f"找不到 {position_code} 的 Scaler 檔案: {scaler_path}")
-    trace = az.from_netcdf(trace_path)
     scaler = joblib.load(scaler_path)
-    params = {'alpha': trace.posterior['alpha'].mean(dim=('chain', 'draw')).values,
-              'beta_dist': trace.posterior['beta_dist'].mean(dim=('chain', 'draw')).values,
-              'beta_time': trace.posterior['beta_time'].mean(dim=('chain', 'draw')).values,
-              'players': trace.posterior['player'].values.tolist()}
+    # 延遲載入：只讀球員名單，平均值逐塊累加，不把整個後驗分佈讀進記憶體
+    players = read_trace_players(trace_path)
+    means = posterior_means(trace_path, ('alpha', 'beta_dist', 'beta_time'))
+    params = {'alpha': means['alpha'],
+              'beta_dist': means['beta_dist'],
+              'beta_time': means['beta_time'],
+              'players': players,
+              'player_index': {p: i for i, p in enumerate(players)}}
+    # 附加以 step_13 快速上線、尚未進入 Trace 的新球員
+    params = merge_onboarded_players(position_code, params, scaler)
     return scaler, params
 
 def load_player_params(params: dict, player_name: str) -> dict:
     try:
-        player_idx = params['players'].index(player_name)
+        player_idx = params['player_index'].get(player_name)
+        if player_idx is None: raise ValueError(f"在模型參數中找不到球員 '{player_name}'。")
         player_params = {'alpha': params['alpha'][player_idx],
                          'beta_dist': params['beta_dist'][player_idx],
                          'beta_time': params['beta_time'][player_idx],}
         return player_params
-    except ValueError: raise ValueError(f"在模型參數中找不到球員 '{player_name}'。")
     except KeyError: raise KeyError("載入的參數字典格式不正確。")
 
 def predict_catch_probability_scaled(fielder_distance_scaled, flight_time_scaled, player_params):
@@ -56,30 +79,57 @@ def predict_catch_probability_scaled(fielder_distance_scaled, flight_time_scaled
     logit_p_clipped = np.clip(logit_p, -700, 700)
     return 1 / (1 + np.exp(-logit_p_clipped))
 
-def objective_function_team(positions, batter_df, scaler_lf, scaler_cf, scaler_rf, lf_params, cf_params, rf_params):
-    """目標函式，在內部應用標準化。"""
-    lf_x, lf_y, cf_x, cf_y, rf_x, rf_y = positions
-    ball_x = batter_df[COL_X_COORD].to_numpy()
-    ball_y = batter_df[COL_Y_COORD].to_numpy()
-    flight_time_raw = batter_df[COL_FLIGHT_TIME].to_numpy()
-    dist_lf_raw = np.sqrt((ball_x - lf_x)**2 + (ball_y - lf_y)**2)
-    dist_cf_raw = np.sqrt((ball_x - cf_x)**2 + (ball_y - cf_y)**2)
-    dist_rf_raw = np.sqrt((ball_x - rf_x)**2 + (ball_y - rf_y)**2)
-    features_lf = np.stack([dist_lf_raw, flight_time_raw], axis=1)
-    features_cf = np.stack([dist_cf_raw, flight_time_raw], axis=1)
-    features_rf = np.stack([dist_rf_raw, flight_time_raw], axis=1)
-    scaled_features_lf = scaler_lf.transform(features_lf)
-    scaled_features_cf = scaler_cf.transform(features_cf)
-    scaled_features_rf = scaler_rf.transform(features_rf)
-    dist_lf_scaled, time_lf_scaled = scaled_features_lf[:, 0], scaled_features_lf[:, 1]
-    dist_cf_scaled, time_cf_scaled = scaled_features_cf[:, 0], scaled_features_cf[:, 1]
-    dist_rf_scaled, time_rf_scaled = scaled_features_rf[:, 0], scaled_features_rf[:, 1]
-    prob_lf = predict_catch_probability_scaled(dist_lf_scaled, time_lf_scaled, lf_params)
-    prob_cf = predict_catch_probability_scaled(dist_cf_scaled, time_cf_scaled, cf_params)
-    prob_rf = predict_catch_probability_scaled(dist_rf_scaled, time_rf_scaled, rf_params)
-    prob_team_per_ball = 1 - (1 - prob_lf) * (1 - prob_cf) * (1 - prob_rf)
-    total_team_catch_prob = np.sum(prob_team_per_ball)
-    return -total_team_catch_prob
+_FUSED_PARAMS_PLANE = {}
+
+def attach_fused_params_plane(plane):
+    """
+    行程池的 initializer：之後本行程的 load_fused_params 直接讀主行程發佈在資料平面上的係數表
+    (見 src.utils.data_plane.publish_fused_coefs)，不再各自讀檔。
+    """
+    _FUSED_PARAMS_PLANE["plane"] = plane
+
+def load_fused_params(position_code: str) -> dict:
+    """
+    載入已把 Scaler 折進係數的「原始尺度」球員係數表 ({pos}_fused_coefs.npz)。
+    若檔案不存在或比 Trace (或新球員上線檔) 舊，會從 Trace 與 Scaler 重新匯出一次。
+    本行程已附加資料平面 (attach_fused_params_plane) 時，直接回傳平面上的共用係數表。
+    """
+    plane = _FUSED_PARAMS_PLANE.get("plane")
+    if plane is not None and f"{position_code}_coefs" in plane:
+        return fused_params_from_plane(plane, position_code)
+    model_dir = MODELS_DIR / position_code
+    fused_path = model_dir / f"{position_code}_fused_coefs.npz"
+    trace_path = model_dir / f"{position_code}_model_trace.nc"
+    sources = [p for p in (trace_path, onboarded_path(position_code)) if p.exists()]
+    if not fused_path.exists() or any(p.stat().st_mtime > fused_path.stat().st_mtime for p in sources):
+        scaler, params = load_model_scaler_and_params(position_code)
+        coefs = fold_scaler_into_coefficients(scaler, params['alpha'], params['beta_dist'], params['beta_time'])
+        save_fused_params(fused_path, params['players'], coefs)
+    return read_fused_params(fused_path)
+
+def load_fused_player_coefs(fused_params: dict, player_name: str) -> np.ndarray:
+    """回傳單一球員的 [intercept, coef_dist, coef_time]。"""
+    try:
+        player_idx = fused_params['player_index'].get(player_name)
+        if player_idx is None: raise ValueError(f"在模型參數中找不到球員 '{player_name}'。")
+        return fused_params['coefs'][player_idx]
+    except KeyError: raise KeyError("載入的參數字典格式不正確。")
+
+def build_team_kernel(batter_df: pd.DataFrame, fielder_names: dict, weights=None,
+                      prune_tol: float = PRUNE_TOLERANCE) -> TeamCatchKernel:
+    """
+    step_04 / 06 / 07 共用的入口：為指定打者的擊球與外野手組合建立融合預測核心。
+    weights 為每顆球的權重、prune_tol 為觸及半徑剪枝的容許值 (見 TeamCatchKernel)。
+    """
+    coefs = np.stack([load_fused_player_coefs(load_fused_params(pos), fielder_names[pos]) for pos in ["LF", "CF", "RF"]])
+    return TeamCatchKernel(
+        batter_df[COL_X_COORD].to_numpy(),
+        batter_df[COL_Y_COORD].to_numpy(),
+        batter_df[COL_FLIGHT_TIME].to_numpy(),
+        coefs,
+        weights,
+        prune_tol
+    )
 
 # 定義約束條件的函式
 # =======================================================
@@ -121,89 +171,373 @@ def get_constraints():
     return constraints
 # =======================================================
 
+# 極座標參數化：每位守備員為 (半徑 ft, 角度 °)，角度以中外野方向 (Y 軸) 為 0 度，與 get_constraints 一致
+def polar_to_cartesian(polar) -> np.ndarray:
+    """[r_lf, a_lf, r_cf, a_cf, r_rf, a_rf] -> [lf_x, lf_y, cf_x, cf_y, rf_x, rf_y]"""
+    polar = np.asarray(polar, dtype=float)
+    r, a = polar[0::2], np.radians(polar[1::2])
+    xy = np.empty(6)
+    xy[0::2] = r * np.sin(a)
+    xy[1::2] = r * np.cos(a)
+    return xy
+
+def cartesian_to_polar(xy) -> np.ndarray:
+    """[lf_x, lf_y, ...] -> [r_lf, a_lf, ...]，並裁切到扇形邊界內 (作為 L-BFGS-B 的起點)。"""
+    xy = np.asarray(xy, dtype=float)
+    polar = np.empty(6)
+    polar[0::2] = np.clip(np.hypot(xy[0::2], xy[1::2]), MIN_RADIUS, MAX_RADIUS)
+    polar[1::2] = np.clip(np.degrees(np.arctan2(xy[0::2], xy[1::2])), MIN_ANGLE_DEG, MAX_ANGLE_DEG)
+    return polar
+
+def get_polar_bounds() -> list:
+    """扇形約束在極座標下就是每個座標的上下界。"""
+    return [(MIN_RADIUS, MAX_RADIUS), (MIN_ANGLE_DEG, MAX_ANGLE_DEG)] * 3
+
+def make_polar_objective(kernel: TeamCatchKernel):
+    """回傳極座標下的 (目標函式值, 梯度)；梯度由融合核心的解析梯度經連鎖律換算。"""
+    deg = np.pi / 180.0
+
+    def polar_objective(polar):
+        r, a = polar[0::2], np.radians(polar[1::2])
+        sin_a, cos_a = np.sin(a), np.cos(a)
+        xy = np.empty(6)
+        xy[0::2] = r * sin_a
+        xy[1::2] = r * cos_a
+        value, grad_xy = kernel.value_and_grad(xy)
+        gx, gy = grad_xy[0::2], grad_xy[1::2]
+        grad = np.empty(6)
+        grad[0::2] = gx * sin_a + gy * cos_a
+        grad[1::2] = (gx * r * cos_a - gy * r * sin_a) * deg
+        return value, grad
+
+    return polar_objective
+
+def solve_team_positions(kernel: TeamCatchKernel, mode: str = None, disp: bool = False, initial_guess=None):
+    """
+    依指定模式求解 6 維團隊站位。initial_guess 為 6 維起點 (預設為 INITIAL_GUESS)。
+
+    Returns:
+        tuple: (最佳站位 [lf_x, lf_y, cf_x, cf_y, rf_x, rf_y], scipy 的 OptimizeResult)。
+            result 另外記錄 n_objective_evals 與 n_constraint_evals (目標函式與約束函式的實際呼叫次數)。
+    """
+    mode = (mode or OPTIMIZATION_MODE).lower()
+    if mode not in OPTIMIZATION_MODES:
+        raise ValueError(f"不支援的最佳化模式 '{mode}' (可用: {OPTIMIZATION_MODES})")
+    counts = {"objective": 0, "constraint": 0}
+    x0 = np.asarray(INITIAL_GUESS if initial_guess is None else initial_guess, dtype=float)
+
+    if mode == "polar":
+        polar_objective = make_polar_objective(kernel)
+
+        def objective(z):
+            counts["objective"] += 1
+            return polar_objective(z)
+
+        result = minimize(objective, x0=cartesian_to_polar(x0), jac=True, method='L-BFGS-B',
+                          bounds=get_polar_bounds(), options={'disp': disp, 'maxiter': MAX_ITER})
+        positions = polar_to_cartesian(result.x)
+    else:
+        def objective(xy):
+            counts["objective"] += 1
+            return kernel.objective(xy)
+
+        def counted(fun):
+            def wrapper(xy):
+                counts["constraint"] += 1
+                return fun(xy)
+            return wrapper
+
+        constraints = [{**c, 'fun': counted(c['fun'])} for c in get_constraints()]
+        result = minimize(objective, x0=x0, method='SLSQP', constraints=constraints,
+                          options={'disp': disp, 'maxiter': MAX_ITER})
+        positions = np.asarray(result.x, dtype=float)
+
+    result.n_objective_evals = counts["objective"]
+    result.n_constraint_evals = counts["constraint"]
+    return positions, result
+
 # --- 3. 主流程函式 ---
-def run_team_optimization(batter_name: str, fielder_names: dict):
-    """主執行函式，執行使用 SLSQP 的團隊最佳化。"""
-    print("==========================================")
-    print(f"開始為打者 [{batter_name}] 和指定團隊尋找最佳防守佈陣 (使用 SLSQP)...")
-    print("==========================================")
-    
-    # ... (載入打者數據 batter_df 和球員參數 lf_player_params 等的邏輯維持不變) ...
-    # (為求簡潔，此處省略未變動的程式碼)
-    batter_file = INPUTS_DATA_DIR / "batter_spray_charts" / f"{batter_name}.csv"
+def load_batter_balls(batter_name: str, situation: dict = None) -> pd.DataFrame:
+    """載入打者的有效擊球 (可依情境篩選)；失敗或沒有擊球時印出原因並回傳 None。"""
+    batter_file = batter_file_path(batter_name)
     batter_df_raw = pd.read_csv(batter_file, encoding='utf-8')
     batter_df_processed = calculate_batted_ball_features(batter_df_raw)
     batter_df = batter_df_processed.dropna(subset=[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME])
+    try:
+        batter_df = filter_by_situation(batter_df, situation)
+    except KeyError as e:
+        print(f"❌ [錯誤] 情境篩選失敗: {e}")
+        return None
     print(f"  - 已載入並處理 [{batter_name}] 的 {len(batter_df)} 筆有效擊球數據。")
+    if batter_df.empty:
+        print("❌ [錯誤] 沒有可用於最佳化的擊球數據。")
+        return None
+    return batter_df
+
+def load_batter_kernel(batter_name: str, fielder_names: dict, situation: dict = None) -> TeamCatchKernel:
+    """載入打者的擊球資料 (可依情境篩選) 並建立融合預測核心；失敗時印出原因並回傳 None。"""
+    batter_df = load_batter_balls(batter_name, situation)
+    if batter_df is None:
+        return None
+    try:
+        kernel = build_team_kernel(batter_df, fielder_names)
+        print("  - 所有球員的融合模型係數載入成功。")
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        print(f"❌ [錯誤] 載入模型或 Scaler 或提取參數失敗: {e}")
+        return None
+    return kernel
+
+def parse_lineup(lineup) -> dict:
+    """
+    打線 -> {打者: 上場權重}。接受 dict、[(打者, 權重), ...]、或 "姓名=權重" 字串的清單
+    (省略 "=權重" 時權重為 1)。權重不必加總為 1。
+    """
+    if isinstance(lineup, dict):
+        items = list(lineup.items())
+    else:
+        items = []
+        for entry in lineup:
+            if isinstance(entry, str):
+                name, _, weight = entry.rpartition("=") if "=" in entry else (entry, "", "1")
+                items.append((name.strip(), float(weight)))
+            else:
+                items.append((entry[0], float(entry[1])))
+    parsed = {}
+    for name, weight in items:
+        if weight < 0:
+            raise ValueError(f"打者 '{name}' 的權重不可為負: {weight}")
+        parsed[name] = parsed.get(name, 0.0) + float(weight)
+    if not parsed or sum(parsed.values()) <= 0:
+        raise ValueError("打線中沒有權重為正的打者。")
+    return parsed
+
+def load_lineup_kernel(lineup: dict, fielder_names: dict, situation: dict = None) -> tuple:
+    """
+    把打線中每位打者的擊球串接成一個融合核心，並給每顆球權重
+        w_i = (打者權重 / 權重總和) * (總球數 / 該打者球數)，
+    使每位打者的影響力只取決於他的上場權重、與樣本球數無關；權重總和等於總球數，
+    目標函式的尺度與一位擊球數相同的打者一致，最佳化的收斂條件不需另外調整。
+
+    Returns:
+        tuple: (TeamCatchKernel, 各打者在串接陣列中的區段 [{"batter", "weight", "start", "stop"}, ...])；
+            沒有任何可用的打者或係數載入失敗時回傳 (None, None)。沒有擊球的打者略過並提示。
+    """
+    frames, segments = [], []
+    for batter_name, weight in lineup.items():
+        if weight <= 0:
+            continue
+        batter_df = load_batter_balls(batter_name, situation)
+        if batter_df is None:
+            print(f"  - [警告] 打者 [{batter_name}] 沒有可用的擊球，已自打線中略過。")
+            continue
+        start = segments[-1]["stop"] if segments else 0
+        segments.append({"batter": batter_name, "weight": weight, "start": start, "stop": start + len(batter_df)})
+        frames.append(batter_df[[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME]])
+    if not segments:
+        print("❌ [錯誤] 打線中沒有可用於最佳化的擊球數據。")
+        return None, None
+
+    n_total = segments[-1]["stop"]
+    total_weight = sum(seg["weight"] for seg in segments)
+    ball_weights = np.empty(n_total)
+    for seg in segments:
+        seg["weight"] = seg["weight"] / total_weight
+        ball_weights[seg["start"]:seg["stop"]] = seg["weight"] * n_total / (seg["stop"] - seg["start"])
     try:
-        scaler_lf, params_lf_all = load_model_scaler_and_params("LF")
-        scaler_cf, params_cf_all = load_model_scaler_and_params("CF")
-        scaler_rf, params_rf_all = load_model_scaler_and_params("RF")
-        lf_player_params = load_player_params(params_lf_all, fielder_names["LF"])
-        cf_player_params = load_player_params(params_cf_all, fielder_names["CF"])
-        rf_player_params = load_player_params(params_rf_all, fielder_names["RF"])
-        print("  - 所有 Scaler 和球員模型參數載入成功。")
+        kernel = build_team_kernel(pd.concat(frames, ignore_index=True), fielder_names, weights=ball_weights)
+        print(f"  - 打線共 {len(segments)} 位打者、{n_total} 筆擊球，所有球員的融合模型係數載入成功。")
     except (FileNotFoundError, ValueError, KeyError) as e:
         print(f"❌ [錯誤] 載入模型或 Scaler 或提取參數失敗: {e}")
-        return
+        return None, None
+    return kernel, segments
+
+def lineup_result_path(lineup: dict, fielder_names: dict, situation: dict = None) -> Path:
+    """打線最佳站位 JSON 的路徑，以 (打線與權重、外野組合、情境) 的雜湊命名。"""
+    total = sum(lineup.values())
+    key = json.dumps([{b: round(w / total, 6) for b, w in sorted(lineup.items())},
+                      [fielder_names[p] for p in ["LF", "CF", "RF"]], situation or {}], sort_keys=True, ensure_ascii=False)
+    return LINEUP_RESULTS_DIR / f"lineup_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}_optimal.json"
+
+def lineup_breakdown(kernel: TeamCatchKernel, segments: list, positions) -> list:
+    """
+    在指定站位下，打線中每位打者的 (未加權) 期望出局數與每顆球的平均接殺率。
+
+    Returns:
+        list: [{"batter", "weight", "n_balls", "expected_catches", "catch_rate"}, ...]。
+    """
+    team = kernel.team_probabilities(positions)
+    rows = []
+    for seg in segments:
+        catches = float(np.sum(team[seg["start"]:seg["stop"]]))
+        n = seg["stop"] - seg["start"]
+        rows.append({"batter": seg["batter"], "weight": float(seg["weight"]), "n_balls": int(n),
+                     "expected_catches": catches, "catch_rate": catches / n})
+    return rows
 
-    # 3. 獲取約束條件列表，並移除邊界 (Bounds)
-    constraints = get_constraints()
-    initial_guess = np.array([-150, 220, 0, 250, 150, 220]) # 初始猜測點
+def pick_initial_guess(kernel: TeamCatchKernel, fielder_names: dict, exclude_batter: str = None) -> tuple:
+    """
+    以擊球分佈最相似的已解打者的最佳站位作為起點。
 
-    # 4. 執行最佳化，使用 SLSQP 方法和約束
-    print("\n  - 開始執行 6 維團隊最佳化 (使用 SLSQP)...")
+    Returns:
+        tuple: (6 維起點, 相似打者資訊 dict 或 None)；索引中沒有夠近的紀錄時回傳 (INITIAL_GUESS, None)。
+    """
+    embedding = spray_embedding(kernel.ball_x, kernel.ball_y, kernel.weights)
+    warm = find_warm_start(embedding, fielder_names, exclude_batter=exclude_batter)
+    if warm is None:
+        return INITIAL_GUESS, None
+    return warm["positions"], warm
+
+def run_team_optimization(batter_name, fielder_names: dict, situation: dict = None, mode: str = None,
+                          warm_start: bool = None) -> dict:
+    """
+    主執行函式，執行團隊站位最佳化。
+
+    Args:
+        batter_name: 打者姓名；或打線 (見 parse_lineup)，此時以各打者的上場權重混合所有擊球，
+            求出一組涵蓋整個打線的站位 (見 load_lineup_kernel)。
+        situation (dict, optional): 只使用符合此比賽情境的擊球 (見 filter_by_situation)。
+            指定情境時結果不寫入共用的最佳站位 JSON，避免覆蓋全樣本的結果。
+        mode (str, optional): "slsqp" 或 "polar" (預設為 OPTIMIZATION_MODE)；兩者輸出格式相同。
+        warm_start (bool, optional): 是否以相似打者的已解站位作為起點 (預設為 USE_WARM_START)。
+            成功解出的站位會記入擊球分佈索引，供之後的查詢使用。
+
+    Returns:
+        dict: {"LF": [x, y], "CF": [x, y], "RF": [x, y]}；打線模式另含 "lineup"
+            (各打者的權重、球數、期望出局數與接殺率，見 lineup_breakdown)。失敗時回傳 None。
+    """
+    mode = (mode or OPTIMIZATION_MODE).lower()
+    method_label = "L-BFGS-B, 極座標" if mode == "polar" else "SLSQP"
+    lineup = None
+    if not isinstance(batter_name, str):
+        try:
+            lineup = parse_lineup(batter_name)
+        except (ValueError, TypeError, IndexError) as e:
+            print(f"❌ [錯誤] 打線格式不正確: {e}")
+            return None
+    target_label = f"打線 ({len(lineup)} 位打者)" if lineup else f"打者 [{batter_name}]"
+    print("==========================================")
+    print(f"開始為{target_label}和指定團隊尋找最佳防守佈陣 (使用 {method_label})...")
+    print("==========================================")
+    
+    if lineup:
+        kernel, segments = load_lineup_kernel(lineup, fielder_names, situation)
+    else:
+        kernel = load_batter_kernel(batter_name, fielder_names, situation)
+    if kernel is None:
+        return None
+
+    # 起點：擊球分佈最相似的已解打者 (優先相同外野組合)，找不到時用固定的初始猜測點
+    initial_guess, warm = INITIAL_GUESS, None
+    if USE_WARM_START if warm_start is None else warm_start:
+        initial_guess, warm = pick_initial_guess(kernel, fielder_names)
+    if warm:
+        trio_desc = "相同外野組合" if warm["same_trio"] else f"外野組合 {warm['trio']}"
+        print(f"  - 以相似打者 [{warm['batter']}] ({trio_desc}) 的最佳站位作為起點，分佈距離 {warm['distance']:.3f}。")
+
+    # 執行最佳化 (SLSQP + 扇形約束，或極座標 + 邊界)
+    print(f"\n  - 開始執行 6 維團隊最佳化 (使用 {method_label})...")
     start_time = time.time()
-    result = minimize(
-        objective_function_team,
-        x0=initial_guess,
-        args=(batter_df , scaler_lf, scaler_cf, scaler_rf, lf_player_params, cf_player_params, rf_player_params), 
-        method='SLSQP', # 指定使用 SLSQP 方法
-        constraints=constraints, # 傳入約束條件
-        options={'disp': True, 'maxiter': 200} # 增加最大迭代次數，顯示收斂過程
-    )
+    try:
+        optimal_pos_array, result = solve_team_positions(kernel, mode, disp=True, initial_guess=initial_guess)
+    except ValueError as e:
+        print(f"❌ [錯誤] {e}")
+        return None
     end_time = time.time()
-    print(f"\n--- 總最佳化耗時: {end_time - start_time:.2f} 秒 ---")
+    print(f"\n--- 總最佳化耗時: {end_time - start_time:.2f} 秒 (迭代 {result.nit} 次, 目標函式 {result.n_objective_evals} 次, 約束函式 {result.n_constraint_evals} 次) ---")
+    error_bound = kernel.prune_error_bound(optimal_pos_array)
+    if error_bound > 0:
+        print(f"  - 觸及半徑剪枝 (容許值 {kernel.prune_tol:g})：期望出局數的誤差上限 {error_bound:.2e}")
 
-    # 5. 輸出並儲存結果
+    # 輸出並儲存結果
     if result.success:
-        optimal_pos_array = result.x
         # ✨ [新增] 檢查結果是否真的在約束內 (作為驗證)
         final_lf_r = np.sqrt(optimal_pos_array[0]**2 + optimal_pos_array[1]**2)
         final_lf_a = np.degrees(np.arctan2(optimal_pos_array[0], optimal_pos_array[1]))
         print(f"  - 驗證 LF: r={final_lf_r:.1f}, a={final_lf_a:.1f}°") # 依此類推驗證 CF, RF
 
         optimal_positions = {
-            "LF": [optimal_pos_array[0], optimal_pos_array[1]],
-            "CF": [optimal_pos_array[2], optimal_pos_array[3]],
-            "RF": [optimal_pos_array[4], optimal_pos_array[5]]
+            "LF": [float(optimal_pos_array[0]), float(optimal_pos_array[1])],
+            "CF": [float(optimal_pos_array[2]), float(optimal_pos_array[3])],
+            "RF": [float(optimal_pos_array[4]), float(optimal_pos_array[5])]
         }
 
         print("\n🎉 [結論] 找到的最佳團隊防守佈陣如下：")
         for pos_code, position in optimal_positions.items():
             print(f"  - {pos_code} ({fielder_names[pos_code]}):  X = {position[0]:.2f}, Y = {position[1]:.2f}")
+        if lineup:
+            optimal_positions["lineup"] = lineup_breakdown(kernel, segments, optimal_pos_array)
+            initial_rates = lineup_breakdown(kernel, segments, INITIAL_GUESS)
+            print("\n  - 打線中各打者的期望出局數 (最佳站位 / 固定初始猜測點):")
+            for row, init in zip(optimal_positions["lineup"], initial_rates):
+                print(f"    {row['batter']:<28} 權重 {row['weight']:.3f}  {row['n_balls']:>5} 球  "
+                      f"{row['expected_catches']:8.2f} / {init['expected_catches']:8.2f} "
+                      f"(接殺率 {row['catch_rate']:.1%} / {init['catch_rate']:.1%})")
+            mix_rate = sum(row["weight"] * row["catch_rate"] for row in optimal_positions["lineup"])
+            print(f"  - 依上場權重加權的每球接殺率: {mix_rate:.2%}")
+            output_path = lineup_result_path(lineup, fielder_names, situation)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump({**optimal_positions, "fielders": fielder_names, "situation": situation or {}},
+                          f, indent=4, ensure_ascii=False)
+            print(f"\n💾 打線最佳站位已儲存至: {output_path}")
+        else:
+            get_spray_index().record(batter_name, fielder_names, spray_embedding(kernel.ball_x, kernel.ball_y),
+                                     optimal_pos_array, situation)
         
-        # ... (儲存 JSON 的邏輯維持不變) ...
-        output_dir = RESULTS_DIR / "optimizations"
-        output_dir.mkdir(parents=True, exist_ok=True)
-        team_str = f"LF_{fielder_names['LF']}_CF_{fielder_names['CF']}_RF_{fielder_names['RF']}".replace(" ", "_").replace(",", "")
-        batter_str = batter_name.replace(" ", "_").replace(",", "")
-        output_filename = f"{batter_str}_vs_{team_str}_optimal.json"
-        output_path = output_dir / output_filename
-        with open(output_path, 'w') as f:
-            json_compatible_positions = {k: [float(coord) for coord in v] for k, v in optimal_positions.items()}
-            json.dump(json_compatible_positions, f, indent=4)
-        print(f"\n💾 最佳站位已儲存至: {output_path}")
+        if not situation and not lineup:
+            output_path = optimization_result_path(batter_name, fielder_names, for_write=True)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(output_path, 'w') as f:
+                json.dump(optimal_positions, f, indent=4)
+            print(f"\n💾 最佳站位已儲存至: {output_path}")
 
     else:
-        print("❌ [錯誤] SLSQP 最佳化程序未能成功收斂。")
+        print(f"❌ [錯誤] {method_label} 最佳化程序未能成功收斂。")
         print(f"  - 狀態: {result.status}")
         print(f"  - 訊息: {result.message}")
         # 有時即使未完全收斂，result.x 也是一個可用的近似解
-        if hasattr(result, 'x'):
-             print(f"  - (近似解): {result.x}")
+        print(f"  - (近似解): {optimal_pos_array}")
+        optimal_positions = None
 
     print("\n所有團隊最佳化任務已全部完成！")
+    return optimal_positions
+
+def benchmark_optimization_modes(batter_name: str, fielder_names: dict, repeats: int = 5) -> pd.DataFrame:
+    """
+    在同一組打者/守備員上比較各最佳化模式，以及固定起點與相似打者起點 (不含此打者自己的紀錄)：
+    目標函式與約束函式的呼叫次數、迭代數、求解時間 (重複 repeats 次取中位數) 與最終期望出局數。
+    結果附加至 OPTIMIZER_BENCHMARK_FILE。
+    """
+    kernel = load_batter_kernel(batter_name, fielder_names)
+    if kernel is None:
+        return pd.DataFrame()
+    warm_guess, warm = pick_initial_guess(kernel, fielder_names, exclude_batter=batter_name)
+    starts = [("fixed", INITIAL_GUESS)]
+    if warm is not None:
+        starts.append((f"warm:{warm['batter']} ({warm['distance']:.3f})", warm_guess))
+    else:
+        print("  - 擊球分佈索引中沒有夠相似的已解打者，只比較固定起點。")
+    rows = []
+    for mode in OPTIMIZATION_MODES:
+        for start_label, x0 in starts:
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                positions, result = solve_team_positions(kernel, mode, initial_guess=x0)
+                timings.append(time.perf_counter() - start)
+            rows.append({
+                "batter": batter_name, "mode": mode, "start": start_label, "success": bool(result.success),
+                "iterations": int(result.nit),
+                "objective_evals": result.n_objective_evals, "constraint_evals": result.n_constraint_evals,
+                "solve_ms": float(np.median(timings)) * 1000, "expected_catches": kernel.expected_catches(positions),
+            })
+    df = pd.DataFrame(rows)
+    OPTIMIZER_BENCHMARK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(OPTIMIZER_BENCHMARK_FILE, mode='a', header=not OPTIMIZER_BENCHMARK_FILE.exists(), index=False)
+    print("\n--- 最佳化模式比較 ---")
+    print(df.drop(columns=["batter"]).round(3).to_string(index=False))
+    print(f"💾 比較結果已附加至: {OPTIMIZER_BENCHMARK_FILE}")
+    return df
 
 if __name__ == "__main__":
     example_fielders = { "LF": "Profar, Jurickson", "CF": "Harris II, Michael", "RF": "Acuña Jr., Ronald" }
@@ -0,0 +1,278 @@
+# 檔案位置: src/optimization/step_10_batter_archetypes.py
+# 打者原型 (archetype)：以擊球分佈把所有打者分成少數幾群，離線為每個「原型 × 外野組合」解出最佳站位，
+# 查詢時直接回傳所屬原型的站位 (近似解)；需要時 (score=True) 再以建立時存下的擊球陣列計算期望出局數，
+# 並在已有完整最佳化結果時一併回報差距。
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from sklearn.cluster import KMeans
+
+from config import RESULTS_DIR
+from src.utils.feature_engineering import calculate_batted_ball_features, COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME
+from src.utils.catch_kernel import TeamCatchKernel, POSITION_CODES
+from src.utils.player_registry import batter_file_path, optimization_result_path
+from src.utils.spray_index import spray_embedding, EMBEDDING_DIM
+from src.utils.data_plane import DataPlane, publish_ball_arrays, ball_slice
+from src.utils.sweep_runner import TASK_FIELDER_COLS
+from src.optimization.step_04_find_optimal_position import (
+    load_fused_params, load_fused_player_coefs, solve_team_positions
+)
+from src.evaluation.step_09_league_catch_matrix import load_all_batter_balls
+
+# --- 1. 常數定義區 ---
+ARCHETYPES_DIR = RESULTS_DIR / "archetypes"
+ARCHETYPES_FILE = "archetypes.json"
+ALIGNMENTS_FILE = "alignments.json"
+# 建立原型時讀入的所有打者擊球 (可記憶體映射的資料平面)，查詢計分時不再重讀 CSV 與重算軌跡
+BALLS_SUBDIR = "balls"
+N_ARCHETYPES = 12
+ARCHETYPE_SEED = 42
+# 擊球數太少的打者分佈不穩定，不參與分群的擬合 (仍會被指派到最近的原型)
+MIN_BATTER_BALLS = 20
+# 每個原型合併後的擊球數上限 (超過時隨機抽樣)，控制離線求解的成本
+MAX_POOLED_BALLS = 20_000
+ARCHETYPE_OPT_MODE = "polar"
+
+# --- 2. 輔助函式 ---
+def _trio_key(fielder_names: dict) -> str:
+    return "|".join(str(fielder_names[p]) for p in POSITION_CODES)
+
+def _atomic_write_json(path: Path, payload):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _trio_coefs(fielder_names: dict) -> np.ndarray:
+    return np.stack([load_fused_player_coefs(load_fused_params(pos), fielder_names[pos]) for pos in POSITION_CODES])
+
+def load_trios(trio_csv) -> list:
+    """讀取外野組合清單 CSV (lf_player, cf_player, rf_player；與批次任務清單同欄位名，其餘欄位忽略)。"""
+    df = pd.read_csv(trio_csv, encoding='utf-8')
+    missing = [c for c in TASK_FIELDER_COLS.values() if c not in df.columns]
+    if missing:
+        raise ValueError(f"外野組合清單缺少必要欄位: {missing}")
+    trios = {}
+    for row in df.to_dict('records'):
+        trio = {pos: row[col] for pos, col in TASK_FIELDER_COLS.items()}
+        trios.setdefault(_trio_key(trio), trio)
+    return list(trios.values())
+
+# --- 3. 離線建立：分群與原型站位 ---
+def cluster_batters(n_archetypes: int = None) -> dict:
+    """
+    以每位打者的擊球分佈嵌入向量 (見 spray_embedding) 做 KMeans 分群，並保留每個原型合併後的擊球。
+
+    Returns:
+        dict: {"centroids" (k, EMBEDDING_DIM), "assignments" {打者: 原型}, "pooled" [每個原型的 (x, y, t)],
+               "balls" (打者名單, offsets, ball_x, ball_y, flight_time)}
+    """
+    n_archetypes = n_archetypes or N_ARCHETYPES
+    batters, offsets, ball_x, ball_y, flight_time = load_all_batter_balls()
+    n_balls = np.diff(offsets)
+    embeddings = np.stack([spray_embedding(ball_x[s:e], ball_y[s:e]) for s, e in zip(offsets[:-1], offsets[1:])])
+    fit_mask = n_balls >= MIN_BATTER_BALLS
+    if fit_mask.sum() < n_archetypes:
+        raise ValueError(f"擊球數達 {MIN_BATTER_BALLS} 球的打者只有 {fit_mask.sum()} 位，不足以分成 {n_archetypes} 群。")
+
+    # 以擊球數加權，讓球數多 (分佈較可靠) 的打者主導原型中心
+    kmeans = KMeans(n_clusters=n_archetypes, n_init=10, random_state=ARCHETYPE_SEED)
+    kmeans.fit(embeddings[fit_mask], sample_weight=n_balls[fit_mask])
+    labels = kmeans.predict(embeddings)
+
+    rng = np.random.default_rng(ARCHETYPE_SEED)
+    ball_labels = np.repeat(labels, n_balls)
+    pooled = []
+    for k in range(n_archetypes):
+        idx = np.flatnonzero(ball_labels == k)
+        if len(idx) > MAX_POOLED_BALLS:
+            idx = np.sort(rng.choice(idx, MAX_POOLED_BALLS, replace=False))
+        pooled.append((ball_x[idx], ball_y[idx], flight_time[idx]))
+    return {"centroids": kmeans.cluster_centers_.astype(np.float32),
+            "assignments": {b: int(k) for b, k in zip(batters, labels)}, "pooled": pooled,
+            "balls": (batters, offsets, ball_x, ball_y, flight_time)}
+
+def solve_archetype_alignments(pooled: list, fielder_names: dict) -> list:
+    """為一組外野手解出每個原型 (合併擊球) 的最佳站位；回傳每個原型的 6 維站位 (失敗時為 None)。"""
+    coefs = _trio_coefs(fielder_names)
+    alignments = []
+    for x, y, t in pooled:
+        if len(x) == 0:
+            alignments.append(None)
+            continue
+        positions, result = solve_team_positions(TeamCatchKernel(x, y, t, coefs), ARCHETYPE_OPT_MODE)
+        alignments.append(np.round(positions, 3).tolist() if result.success else None)
+    return alignments
+
+def build_batter_archetypes(trios: list = None, n_archetypes: int = None) -> Path:
+    """
+    重新分群並為每個外野組合預先解出所有原型的最佳站位。
+    分群結果改變時，先前的原型站位一律作廢 (以分群指紋比對)。
+    """
+    print("==========================================")
+    print("開始建立打者原型與原型最佳站位...")
+    print("==========================================")
+    clusters = cluster_batters(n_archetypes)
+    centroids = clusters["centroids"]
+    fingerprint = hashlib.sha1(np.round(centroids, 5).tobytes()).hexdigest()[:16]
+    sizes = np.bincount(list(clusters["assignments"].values()), minlength=len(centroids))
+    print(f"  - 已將 {len(clusters['assignments'])} 位打者分成 {len(centroids)} 個原型，各原型人數: {sizes.tolist()}")
+
+    _atomic_write_json(ARCHETYPES_DIR / ARCHETYPES_FILE, {
+        "fingerprint": fingerprint, "embedding_dim": EMBEDDING_DIM,
+        "centroids": centroids.tolist(), "assignments": clusters["assignments"],
+        "pooled_balls": [len(x) for x, _, _ in clusters["pooled"]],
+    })
+    batters, offsets, ball_x, ball_y, flight_time = clusters["balls"]
+    balls = DataPlane(ARCHETYPES_DIR / BALLS_SUBDIR)
+    (ARCHETYPES_DIR / BALLS_SUBDIR).mkdir(parents=True, exist_ok=True)
+    balls.write_manifest({})   # 寫入期間先清掉指紋，中斷時查詢不會用到不完整的陣列
+    publish_ball_arrays(balls, ball_x, ball_y, flight_time, offsets=offsets)
+    balls.write_manifest({"fingerprint": fingerprint, "batters": batters})
+    table = {"fingerprint": fingerprint, "alignments": {}}
+    for fielder_names in trios or []:
+        try:
+            table["alignments"][_trio_key(fielder_names)] = solve_archetype_alignments(clusters["pooled"], fielder_names)
+            print(f"  - 已解出外野組合 {_trio_key(fielder_names)} 的 {len(centroids)} 個原型站位。")
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            print(f"  - [警告] 外野組合 {_trio_key(fielder_names)} 無法求解: {e}")
+    _atomic_write_json(ARCHETYPES_DIR / ALIGNMENTS_FILE, table)
+    _ARCHETYPE_CACHE.clear()
+    print(f"\n💾 打者原型與 {len(table['alignments'])} 組外野組合的原型站位已儲存至: {ARCHETYPES_DIR}")
+    return ARCHETYPES_DIR
+
+# --- 4. 查詢介面 ---
+class ArchetypeBook:
+    """
+    已建立的打者原型與原型站位。查詢不需要任何最佳化：
+    打者 -> 原型 (字典查詢，未分群的打者以嵌入向量找最近的中心) -> 該外野組合的原型站位。
+    建立時的擊球陣列以記憶體映射開啟，只有計分時才讀取。
+    """
+
+    def __init__(self, archetypes_dir: Path = ARCHETYPES_DIR):
+        self.archetypes_dir = Path(archetypes_dir)
+        with open(self.archetypes_dir / ARCHETYPES_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta["embedding_dim"] != EMBEDDING_DIM:
+            raise ValueError("打者原型是以不同的分箱設定建立的，請重新執行 build_batter_archetypes。")
+        self.fingerprint = meta["fingerprint"]
+        self.centroids = np.asarray(meta["centroids"], dtype=np.float32)
+        self.assignments = meta["assignments"]
+        self.alignments = {}
+        alignments_path = self.archetypes_dir / ALIGNMENTS_FILE
+        if alignments_path.exists():
+            with open(alignments_path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+            if table.get("fingerprint") == self.fingerprint:
+                self.alignments = table["alignments"]
+        self._balls, self._ball_rows = None, {}
+        balls = DataPlane(self.archetypes_dir / BALLS_SUBDIR)
+        manifest = balls.read_manifest()
+        if manifest.get("fingerprint") == self.fingerprint:
+            self._balls = balls
+            self._ball_rows = {b: i for i, b in enumerate(manifest["batters"])}
+
+    def batter_balls(self, batter_name: str):
+        """建立原型時存下的該打者擊球 (ball_x, ball_y, flight_time) 唯讀視圖；沒有時回傳 None。"""
+        row = self._ball_rows.get(batter_name)
+        if row is None:
+            return None
+        offsets = self._balls["offsets"]
+        return ball_slice(self._balls, int(offsets[row]), int(offsets[row + 1]))
+
+    def archetype_of(self, batter_name: str, embedding=None) -> int:
+        if batter_name in self.assignments and embedding is None:
+            return self.assignments[batter_name]
+        return int(np.argmin(np.sum((self.centroids - np.asarray(embedding, dtype=np.float32)) ** 2, axis=1)))
+
+    def alignment(self, archetype: int, fielder_names: dict):
+        """回傳原型站位 (6 維) ；此外野組合尚未預先求解時回傳 None。"""
+        positions = self.alignments.get(_trio_key(fielder_names))
+        if positions is None or positions[archetype] is None:
+            return None
+        return np.asarray(positions[archetype], dtype=float)
+
+_ARCHETYPE_CACHE = {}
+
+def get_archetype_book() -> ArchetypeBook:
+    if "book" not in _ARCHETYPE_CACHE:
+        _ARCHETYPE_CACHE["book"] = ArchetypeBook()
+    return _ARCHETYPE_CACHE["book"]
+
+def _load_batter_balls(batter_name: str) -> tuple:
+    """建立原型之後才出現的打者：從 CSV 讀入擊球並計算特徵。"""
+    df = calculate_batted_ball_features(pd.read_csv(batter_file_path(batter_name), encoding='utf-8'))
+    df = df.dropna(subset=[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME])
+    return tuple(df[c].to_numpy() for c in (COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME))
+
+def lookup_archetype_alignments(batter_names: list, trios: list, score: bool = False) -> pd.DataFrame:
+    """
+    對每位打者 × 外野組合回傳原型站位的近似解。已分群的打者只做字典查詢，不讀任何擊球資料。
+    score=True 時另外計算原型站位在該打者自己擊球上的期望出局數 (擊球取自建立原型時存下的陣列)；
+    若已有完整最佳化的結果 (step_04 的 JSON)，再列出完整解的期望出局數與差距 (完整解 - 原型解)。
+
+    Returns:
+        pd.DataFrame: batter, archetype, LF/CF/RF 站位, approx_expected_catches,
+            full_expected_catches, catch_gap (未計分或無完整解時為 NaN)。
+    """
+    book = get_archetype_book()
+    rows = []
+    for batter_name in batter_names:
+        balls = book.batter_balls(batter_name)
+        needs_balls = score or batter_name not in book.assignments
+        if balls is None and needs_balls:
+            try:
+                balls = _load_batter_balls(batter_name)
+            except FileNotFoundError as e:
+                print(f"  - [警告] 找不到打者 [{batter_name}] 的資料: {e}")
+                continue
+        archetype = book.archetype_of(batter_name, None if batter_name in book.assignments
+                                      else spray_embedding(balls[0], balls[1]))
+        for fielder_names in trios:
+            row = {"batter": batter_name, "archetype": archetype,
+                   **{f"{p}_player": fielder_names[p] for p in POSITION_CODES}}
+            positions = book.alignment(archetype, fielder_names)
+            if positions is None:
+                print(f"  - [警告] 外野組合 {_trio_key(fielder_names)} 尚未預先求解原型站位。")
+                rows.append(row)
+                continue
+            row.update({p: positions[2 * i:2 * i + 2].tolist() for i, p in enumerate(POSITION_CODES)})
+            if score:
+                kernel = TeamCatchKernel(*balls, _trio_coefs(fielder_names))
+                row["approx_expected_catches"] = kernel.expected_catches(positions)
+                full_path = optimization_result_path(batter_name, fielder_names)
+                if full_path.exists():
+                    with open(full_path, 'r', encoding='utf-8') as f:
+                        full_positions = json.load(f)
+                    row["full_expected_catches"] = kernel.expected_catches(full_positions)
+                    row["catch_gap"] = row["full_expected_catches"] - row["approx_expected_catches"]
+            rows.append(row)
+    columns = ["batter", "archetype"] + [f"{p}_player" for p in POSITION_CODES] + POSITION_CODES + \
+              ["approx_expected_catches", "full_expected_catches", "catch_gap"]
+    return pd.DataFrame(rows).reindex(columns=columns)
+
+def print_archetype_lookup(batter_names: list, trios: list, score: bool = False) -> pd.DataFrame:
+    """命令列用：查詢並印出原型站位 (score=True 時含期望出局數)。"""
+    try:
+        df = lookup_archetype_alignments(batter_names, trios, score=score)
+    except FileNotFoundError as e:
+        print(f"❌ [錯誤] 尚未建立打者原型 ({e})，請先執行 --build-archetypes。")
+        return pd.DataFrame()
+    print("\n--- 原型站位 (近似解) ---")
+    shown = df.drop(columns=[f"{p}_player" for p in POSITION_CODES])
+    if not score:
+        shown = shown.drop(columns=["approx_expected_catches", "full_expected_catches", "catch_gap"])
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(shown.round(3).to_string(index=False))
+    return df
+
+
+if __name__ == "__main__":
+    example_fielders = {"LF": "Profar, Jurickson", "CF": "Harris II, Michael", "RF": "Acuña Jr., Ronald"}
+    build_batter_archetypes([example_fielders])
+    print_archetype_lookup(["Kwan, Steven"], [example_fielders], score=True)
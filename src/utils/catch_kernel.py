@@ -0,0 +1,386 @@
+# 檔案位置: src/utils/catch_kernel.py
+# 融合版接殺機率核心：把 StandardScaler 折進每位球員的係數，
+# 三位外野手的機率與團隊機率在預先配置好的緩衝區中一次算完。
+
+import os
+import numpy as np
+from pathlib import Path
+
+# 係數陣列的欄位順序: logit = intercept + coef_dist * 距離(ft) + coef_time * 飛行時間(s)
+COEF_INTERCEPT, COEF_DIST, COEF_TIME = 0, 1, 2
+POSITION_CODES = ["LF", "CF", "RF"]
+LOGIT_CLIP = 700.0
+# 站位網格曲面每個向量化區塊最多處理的 (網格點 × 擊球) 元素數，控制記憶體用量
+SURFACE_CHUNK_ELEMENTS = 4_000_000
+# 觸及半徑剪枝 (prune_tol)：球數少於此值的核心，剪枝的額外成本高於省下的計算，目標函式與評估維持逐球全算
+PRUNE_MIN_BALLS = 1500
+# 站位曲面剪枝時，網格點依 x 座標每此寬度 (ft) 分成一欄，同一欄共用一段候選擊球
+SURFACE_TILE_FT = 40.0
+
+# --- 1. 係數折疊與存檔 ---
+def fold_scaler_into_coefficients(scaler, alpha, beta_dist, beta_time) -> np.ndarray:
+    """
+    將標準化參數折進模型係數，得到「原始尺度」的仿射 logit：
+        alpha + b_d * (d - μ_d) / σ_d + b_t * (t - μ_t) / σ_t
+      = (alpha - b_d μ_d / σ_d - b_t μ_t / σ_t) + (b_d / σ_d) d + (b_t / σ_t) t
+
+    Returns:
+        np.ndarray: 形狀為 (球員數, 3) 的係數表 [intercept, coef_dist, coef_time]。
+    """
+    (mu_d, mu_t), (sd_d, sd_t) = scaler.mean_, scaler.scale_
+    alpha, beta_dist, beta_time = (np.asarray(a, dtype=float) for a in (alpha, beta_dist, beta_time))
+    coefs = np.empty((alpha.shape[0], 3))
+    coefs[:, COEF_DIST] = beta_dist / sd_d
+    coefs[:, COEF_TIME] = beta_time / sd_t
+    coefs[:, COEF_INTERCEPT] = alpha - coefs[:, COEF_DIST] * mu_d - coefs[:, COEF_TIME] * mu_t
+    return coefs
+
+def save_fused_params(path, players, coefs: np.ndarray):
+    """
+    以 .npz 儲存球員名單與原始尺度係數表 (不需 pickle)。
+    先寫暫存檔再 os.replace，多個行程同時重建時讀者不會讀到寫到一半的檔案。
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        np.savez(f, players=np.asarray(players, dtype=str), coefs=np.asarray(coefs, dtype=float))
+    os.replace(tmp, path)
+
+def read_fused_params(path) -> dict:
+    with np.load(path, allow_pickle=False) as data:
+        players = data["players"].tolist()
+        coefs = data["coefs"]
+    return {"players": players, "player_index": {p: i for i, p in enumerate(players)}, "coefs": coefs}
+
+# --- 2. 觸及半徑索引 ---
+class ReachIndex:
+    """
+    依落點 x 座標排序的擊球，加上每位守備員的最大「觸及半徑」:
+    logit = intercept + coef_dist * 距離 + coef_time * 飛行時間 < logit(tol)
+    <=> 距離 > r_i = (logit(tol) - intercept - coef_time * t_i) / coef_dist   (coef_dist < 0)
+    R = max_i r_i 之外的球，個人接殺機率必定低於 tol。|落點 x - 站位 x| > R 的球一定在 R 之外，
+    所以每位守備員的候選擊球是排序後陣列上的一段連續區間 (切片是視圖，不需要逐球索引)。
+    coef_dist >= 0 (機率不隨距離下降) 的守備員不剪枝。
+    """
+
+    def __init__(self, ball_x, flight_time, coefs, tol: float):
+        self.tol = float(tol)
+        self.order = np.argsort(ball_x, kind="stable")
+        self.sorted_x = np.asarray(ball_x)[self.order]
+        logit_tol = np.log(self.tol / (1.0 - self.tol))
+        t_range = np.array([np.min(flight_time), np.max(flight_time)]) if len(flight_time) else np.zeros(2)
+        self.max_radius = np.full(3, np.inf)
+        for k in range(3):
+            intercept, coef_dist, coef_time = coefs[k]
+            if coef_dist < 0:
+                # r_i 對飛行時間是線性的，最大值必在最短或最長的飛行時間上；負值代表站在落點上也低於 tol
+                self.max_radius[k] = max(((logit_tol - intercept - coef_time * t_range) / coef_dist).max(), 0.0)
+
+    def strip(self, fielder: int, x: float, half_width: float = 0.0) -> tuple:
+        """站位 x 座標 (± half_width) 的候選擊球在排序後陣列上的區間 [start, stop)。"""
+        reach = self.max_radius[fielder] + half_width
+        if not np.isfinite(reach):
+            return 0, len(self.sorted_x)
+        return (int(np.searchsorted(self.sorted_x, x - reach, side='left')),
+                int(np.searchsorted(self.sorted_x, x + reach, side='right')))
+
+# --- 3. 融合預測核心 ---
+class TeamCatchKernel:
+    """
+    針對一位打者的擊球與一組外野手 (LF, CF, RF) 的接殺機率核心。
+
+    與站位無關的部分 (intercept + coef_time * 飛行時間) 在建構時就先算好，
+    之後每次評估只需計算三個距離與 sigmoid，全部寫入預先配置的緩衝區。
+    weights 為每顆球的權重 (預設皆為 1)：期望出局數、目標函式、梯度與站位曲面都以加權總和計算，
+    讓多位打者的擊球串接成一個緩衝區後仍是一次向量化的評估；逐球的機率不受權重影響。
+    prune_tol 不為 None 時建立觸及半徑索引 (見 ReachIndex)：每位守備員只對觸及半徑內的候選擊球
+    計算距離與 sigmoid，其餘 (個人機率必定低於 prune_tol) 視為 0。這只會低估期望出局數，
+    誤差上限見 prune_error_bound。球數少於 PRUNE_MIN_BALLS 時只有站位曲面會剪枝。
+    注意：回傳的陣列是內部緩衝區，下一次呼叫會被覆寫，需要保留時請自行 .copy()。
+    """
+
+    def __init__(self, ball_x, ball_y, flight_time, coefs, weights=None, prune_tol: float = None):
+        self.ball_x = np.ascontiguousarray(ball_x, dtype=float)
+        self.ball_y = np.ascontiguousarray(ball_y, dtype=float)
+        self.flight_time = np.ascontiguousarray(flight_time, dtype=float)
+        self.coefs = np.asarray(coefs, dtype=float).reshape(3, 3)
+        n = self.ball_x.shape[0]
+        self.n_balls = n
+        self.weights = None if weights is None else np.ascontiguousarray(weights, dtype=float)
+        if self.weights is not None and self.weights.shape != (n,):
+            raise ValueError(f"權重長度 {self.weights.shape} 與擊球數 {n} 不一致")
+        self.total_weight = float(n if self.weights is None else self.weights.sum())
+
+        self._coef_dist = self.coefs[:, COEF_DIST, None]
+        self._time_logit = self.coefs[:, COEF_INTERCEPT, None] + self.coefs[:, COEF_TIME, None] * self.flight_time[None, :]
+        self._dx = np.empty((3, n))
+        self._dy = np.empty((3, n))
+        self._prob = np.empty((3, n))
+        self._team = np.empty(n)
+        self._dist = np.empty((3, n))
+        self._weight = np.empty((3, n))
+
+        self.prune_tol = prune_tol
+        self._reach = ReachIndex(self.ball_x, self.flight_time, self.coefs, prune_tol) if prune_tol else None
+        self._sparse = self._reach is not None and n >= PRUNE_MIN_BALLS
+        if self._reach is not None:
+            # 依落點 x 排序的副本，候選區間直接以切片取用
+            order = self._reach.order
+            self._sorted_x, self._sorted_y = self.ball_x[order], self.ball_y[order]
+            self._sorted_time_logit = self._time_logit[:, order]
+            self._sorted_weights = None if self.weights is None else self.weights[order]
+            self._cum_weights = np.concatenate([[0.0], np.cumsum(np.ones(n) if self.weights is None else self._sorted_weights)])
+            self._sorted_miss = np.ones((3, n))
+
+    @staticmethod
+    def as_position_array(positions) -> np.ndarray:
+        """接受 6 維向量 [lf_x, lf_y, cf_x, cf_y, rf_x, rf_y] 或 {"LF": [x, y], ...}，回傳 (3, 2) 陣列。"""
+        if isinstance(positions, dict):
+            return np.array([positions[p] for p in POSITION_CODES], dtype=float)
+        return np.asarray(positions, dtype=float).reshape(3, 2)
+
+    def fielder_probabilities(self, positions) -> np.ndarray:
+        """回傳 (3, 球數) 的個人接殺機率 (列順序為 LF, CF, RF)。"""
+        pos = self.as_position_array(positions)
+        if self._sparse:
+            p = self._prob
+            p.fill(0.0)
+            for k in range(3):
+                start, stop, _, _, _, prob = self._reachable(k, pos[k])
+                p[k, self._reach.order[start:stop]] = prob
+            return p
+        np.subtract(self.ball_x[None, :], pos[:, 0:1], out=self._dx)
+        np.subtract(self.ball_y[None, :], pos[:, 1:2], out=self._dy)
+        np.hypot(self._dx, self._dy, out=self._dx)
+        p = self._prob
+        np.multiply(self._dx, self._coef_dist, out=p)
+        np.add(p, self._time_logit, out=p)
+        np.clip(p, -LOGIT_CLIP, LOGIT_CLIP, out=p)
+        np.negative(p, out=p)
+        np.exp(p, out=p)
+        np.add(p, 1.0, out=p)
+        np.reciprocal(p, out=p)
+        return p
+
+    def single_fielder_probability(self, fielder: int, xy, out: np.ndarray = None) -> np.ndarray:
+        """
+        只計算第 fielder 位 (0=LF, 1=CF, 2=RF) 守備員站在 xy 時對每顆球的個人接殺機率，
+        其他兩人不重算。out 未指定時寫入內部緩衝區 (下一次呼叫會被覆寫)。
+        """
+        x, y = float(xy[0]), float(xy[1])
+        if self._sparse:
+            p = self._prob[fielder] if out is None else out
+            p.fill(0.0)
+            start, stop, _, _, _, prob = self._reachable(fielder, (x, y))
+            p[self._reach.order[start:stop]] = prob
+            return p
+        d = self._dx[fielder]
+        np.subtract(self.ball_x, x, out=d)
+        np.subtract(self.ball_y, y, out=self._dy[fielder])
+        np.hypot(d, self._dy[fielder], out=d)
+        p = self._prob[fielder] if out is None else out
+        np.multiply(d, self._coef_dist[fielder], out=p)
+        np.add(p, self._time_logit[fielder], out=p)
+        np.clip(p, -LOGIT_CLIP, LOGIT_CLIP, out=p)
+        np.negative(p, out=p)
+        np.exp(p, out=p)
+        np.add(p, 1.0, out=p)
+        np.reciprocal(p, out=p)
+        return p
+
+    def evaluate(self, positions) -> tuple:
+        """一次算完 (個人機率 (3, 球數), 團隊機率 (球數,))；團隊機率為 1 - Π(1 - p_k)。"""
+        p = self.fielder_probabilities(positions)
+        np.subtract(1.0, p, out=self._dy)
+        np.prod(self._dy, axis=0, out=self._team)
+        np.subtract(1.0, self._team, out=self._team)
+        return p, self._team
+
+    def team_probabilities(self, positions) -> np.ndarray:
+        """回傳每顆球的團隊接殺機率。"""
+        return self.evaluate(positions)[1]
+
+    def expected_catches(self, positions) -> float:
+        """團隊期望出局數 (所有擊球的團隊接殺機率總和；有權重時為加權總和)。"""
+        if self._sparse:
+            return -self._pruned_value_and_grad(positions, with_grad=False)[0]
+        team = self.team_probabilities(positions)
+        return float(np.sum(team) if self.weights is None else np.dot(self.weights, team))
+
+    def objective(self, positions) -> float:
+        """給 scipy.optimize.minimize 使用的目標函式 (負的期望出局數)。"""
+        return -self.expected_catches(positions)
+
+    def value_and_grad(self, positions) -> tuple:
+        """
+        目標函式 (負的期望出局數) 與其對 6 維站位 [lf_x, lf_y, cf_x, cf_y, rf_x, rf_y] 的解析梯度。
+        團隊機率對 p_k 的偏導數是其他兩人的 Π(1 - p_j)；
+        p_k 對站位的偏導數為 p_k (1 - p_k) * coef_dist_k * (站位 - 落點) / 距離。
+        """
+        if self._sparse:
+            return self._pruned_value_and_grad(positions)
+        pos = self.as_position_array(positions)
+        dx, dy, dist, p, w = self._dx, self._dy, self._dist, self._prob, self._weight
+        np.subtract(self.ball_x[None, :], pos[:, 0:1], out=dx)
+        np.subtract(self.ball_y[None, :], pos[:, 1:2], out=dy)
+        np.hypot(dx, dy, out=dist)
+        np.multiply(dist, self._coef_dist, out=p)
+        np.add(p, self._time_logit, out=p)
+        np.clip(p, -LOGIT_CLIP, LOGIT_CLIP, out=p)
+        np.negative(p, out=p)
+        np.exp(p, out=p)
+        np.add(p, 1.0, out=p)
+        np.reciprocal(p, out=p)
+
+        miss = 1.0 - p
+        team = 1.0 - miss[0] * miss[1] * miss[2]
+        value = -float(np.sum(team) if self.weights is None else np.dot(self.weights, team))
+        # w = ∂(團隊機率)/∂(距離) = Π_{j≠k}(1 - p_j) * p_k (1 - p_k) * coef_dist_k
+        w[0] = miss[1] * miss[2]
+        w[1] = miss[0] * miss[2]
+        w[2] = miss[0] * miss[1]
+        w *= p * miss * self._coef_dist
+        if self.weights is not None:
+            w *= self.weights
+        np.maximum(dist, 1e-9, out=dist)
+        np.divide(w, dist, out=w)
+        # ∂距離/∂站位 = -(落點 - 站位) / 距離；目標函式再取負號，兩個負號抵消
+        grad = np.empty((3, 2))
+        grad[:, 0] = np.einsum('kn,kn->k', w, dx)
+        grad[:, 1] = np.einsum('kn,kn->k', w, dy)
+        return value, grad.ravel()
+
+    # 觸及半徑剪枝版本 (在依 x 排序的副本上運算)
+    def _reachable(self, fielder: int, xy) -> tuple:
+        """守備員站在 xy 時的候選區間與其上的 (start, stop, dx, dy, 距離, 個人機率)。"""
+        x, y = float(xy[0]), float(xy[1])
+        start, stop = self._reach.strip(fielder, x)
+        dx = self._sorted_x[start:stop] - x
+        dy = self._sorted_y[start:stop] - y
+        dist = np.hypot(dx, dy)
+        logit = dist * self._coef_dist[fielder, 0]
+        logit += self._sorted_time_logit[fielder, start:stop]
+        np.clip(logit, -LOGIT_CLIP, LOGIT_CLIP, out=logit)
+        np.negative(logit, out=logit)
+        np.exp(logit, out=logit)
+        logit += 1.0
+        prob = np.reciprocal(logit, out=logit)
+        return start, stop, dx, dy, dist, prob
+
+    def _pruned_value_and_grad(self, positions, with_grad: bool = True) -> tuple:
+        """
+        與 value_and_grad 相同，但每位守備員只處理自己候選區間內的擊球，區間外的 1 - p 視為 1；
+        團隊機率只需在三段區間涵蓋的範圍內計算。
+        """
+        pos = self.as_position_array(positions)
+        miss = self._sorted_miss
+        reach = [self._reachable(k, pos[k]) for k in range(3)]
+        for k, (start, stop, _, _, _, prob) in enumerate(reach):
+            np.subtract(1.0, prob, out=miss[k, start:stop])
+        lo, hi = min(r[0] for r in reach), max(r[1] for r in reach)
+        team = 1.0 - miss[0, lo:hi] * miss[1, lo:hi] * miss[2, lo:hi]
+        value = -float(np.sum(team) if self.weights is None else np.dot(self._sorted_weights[lo:hi], team))
+
+        grad = np.zeros((3, 2))
+        if with_grad:
+            for k, (start, stop, dx, dy, dist, prob) in enumerate(reach):
+                others = [j for j in range(3) if j != k]
+                w = miss[others[0], start:stop] * miss[others[1], start:stop]
+                w *= prob * (1.0 - prob) * self._coef_dist[k, 0]
+                if self.weights is not None:
+                    w *= self._sorted_weights[start:stop]
+                w /= np.maximum(dist, 1e-9)
+                grad[k] = w @ dx, w @ dy
+        for k, (start, stop, *_rest) in enumerate(reach):
+            miss[k, start:stop] = 1.0
+        return value, grad.ravel()
+
+    def prune_error_bound(self, positions) -> float:
+        """
+        剪枝造成的期望出局數誤差上限 (真值 - 剪枝值，恆 >= 0)：每顆球的團隊機率誤差
+        不超過被剪掉的個人機率總和，而每個被剪掉的機率都 < prune_tol，
+        故上限為 prune_tol × Σ_守備員 (候選區間外的球的權重總和)。未剪枝時為 0。
+        """
+        if not self._sparse:
+            return 0.0
+        pos = self.as_position_array(positions)
+        pruned_weight = 0.0
+        for k in range(3):
+            start, stop = self._reach.strip(k, pos[k, 0])
+            pruned_weight += self.total_weight - (self._cum_weights[stop] - self._cum_weights[start])
+        return float(self.prune_tol * pruned_weight)
+
+    def surface_error_bound(self) -> float:
+        """fielder_surface 每個網格點的誤差上限 (移動的守備員與另外兩人的被剪機率都 < prune_tol)。"""
+        if self._reach is None:
+            return 0.0
+        return float(self.prune_tol * self.total_weight * (3 if self._sparse else 1))
+
+    def fielder_surface(self, positions, fielder: int, grid_x, grid_y) -> np.ndarray:
+        """
+        其他兩位守備員固定在 positions、只移動第 fielder 位 (0=LF, 1=CF, 2=RF) 時，
+        每個網格點 (grid_x, grid_y 同形狀) 的團隊期望出局數。
+        團隊期望出局數 = Σ_球 權重 - Σ_球 權重 * (1 - p_k(網格點)) * Π_{j≠k}(1 - p_j)，
+        後者對所有網格點是一次矩陣乘法；網格點分塊處理，每塊不超過 SURFACE_CHUNK_ELEMENTS 個元素。
+        有觸及半徑索引時改為依 SURFACE_TILE_FT 分塊，每塊只計算其候選擊球 (見 _pruned_surface)。
+        """
+        p = self.fielder_probabilities(positions)
+        others = [j for j in range(3) if j != fielder]
+        miss_others = (1.0 - p[others[0]]) * (1.0 - p[others[1]])
+        if self.weights is not None:
+            miss_others *= self.weights
+        grid_x, grid_y = np.asarray(grid_x, dtype=float), np.asarray(grid_y, dtype=float)
+        gx, gy = grid_x.ravel(), grid_y.ravel()
+        if self._reach is not None:
+            return self._pruned_surface(fielder, miss_others, gx, gy).reshape(grid_x.shape)
+        out = np.empty(gx.shape[0])
+        rows = max(SURFACE_CHUNK_ELEMENTS // max(self.n_balls, 1), 1)
+        for s in range(0, gx.shape[0], rows):
+            e = min(s + rows, gx.shape[0])
+            logit = np.hypot(self.ball_x[None, :] - gx[s:e, None], self.ball_y[None, :] - gy[s:e, None])
+            logit *= self._coef_dist[fielder]
+            logit += self._time_logit[fielder][None, :]
+            np.clip(logit, -LOGIT_CLIP, LOGIT_CLIP, out=logit)
+            # 1 - sigmoid(logit) = 1 / (1 + exp(logit))
+            np.exp(logit, out=logit)
+            logit += 1.0
+            np.reciprocal(logit, out=logit)
+            out[s:e] = self.total_weight - logit @ miss_others
+        return out.reshape(grid_x.shape)
+
+    def _pruned_surface(self, fielder: int, miss_others: np.ndarray, gx: np.ndarray, gy: np.ndarray) -> np.ndarray:
+        """
+        站位曲面的剪枝版本。候選區間外的球，移動的守備員貢獻 1 - p = 1，因此
+        團隊期望出局數 = Σ 權重 - Σ miss_others + Σ_候選 p_k(網格點) * miss_others。
+        網格點依 x 座標每 SURFACE_TILE_FT 分成一欄，每欄共用一段候選區間。
+        """
+        mo = miss_others[self._reach.order]
+        out = np.full(gx.shape[0], self.total_weight - mo.sum())
+        column = np.floor(gx / SURFACE_TILE_FT).astype(np.int64)
+        order = np.argsort(column, kind="stable")
+        bounds = np.flatnonzero(np.diff(column[order])) + 1
+        coef_dist = self._coef_dist[fielder, 0]
+        for members in np.split(order, bounds):
+            if members.size == 0:
+                continue
+            tx = gx[members]
+            half_width = (tx.max() - tx.min()) / 2
+            start, stop = self._reach.strip(fielder, (tx.max() + tx.min()) / 2, half_width)
+            if stop <= start:
+                continue
+            bx, by = self._sorted_x[start:stop], self._sorted_y[start:stop]
+            time_logit, weights = self._sorted_time_logit[fielder, start:stop], mo[start:stop]
+            rows = max(SURFACE_CHUNK_ELEMENTS // (stop - start), 1)
+            for s in range(0, members.size, rows):
+                m = members[s:s + rows]
+                logit = np.hypot(bx[None, :] - gx[m, None], by[None, :] - gy[m, None])
+                logit *= coef_dist
+                logit += time_logit[None, :]
+                np.clip(logit, -LOGIT_CLIP, LOGIT_CLIP, out=logit)
+                # sigmoid(logit) = 1 / (1 + exp(-logit))
+                np.negative(logit, out=logit)
+                np.exp(logit, out=logit)
+                logit += 1.0
+                np.reciprocal(logit, out=logit)
+                out[m] += logit @ weights
+        return out
@@ -1,10 +1,11 @@
 # 檔案位置: src/utils/dashboard_utils.py
 
 import streamlit as st
-import arviz as az
 import pandas as pd
 from pathlib import Path
-from config import MODELS_DIR, INPUTS_DATA_DIR
+from config import MODELS_DIR
+from src.utils.player_registry import get_player_registry
+from src.utils.trace_store import read_trace_players
 
 @st.cache_data # Streamlit 的快取功能，避免重複載入
 def get_player_lists():
@@ -12,22 +13,41 @@ def get_player_lists():
     掃描模型和資料檔案，獲取所有可選的球員和打者列表。
     """
     
-    # 1. 獲取打者列表
-    batter_dir = INPUTS_DATA_DIR / "batter_spray_charts"
-    batter_files = list(batter_dir.glob("*.csv"))
-    # 從檔名 "Kwan, Steven.csv" 中提取 "Kwan, Steven"
-    batters = sorted([f.stem for f in batter_files])
+    # 1. 獲取打者列表 (由球員註冊表提供，姓名來自資料內容而非檔名)
+    batters = get_player_registry().batter_names()
 
     # 2. 獲取外野手列表
     fielder_lists = {}
     for pos_code in ["LF", "CF", "RF"]:
         trace_path = MODELS_DIR / pos_code / f"{pos_code}_model_trace.nc"
         if trace_path.exists():
-            trace = az.from_netcdf(trace_path)
-            # 從模型的 'player' 維度獲取球員姓名列表
-            players = sorted(trace.posterior['player'].values.tolist())
+            # 只從模型的 'player' 座標讀取球員姓名列表 (不載入後驗樣本)
+            players = sorted(read_trace_players(trace_path))
             fielder_lists[pos_code] = players
         else:
             fielder_lists[pos_code] = [] # 如果模型不存在，返回空列表
 
-    return batters, fielder_lists.get("LF", []), fielder_lists.get("CF", []), fielder_lists.get("RF", [])
\ No newline at end of file
+    return batters, fielder_lists.get("LF", []), fielder_lists.get("CF", []), fielder_lists.get("RF", [])
+
+@st.cache_resource # 記憶體映射的矩陣只需開啟一次
+def get_league_matrix():
+    """
+    開啟 step_09 產生的全聯盟期望接殺矩陣；尚未建立時回傳 None。
+    """
+    from src.evaluation.step_09_league_catch_matrix import CatchExpectationMatrix
+    try:
+        return CatchExpectationMatrix()
+    except FileNotFoundError:
+        return None
+
+def get_whatif_session(batter_name: str, fielder_names: dict):
+    """
+    取得目前使用者的 what-if 評估工作階段 (存在 st.session_state，每位使用者各自一份)；
+    換了打者或外野組合才重新載入資料，拖動滑桿時直接沿用常駐的擊球陣列與係數。
+    """
+    from src.evaluation.step_07_compare_initial_vs_optimal import WhatIfSession
+    key = (batter_name, tuple(fielder_names[p] for p in ["LF", "CF", "RF"]))
+    if st.session_state.get("whatif_key") != key:
+        st.session_state["whatif_session"] = WhatIfSession(batter_name, fielder_names)
+        st.session_state["whatif_key"] = key
+    return st.session_state["whatif_session"]
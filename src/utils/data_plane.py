@@ -0,0 +1,151 @@
+# 檔案位置: src/utils/data_plane.py
+# 行程池共用的零複製資料平面：主行程把擊球特徵陣列、球員係數表等一次寫成記憶體映射的 .npy，
+# 子行程只憑資料夾路徑附加 (attach)，所有行程共用同一份分頁快取，不必把陣列序列化給每個子行程。
+
+import os
+import json
+import shutil
+import secrets
+import numpy as np
+from pathlib import Path
+
+from config import RESULTS_DIR
+from src.utils.catch_kernel import POSITION_CODES
+
+# --- 1. 常數定義區 ---
+# 優先放在 tmpfs (/dev/shm，即共享記憶體)；沒有時退回結果資料夾下的隱藏目錄 (仍是記憶體映射)
+SHM_ROOT = Path("/dev/shm")
+FALLBACK_ROOT = RESULTS_DIR / ".data_plane"
+PLANE_PREFIX = "outfield_plane_"
+MANIFEST_FILE = "manifest.json"
+
+def _plane_root() -> Path:
+    if SHM_ROOT.is_dir() and os.access(SHM_ROOT, os.W_OK):
+        return SHM_ROOT
+    FALLBACK_ROOT.mkdir(parents=True, exist_ok=True)
+    return FALLBACK_ROOT
+
+# --- 2. 資料平面 ---
+class DataPlane:
+    """
+    一個資料夾內的具名陣列 (每個名稱一個 .npy)。序列化時只帶資料夾路徑，
+    子行程第一次讀取某個名稱時以唯讀 mmap 附加，之後在同一行程內重複使用。
+
+    用法:
+        with DataPlane.create() as plane:          # 暫時的平面，離開時刪除
+            plane.publish("ball_x", ball_x)
+            pool.map(work, [(plane, s, e) for ...])
+        # 子行程: plane["ball_x"][s:e]
+    也可以用 DataPlane(path) 直接開啟一個持久的 .npy 資料夾 (例如回測的日期索引)。
+    """
+
+    def __init__(self, path, owner: bool = False):
+        self.path = Path(path)
+        self.owner = owner
+        self._attached = {}
+
+    @classmethod
+    def create(cls, tag: str = "") -> "DataPlane":
+        """建立一個暫時的平面 (名稱含行程 ID 與亂數，不會與其他批次衝突)；建立者負責 close()。"""
+        path = _plane_root() / f"{PLANE_PREFIX}{tag + '_' if tag else ''}{os.getpid()}_{secrets.token_hex(4)}"
+        path.mkdir(parents=True)
+        return cls(path, owner=True)
+
+    # 寫入
+    def publish(self, name: str, array) -> np.ndarray:
+        """把陣列寫入平面 (先寫暫存檔再 os.replace)，回傳唯讀的記憶體映射。"""
+        array = np.asarray(array)
+        if array.dtype == object:
+            array = array.astype(str)
+        final = self.path / f"{name}.npy"
+        tmp = self.path / f".{name}.{os.getpid()}.tmp.npy"
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=array.dtype, shape=array.shape)
+        out[...] = array
+        out.flush()
+        del out
+        os.replace(tmp, final)
+        self._attached.pop(name, None)
+        return self[name]
+
+    def write_manifest(self, payload: dict):
+        with open(self.path / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+
+    def read_manifest(self) -> dict:
+        path = self.path / MANIFEST_FILE
+        if not path.exists():
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    # 讀取
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._attached:
+            path = self.path / f"{name}.npy"
+            if not path.exists():
+                raise KeyError(f"資料平面 {self.path} 中沒有 '{name}'")
+            self._attached[name] = np.load(path, mmap_mode='r')
+        return self._attached[name]
+
+    def __contains__(self, name: str) -> bool:
+        return (self.path / f"{name}.npy").exists()
+
+    # 序列化：只帶路徑；子行程中的複本不是擁有者，不會刪除資料夾
+    def __getstate__(self):
+        return {"path": str(self.path)}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], owner=False)
+
+    # 生命週期
+    def close(self):
+        self._attached.clear()
+        if self.owner:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- 3. 常用資料的發佈與讀取 ---
+def publish_fused_coefs(plane: DataPlane, positions: list = None) -> list:
+    """
+    把各位置的融合係數表 (球員名單 + (球員數, 3) 係數) 發佈到平面；沒有模型的位置略過。
+    回傳已發佈的位置。
+    """
+    from src.optimization.step_04_find_optimal_position import load_fused_params
+
+    published = []
+    for pos_code in positions or POSITION_CODES:
+        try:
+            params = load_fused_params(pos_code)
+        except FileNotFoundError as e:
+            print(f"  - [警告] {e}")
+            continue
+        plane.publish(f"{pos_code}_players", np.array(params["players"], dtype=str))
+        plane.publish(f"{pos_code}_coefs", params["coefs"])
+        published.append(pos_code)
+    return published
+
+_FUSED_FROM_PLANE = {}
+
+def fused_params_from_plane(plane: DataPlane, position_code: str) -> dict:
+    """與 read_fused_params 相同格式的係數表，係數為平面上的唯讀映射 (名單索引每個行程只建一次)。"""
+    key = (str(plane.path), position_code)
+    if key not in _FUSED_FROM_PLANE:
+        players = plane[f"{position_code}_players"].tolist()
+        _FUSED_FROM_PLANE[key] = {"players": players, "player_index": {p: i for i, p in enumerate(players)},
+                                  "coefs": plane[f"{position_code}_coefs"]}
+    return _FUSED_FROM_PLANE[key]
+
+def publish_ball_arrays(plane: DataPlane, ball_x, ball_y, flight_time, **extra):
+    """發佈擊球特徵陣列 (以及任意額外的逐球陣列，例如 offsets、game_day)。"""
+    for name, array in {"ball_x": ball_x, "ball_y": ball_y, "flight_time": flight_time, **extra}.items():
+        plane.publish(name, array)
+
+def ball_slice(plane: DataPlane, start: int, stop: int) -> tuple:
+    """回傳 [start, stop) 區間的 (ball_x, ball_y, flight_time) 唯讀視圖 (不複製)。"""
+    return plane["ball_x"][start:stop], plane["ball_y"][start:stop], plane["flight_time"][start:stop]
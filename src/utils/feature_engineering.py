@@ -13,6 +13,12 @@ COL_HIT_DISTANCE = "hit_distance_sc"
 COL_PLAYER_NAME = "player_name"
 COL_LAUNCH_SPEED = "launch_speed"
 COL_LAUNCH_ANGLE = "launch_angle"
+COL_GAME_PK = "game_pk"
+COL_AT_BAT_NUMBER = "at_bat_number"
+COL_PITCH_NUMBER = "pitch_number"
+
+# 一顆擊球的唯一識別鍵 (Statcast 中 game_pk + at_bat_number + pitch_number 不會重複)
+BALL_KEY_COLS = [COL_GAME_PK, COL_AT_BAT_NUMBER, COL_PITCH_NUMBER]
 
 # 輸入欄位 (from positioning.csv)
 COL_FIELDER_NAME = "name_fielder"
@@ -31,9 +37,23 @@ COL_FIELDER_DIST = "fielder_distance_to_ball"
 # 物理座標常數
 X0, Y0 = 125.42, 198.27
 
+# 飛行時間模型："drag" (含空氣阻力與升力的數值積分) 或 "vacuum" (真空解析解)。
+# 現有的 Scaler、Trace 與 *_with_all.csv 都是以真空飛行時間建立的；
+# 改成 "drag" 前必須重新執行 step_02 與 step_03，否則模型係數與輸入特徵的定義不一致。
+FLIGHT_TIME_MODEL = "vacuum"
+
+# 棒球空氣動力學常數 (英呎-秒制)
+AIR_DENSITY = 0.0023769          # 海平面空氣密度 (slug/ft^3)
+BALL_MASS = 5.125 / 16 / 32.174  # 5.125 盎司 → slug
+BALL_AREA = np.pi * (2.9 / 2 / 12) ** 2  # 截面積 (ft^2)，直徑 2.9 吋
+DRAG_COEF = 0.35
+LIFT_COEF = 0.18                 # 典型飛球逆旋所對應的升力係數
+TRAJ_DT = 0.2                    # 固定步長 (秒)；落地時刻以 Hermite 插值補精度
+TRAJ_MAX_TIME = 15.0             # 積分上限 (秒)
+
 # --- 2. 輔助函式區 ---
 def compute_flight_time(launch_speed_mph, launch_angle_deg, g=32.174, h0=3.0, h1=0.0):
-    """根據擊出速度和仰角計算球的飛行時間。"""
+    """根據擊出速度和仰角計算球的飛行時間 (真空模型，不考慮空氣阻力)。"""
     MPH_TO_FPS = 1.4666666667
     theta = np.radians(launch_angle_deg)
     v0_fps = launch_speed_mph * MPH_TO_FPS
@@ -44,6 +64,143 @@ def compute_flight_time(launch_speed_mph, launch_angle_deg, g=32.174, h0=3.0, h1
     T = np.where(np.isfinite(T) & (T >= 0), T, np.nan)
     return T
 
+def integrate_trajectories(launch_speed_mph, launch_angle_deg, g=32.174, h0=3.0, h1=0.0,
+                           drag_coef=DRAG_COEF, lift_coef=LIFT_COEF, dt=TRAJ_DT, max_time=TRAJ_MAX_TIME):
+    """
+    以固定步長 RK4 同時積分所有擊球在鉛直平面上的軌跡 (含空氣阻力與逆旋升力)。
+    每一步只計算仍在空中的球，落地的球會被移出工作陣列。
+
+    Returns:
+        tuple: (飛行時間 T, 水平飛行距離 R)，兩者皆為與輸入等長的陣列，無效輸入為 NaN。
+    """
+    MPH_TO_FPS = 1.4666666667
+    speed = np.asarray(launch_speed_mph, dtype=float) * MPH_TO_FPS
+    theta = np.radians(np.asarray(launch_angle_deg, dtype=float))
+    n = speed.shape[0]
+    T = np.full(n, np.nan)
+    R = np.full(n, np.nan)
+
+    k_drag = AIR_DENSITY * drag_coef * BALL_AREA / (2 * BALL_MASS)
+    k_lift = AIR_DENSITY * lift_coef * BALL_AREA / (2 * BALL_MASS)
+
+    def accel(vx, vz):
+        v = np.sqrt(vx * vx + vz * vz)
+        # 阻力與速度反向；升力垂直於速度 (逆旋使球上飄)
+        ax = -k_drag * v * vx - k_lift * v * vz
+        az = -g - k_drag * v * vz + k_lift * v * vx
+        return ax, az
+
+    active = np.flatnonzero(np.isfinite(speed) & np.isfinite(theta) & (speed >= 0))
+    x = np.zeros(active.size)
+    z = np.full(active.size, h0)
+    vx = speed[active] * np.cos(theta[active])
+    vz = speed[active] * np.sin(theta[active])
+    t = 0.0
+
+    while active.size and t < max_time:
+        k1x, k1z = accel(vx, vz)
+        k2x, k2z = accel(vx + 0.5 * dt * k1x, vz + 0.5 * dt * k1z)
+        k3x, k3z = accel(vx + 0.5 * dt * k2x, vz + 0.5 * dt * k2z)
+        k4x, k4z = accel(vx + dt * k3x, vz + dt * k3z)
+        vz_prev = vz
+        x_new = x + dt * (vx + dt / 6 * (k1x + k2x + k3x))
+        z_new = z + dt * (vz + dt / 6 * (k1z + k2z + k3z))
+        vx = vx + dt / 6 * (k1x + 2 * k2x + 2 * k3x + k4x)
+        vz = vz + dt / 6 * (k1z + 2 * k2z + 2 * k3z + k4z)
+
+        # 本步落地的球：以三次 Hermite 插值 (兩端高度與鉛直速度) 求出步內的落地時間
+        landed = z_new <= h1
+        if landed.any():
+            za, zb = z[landed] - h1, z_new[landed] - h1
+            va, vb = vz_prev[landed] * dt, vz[landed] * dt
+            s = za / (za - zb)
+            for _ in range(2):  # 從線性內插出發做兩次牛頓迭代
+                h = (2*s**3 - 3*s**2 + 1) * za + (s**3 - 2*s**2 + s) * va + (-2*s**3 + 3*s**2) * zb + (s**3 - s**2) * vb
+                dh = (6*s**2 - 6*s) * za + (3*s**2 - 4*s + 1) * va + (-6*s**2 + 6*s) * zb + (3*s**2 - 2*s) * vb
+                s = np.clip(s - h / dh, 0.0, 1.0)
+            T[active[landed]] = t + s * dt
+            R[active[landed]] = x[landed] + s * (x_new[landed] - x[landed])
+            keep = ~landed
+            active, x, z, vx, vz = active[keep], x_new[keep], z_new[keep], vx[keep], vz[keep]
+        else:
+            x, z = x_new, z_new
+        t += dt
+
+    return T, R
+
+# 依擊球 ID 快取的數值積分飛行時間 (同一顆球只積分一次)。
+# 以排序後的 ID 陣列搭配 np.searchsorted 整批查表；超過上限時改以本次呼叫的擊球作為新的快取內容，
+# 長時間執行的行程 (--serve-jsonl、儀表板) 記憶體不會無限成長 (每顆球 16 bytes，上限約 80 MB)
+FLIGHT_TIME_CACHE_SIZE = 5_000_000
+_FLIGHT_TIME_CACHE = (np.empty(0, dtype=np.int64), np.empty(0, dtype=float))
+
+def compute_flight_time_drag(launch_speed_mph, launch_angle_deg, ball_ids=None):
+    """
+    含空氣阻力與升力的飛行時間。若提供 ball_ids，結果會依擊球 ID 快取，
+    已計算過的球直接查表，只積分尚未見過的球 (快取最多 FLIGHT_TIME_CACHE_SIZE 顆球)。
+    """
+    launch_speed_mph = np.asarray(launch_speed_mph, dtype=float)
+    launch_angle_deg = np.asarray(launch_angle_deg, dtype=float)
+    if ball_ids is None:
+        return integrate_trajectories(launch_speed_mph, launch_angle_deg)[0]
+
+    global _FLIGHT_TIME_CACHE
+    ball_ids = np.asarray(ball_ids, dtype=np.int64)
+    cacheable = ball_ids >= 0
+    cached_ids, cached_T = _FLIGHT_TIME_CACHE
+    T = np.full(ball_ids.shape[0], np.nan)
+    if cached_ids.size:
+        pos = np.minimum(np.searchsorted(cached_ids, ball_ids), cached_ids.size - 1)
+        hit = cacheable & (cached_ids[pos] == ball_ids)
+        T[hit] = cached_T[pos[hit]]
+    miss = np.isnan(T) | ~cacheable
+    if miss.any():
+        T[miss] = integrate_trajectories(launch_speed_mph[miss], launch_angle_deg[miss])[0]
+        store = miss & cacheable & np.isfinite(T)
+        if store.any():
+            new_ids, first = np.unique(ball_ids[store], return_index=True)
+            if cached_ids.size + new_ids.size > FLIGHT_TIME_CACHE_SIZE:
+                # 快取已滿：只保留本次呼叫的擊球 (最可能被重複查詢的一批)
+                keep = cacheable & np.isfinite(T)
+                cached_ids, first = np.unique(ball_ids[keep], return_index=True)
+                cached_T = T[keep][first]
+                cached_ids, cached_T = cached_ids[:FLIGHT_TIME_CACHE_SIZE], cached_T[:FLIGHT_TIME_CACHE_SIZE]
+            else:
+                ids = np.concatenate([cached_ids, new_ids])
+                order = np.argsort(ids, kind="stable")
+                cached_ids, cached_T = ids[order], np.concatenate([cached_T, T[store][first]])[order]
+            _FLIGHT_TIME_CACHE = (cached_ids, cached_T)
+    return T
+
+def make_ball_id(df: pd.DataFrame) -> np.ndarray:
+    """
+    將 (game_pk, at_bat_number, pitch_number) 壓成單一 int64 擊球 ID，
+    方便以陣列方式做去重與快取查詢。缺少鍵值的列回傳 -1。
+    """
+    keys = df[BALL_KEY_COLS].apply(pd.to_numeric, errors="coerce")
+    valid = keys.notna().all(axis=1).to_numpy()
+    k = keys.fillna(0).to_numpy(dtype=np.int64)
+    # at_bat_number < 1000、pitch_number < 100，故以 10^5 與 10^2 為位數即可
+    ball_id = k[:, 0] * 100_000 + k[:, 1] * 100 + k[:, 2]
+    return np.where(valid, ball_id, -1)
+
+def filter_by_situation(df: pd.DataFrame, situation: dict = None) -> pd.DataFrame:
+    """
+    依比賽情境篩選擊球，例如 {"outs_when_up": 2, "inning_topbot": "Bot"}。
+    值為 list/tuple 時視為「其中之一」；值為 None/NaN 的條件會被忽略。
+    """
+    if not situation:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for col, value in situation.items():
+        if value is None or (np.isscalar(value) and pd.isna(value)):
+            continue
+        if col not in df.columns:
+            raise KeyError(f"擊球資料中沒有情境欄位: {col}")
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        mask &= df[col].isin(values).to_numpy()
+    return df[mask]
+
 def convert_positioning_to_xy(df_pos: pd.DataFrame) -> pd.DataFrame:
     """
     根據使用者定義的座標系（0度朝向中外野），
@@ -65,10 +222,11 @@ def convert_positioning_to_xy(df_pos: pd.DataFrame) -> pd.DataFrame:
 
 # --- 3. 核心特徵計算函式 (已拆分) ---
 
-def calculate_batted_ball_features(df: pd.DataFrame) -> pd.DataFrame:
+def calculate_batted_ball_features(df: pd.DataFrame, flight_model: str = FLIGHT_TIME_MODEL) -> pd.DataFrame:
     """
     【共用函式】接收原始擊球數據，只計算與「球本身」相關的特徵。
     這個函式會被 step_02 和 step_04 共同使用。
+    flight_model 可選 "vacuum" (預設，與現有模型產物一致) 或 "drag"，決定飛行時間的計算方式。
     """
     df_out = df.copy()
 
@@ -97,10 +255,13 @@ def calculate_batted_ball_features(df: pd.DataFrame) -> pd.DataFrame:
     # 計算飛行時間
     required_flight_cols = [COL_LAUNCH_SPEED, COL_LAUNCH_ANGLE]
     if all(c in df_out.columns for c in required_flight_cols):
-        df_out[COL_FLIGHT_TIME] = compute_flight_time(
-            df_out[COL_LAUNCH_SPEED].astype(float).to_numpy(),
-            df_out[COL_LAUNCH_ANGLE].astype(float).to_numpy()
-        )
+        launch_speed = df_out[COL_LAUNCH_SPEED].astype(float).to_numpy()
+        launch_angle = df_out[COL_LAUNCH_ANGLE].astype(float).to_numpy()
+        if flight_model == "drag":
+            ball_ids = make_ball_id(df_out) if all(c in df_out.columns for c in BALL_KEY_COLS) else None
+            df_out[COL_FLIGHT_TIME] = compute_flight_time_drag(launch_speed, launch_angle, ball_ids)
+        else:
+            df_out[COL_FLIGHT_TIME] = compute_flight_time(launch_speed, launch_angle)
     else:
         df_out[COL_FLIGHT_TIME] = np.nan
         
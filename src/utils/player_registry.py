@@ -0,0 +1,295 @@
+# 檔案位置: src/utils/player_registry.py
+# 球員註冊表：以 MLBAM ID 為主鍵，統一管理姓名、守備位置、
+# 模型係數表中的列位置、站位表中的列位置與預設站位，以及打者資料檔。
+
+import json
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+from config import RAW_DATA_DIR, PROCESSED_DATA_DIR, INPUTS_DATA_DIR, MODELS_DIR, RESULTS_DIR
+from src.utils.feature_engineering import (
+    convert_positioning_to_xy, COL_PLAYER_NAME,
+    COL_FIELDER_NAME, COL_FIELDER_X, COL_FIELDER_Y
+)
+from src.utils.catch_kernel import POSITION_CODES
+
+# --- 1. 常數定義區 ---
+REGISTRY_DIR = PROCESSED_DATA_DIR / "player_registry"
+MANIFEST_FILE = "manifest.json"
+BATTER_DIR = INPUTS_DATA_DIR / "batter_spray_charts"
+OPTIMIZATIONS_DIR = RESULTS_DIR / "optimizations"
+
+COL_BATTER_ID = "batter"
+COL_FIELDER_ID = "fielder_id"
+FIELDER_ID_COLS = {"LF": "fielder_7", "CF": "fielder_8", "RF": "fielder_9"}
+# 站位檔案中找不到任何資料時使用的預設站位
+FALLBACK_POSITIONS = {'LF': (-150, 220), 'CF': (0, 250), 'RF': (150, 220)}
+
+# 註冊表的陣列檔 (皆為 .npy，可用 mmap_mode='r' 開啟)
+REGISTRY_ARRAYS = ["ids", "names", "batter_files", "model_rows", "positioning_rows", "default_xy", "position_means"]
+
+# --- 2. 建立註冊表 ---
+def _source_files() -> list:
+    """註冊表所依賴的來源檔案；任何一個比註冊表新時就需要重建。"""
+    sources = [BATTER_DIR]
+    for pos_code in POSITION_CODES:
+        sources.append(RAW_DATA_DIR / f"{pos_code}_positioning.csv")
+        sources.append(MODELS_DIR / pos_code / f"{pos_code}_fused_coefs.npz")
+        sources.append(MODELS_DIR / pos_code / f"{pos_code}_model_trace.nc")
+    return [p for p in sources if p.exists()]
+
+def _fielder_id_from_partition(position_code: str, player_name: str):
+    """從 step_01 的守備員分割檔第一列讀出該守備員的 ID。"""
+    base = player_name.replace(" ", "_").replace(".", "")
+    path = PROCESSED_DATA_DIR / f"{position_code}_original_data" / f"{base}_{position_code}.csv"
+    id_col = FIELDER_ID_COLS[position_code]
+    if not path.exists():
+        return None
+    df = pd.read_csv(path, usecols=lambda c: c == id_col, nrows=1, encoding='utf-8')
+    return int(df[id_col].iloc[0]) if id_col in df.columns and not df.empty else None
+
+def build_player_registry() -> Path:
+    """
+    掃描站位檔、模型係數表與打者檔案，建立以 ID 排序的註冊表陣列並寫入 REGISTRY_DIR。
+    """
+    # 延遲匯入，避免與 step_04 互相匯入
+    from src.optimization.step_04_find_optimal_position import load_fused_params
+
+    print(f"  - 正在建立球員註冊表: {REGISTRY_DIR}")
+    records = {}  # player_id -> dict
+
+    def record(player_id, name):
+        rec = records.setdefault(player_id, {
+            "name": name, "batter_file": "",
+            "model_rows": [-1] * len(POSITION_CODES),
+            "positioning_rows": [-1] * len(POSITION_CODES),
+            "default_xy": [[np.nan, np.nan] for _ in POSITION_CODES],
+        })
+        return rec
+
+    # 1. 站位檔：每位守備員取第一筆 (與原本 load_initial_positions 的 iloc[0] 一致)
+    position_means = np.empty((len(POSITION_CODES), 2))
+    name_to_id = {}
+    for k, pos_code in enumerate(POSITION_CODES):
+        positioning_file = RAW_DATA_DIR / f"{pos_code}_positioning.csv"
+        mean_xy = np.array([np.nan, np.nan])
+        if positioning_file.exists():
+            df_pos_xy = convert_positioning_to_xy(pd.read_csv(positioning_file, encoding='utf-8'))
+            mean_xy = df_pos_xy[[COL_FIELDER_X, COL_FIELDER_Y]].mean().to_numpy(dtype=float)
+            first_rows = df_pos_xy.drop_duplicates(COL_FIELDER_ID)
+            for row_offset, row in zip(first_rows.index, first_rows.itertuples(index=False)):
+                rec = record(int(getattr(row, COL_FIELDER_ID)), getattr(row, COL_FIELDER_NAME))
+                rec["positioning_rows"][k] = int(row_offset)
+                rec["default_xy"][k] = [getattr(row, COL_FIELDER_X), getattr(row, COL_FIELDER_Y)]
+                name_to_id.setdefault(rec["name"], int(getattr(row, COL_FIELDER_ID)))
+        if np.isnan(mean_xy).any():
+            mean_xy = np.array(FALLBACK_POSITIONS[pos_code], dtype=float)
+        position_means[k] = mean_xy
+
+    # 2. 打者檔：檔名只用來「找到」檔案，身分以檔案內的 batter ID 為準
+    for f in sorted(BATTER_DIR.glob("*.csv")):
+        df = pd.read_csv(f, usecols=lambda c: c in (COL_BATTER_ID, COL_PLAYER_NAME), nrows=1, encoding='utf-8')
+        if df.empty or COL_BATTER_ID not in df.columns:
+            continue
+        batter_id = int(df[COL_BATTER_ID].iloc[0])
+        name = df[COL_PLAYER_NAME].iloc[0] if COL_PLAYER_NAME in df.columns else f.stem
+        rec = record(batter_id, name)
+        rec["batter_file"] = f.name
+        name_to_id.setdefault(name, batter_id)
+
+    # 3. 模型係數表：記錄每位球員在各位置係數陣列中的列位置
+    synthetic_id = -1
+    for k, pos_code in enumerate(POSITION_CODES):
+        try:
+            players = load_fused_params(pos_code)['players']
+        except FileNotFoundError:
+            continue
+        for row_offset, name in enumerate(players):
+            player_id = name_to_id.get(name)
+            if player_id is None:
+                player_id = _fielder_id_from_partition(pos_code, name)
+            if player_id is None:
+                # 找不到任何 ID 來源時給一個負數的暫時 ID，仍可被查詢
+                player_id, synthetic_id = synthetic_id, synthetic_id - 1
+            name_to_id.setdefault(name, player_id)
+            record(player_id, name)["model_rows"][k] = row_offset
+
+    # 4. 依 ID 排序後寫成陣列
+    ids = np.array(sorted(records), dtype=np.int64)
+    recs = [records[i] for i in ids]
+    default_xy = np.array([r["default_xy"] for r in recs], dtype=float).reshape(len(ids), len(POSITION_CODES), 2)
+    missing = np.isnan(default_xy).any(axis=2)
+    default_xy[missing] = np.broadcast_to(position_means, default_xy.shape)[missing]
+
+    arrays = {
+        "ids": ids,
+        "names": np.array([r["name"] for r in recs], dtype=str),
+        "batter_files": np.array([r["batter_file"] for r in recs], dtype=str),
+        "model_rows": np.array([r["model_rows"] for r in recs], dtype=np.int32).reshape(len(ids), len(POSITION_CODES)),
+        "positioning_rows": np.array([r["positioning_rows"] for r in recs], dtype=np.int32).reshape(len(ids), len(POSITION_CODES)),
+        "default_xy": default_xy,
+        "position_means": position_means,
+    }
+    REGISTRY_DIR.mkdir(parents=True, exist_ok=True)
+    for key, arr in arrays.items():
+        np.save(REGISTRY_DIR / f"{key}.npy", arr)
+    with open(REGISTRY_DIR / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump({"positions": POSITION_CODES, "num_players": len(ids)}, f)
+    print(f"  - 註冊表建立完成，共 {len(ids)} 位球員。")
+    return REGISTRY_DIR
+
+# --- 3. 查詢介面 ---
+class PlayerRegistry:
+    """
+    以記憶體映射方式載入的球員註冊表。所有查詢皆為雜湊或陣列索引：
+    姓名/ID → 列 (dict)，列 → 模型列位置、站位列位置、預設站位 (陣列索引)。
+    """
+
+    def __init__(self, registry_dir: Path = REGISTRY_DIR, mmap: bool = True):
+        mode = 'r' if mmap else None
+        for key in REGISTRY_ARRAYS:
+            setattr(self, key, np.load(registry_dir / f"{key}.npy", mmap_mode=mode))
+        self._position_idx = {code: k for k, code in enumerate(POSITION_CODES)}
+        self._row_of_id = {int(pid): row for row, pid in enumerate(self.ids)}
+        self._row_of_name = {}
+        for row, name in enumerate(self.names.tolist()):
+            self._row_of_name.setdefault(name, row)
+
+    # 基本查詢
+    def row_of(self, player) -> int:
+        """接受 ID (int) 或姓名 (str)，回傳註冊表中的列；找不到時丟出 KeyError。"""
+        if isinstance(player, (int, np.integer)):
+            return self._row_of_id[int(player)]
+        return self._row_of_name[player]
+
+    def rows_of_ids(self, player_ids) -> np.ndarray:
+        """向量化版本：一批球員 ID -> 註冊表列；不在註冊表中的 ID 為 -1。"""
+        lookup = pd.Series(self._row_of_id, dtype=np.int64)
+        return pd.Series(np.asarray(player_ids, dtype=np.int64)).map(lookup).fillna(-1).to_numpy(dtype=np.int64)
+
+    def id_of(self, player_name: str) -> int:
+        return int(self.ids[self._row_of_name[player_name]])
+
+    def name_of(self, player_id: int) -> str:
+        return str(self.names[self._row_of_id[int(player_id)]])
+
+    def __contains__(self, player) -> bool:
+        try:
+            self.row_of(player)
+            return True
+        except KeyError:
+            return False
+
+    # 守備相關
+    def model_row(self, player, position_code: str) -> int:
+        """該球員在 {pos}_fused_coefs 係數表中的列；沒有模型時為 -1。"""
+        return int(self.model_rows[self.row_of(player), self._position_idx[position_code]])
+
+    def has_positioning(self, player, position_code: str) -> bool:
+        return player in self and self.positioning_rows[self.row_of(player), self._position_idx[position_code]] >= 0
+
+    def default_position(self, player, position_code: str) -> list:
+        """
+        該球員在此位置的預設站位 [x, y]；站位表中沒有他時使用該位置的平均站位。
+        """
+        k = self._position_idx[position_code]
+        if player in self:
+            return self.default_xy[self.row_of(player), k].tolist()
+        return self.position_means[k].tolist()
+
+    def default_positions(self, players: list, position_code: str) -> np.ndarray:
+        """向量化版本，回傳 (球員數, 2)。"""
+        return np.array([self.default_position(p, position_code) for p in players], dtype=float).reshape(len(players), 2)
+
+    # 打者相關
+    def batter_names(self) -> list:
+        return sorted(str(n) for n, f in zip(self.names.tolist(), self.batter_files.tolist()) if f)
+
+    def batter_file(self, player) -> Path:
+        """打者擊球資料檔的路徑 (由 ID 對應，而非由姓名拼出檔名)。"""
+        file_name = str(self.batter_files[self.row_of(player)]) if player in self else ""
+        if not file_name:
+            raise FileNotFoundError(f"在球員註冊表中找不到打者 '{player}' 的資料檔。")
+        return BATTER_DIR / file_name
+
+_REGISTRY_CACHE = {}
+
+def get_player_registry(rebuild: bool = False) -> PlayerRegistry:
+    """
+    取得 (並快取) 球員註冊表；尚未建立或來源檔案有更新時會自動重建。
+    """
+    manifest = REGISTRY_DIR / MANIFEST_FILE
+    stale = not manifest.exists() or any(p.stat().st_mtime > manifest.stat().st_mtime for p in _source_files())
+    if rebuild or stale:
+        build_player_registry()
+        _REGISTRY_CACHE.clear()
+    if "registry" not in _REGISTRY_CACHE:
+        _REGISTRY_CACHE["registry"] = PlayerRegistry()
+    return _REGISTRY_CACHE["registry"]
+
+# --- 4. 共用的路徑與站位函式 ---
+def _legacy_team_stem(fielder_names: dict) -> str:
+    return f"LF_{fielder_names['LF']}_CF_{fielder_names['CF']}_RF_{fielder_names['RF']}".replace(" ", "_").replace(",", "")
+
+def _legacy_matchup_stem(batter_name: str, fielder_names: dict) -> str:
+    batter_str = batter_name.replace(" ", "_").replace(",", "")
+    return f"{batter_str}_vs_{_legacy_team_stem(fielder_names)}"
+
+def team_stem(fielder_names: dict) -> str:
+    """
+    外野三人組的檔名主幹，以球員 ID 組成 (例: LF_677951_CF_671739_RF_660670)，與 matchup_stem 的後半段相同。
+    若有球員不在註冊表中，退回姓名拼接規則。
+    """
+    registry = get_player_registry()
+    names = [fielder_names[p] for p in POSITION_CODES]
+    if not all(n in registry for n in names):
+        return _legacy_team_stem(fielder_names)
+    return "_".join(f"{p}_{registry.id_of(n)}" for p, n in zip(POSITION_CODES, names))
+
+def matchup_stem(batter_name: str, fielder_names: dict) -> str:
+    """
+    對戰組合的檔名主幹，以球員 ID 組成 (例: 680757_vs_LF_677951_CF_671739_RF_660670)。
+    若有球員不在註冊表中，退回舊的姓名拼接規則。
+    """
+    registry = get_player_registry()
+    players = [batter_name] + [fielder_names[p] for p in POSITION_CODES]
+    if not all(p in registry for p in players):
+        return _legacy_matchup_stem(batter_name, fielder_names)
+    ids = [registry.id_of(p) for p in players]
+    return f"{ids[0]}_vs_LF_{ids[1]}_CF_{ids[2]}_RF_{ids[3]}"
+
+def optimization_result_path(batter_name: str, fielder_names: dict, for_write: bool = False) -> Path:
+    """
+    最佳站位 JSON 的路徑。寫入 (for_write=True) 一律使用 ID 命名；
+    讀取時若只有舊的姓名命名檔案，沿用舊檔。
+    """
+    path = OPTIMIZATIONS_DIR / f"{matchup_stem(batter_name, fielder_names)}_optimal.json"
+    if for_write:
+        return path
+    legacy = OPTIMIZATIONS_DIR / f"{_legacy_matchup_stem(batter_name, fielder_names)}_optimal.json"
+    return legacy if not path.exists() and legacy.exists() else path
+
+def batter_file_path(batter_name: str) -> Path:
+    """打者資料檔路徑：優先由註冊表以 ID 對應，找不到時退回 '{姓名}.csv'。"""
+    try:
+        return get_player_registry().batter_file(batter_name)
+    except (FileNotFoundError, KeyError):
+        return BATTER_DIR / f"{batter_name}.csv"
+
+def load_initial_positions(fielder_names: dict) -> dict:
+    """
+    從註冊表取得指定球員的預設 (平均) 站位 XY 座標，不必重讀站位檔。
+    """
+    for pos_code in fielder_names:
+        positioning_file = RAW_DATA_DIR / f"{pos_code}_positioning.csv"
+        if not positioning_file.exists():
+            raise FileNotFoundError(f"找不到初始站位檔案: {positioning_file}")
+
+    registry = get_player_registry()
+    initial_positions = {}
+    for pos_code, player_name in fielder_names.items():
+        if not registry.has_positioning(player_name, pos_code):
+            print(f"[警告] 在 {pos_code}_positioning.csv 中找不到球員 '{player_name}' 的初始站位。將使用該位置的平均站位。")
+        initial_positions[pos_code] = registry.default_position(player_name, pos_code)
+    return initial_positions
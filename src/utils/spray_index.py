@@ -0,0 +1,237 @@
+# 檔案位置: src/utils/spray_index.py
+# 擊球分佈 (spray chart) 相似度索引：把每位打者的擊球壓成緊湊的「角度 × 距離」直方圖向量，
+# 記錄已解過的最佳站位，供 step_04 以最相似的已解打者 (與相同外野組合) 的結果作為最佳化起點。
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from config import RESULTS_DIR
+from src.utils.catch_kernel import POSITION_CODES
+
+# --- 1. 常數定義區 ---
+SPRAY_INDEX_FILE = RESULTS_DIR / "spray_index.jsonl"
+# 直方圖分箱：角度以中外野方向為 0 度 (與 step_04 的扇形約束一致)，超出範圍的球歸入最外側的箱
+ANGLE_BIN_EDGES = np.linspace(-45.0, 45.0, 10)
+DIST_BIN_EDGES = np.array([0.0, 150.0, 200.0, 250.0, 300.0, 350.0, 400.0, 550.0])
+EMBEDDING_DIM = (len(ANGLE_BIN_EDGES) - 1) * (len(DIST_BIN_EDGES) - 1)
+# 最近鄰的距離上限 (Hellinger 距離，範圍 0 ~ √2)；超過就不當作起點，改用固定的初始猜測點
+MAX_WARM_START_DISTANCE = 0.6
+# 索引矩陣的初始容量 (列數)，不足時倍增
+INITIAL_CAPACITY = 1024
+
+# --- 2. 嵌入向量 ---
+def spray_embedding(ball_x, ball_y, weights=None) -> np.ndarray:
+    """
+    擊球落點 (ft) -> 正規化的角度 × 距離直方圖，取平方根後攤平成一維向量。
+    取平方根後向量的歐氏距離等於兩個分佈的 Hellinger 距離 (再乘上常數)，球數不同的打者也能直接比較。
+    weights 為每顆球的權重 (例如多位打者加權混合時)。
+    """
+    ball_x, ball_y = np.asarray(ball_x, dtype=float), np.asarray(ball_y, dtype=float)
+    angle = np.clip(np.degrees(np.arctan2(ball_x, ball_y)), ANGLE_BIN_EDGES[0], ANGLE_BIN_EDGES[-1])
+    dist = np.clip(np.hypot(ball_x, ball_y), DIST_BIN_EDGES[0], DIST_BIN_EDGES[-1])
+    hist, _, _ = np.histogram2d(angle, dist, bins=[ANGLE_BIN_EDGES, DIST_BIN_EDGES], weights=weights)
+    total = hist.sum()
+    if total > 0:
+        hist /= total
+    return np.sqrt(hist).ravel().astype(np.float32)
+
+def _trio_key(fielder_names: dict) -> str:
+    return "|".join(str(fielder_names[p]) for p in POSITION_CODES)
+
+def _situation_key(situation: dict = None) -> str:
+    return json.dumps(situation, sort_keys=True, ensure_ascii=False) if situation else ""
+
+# --- 3. 索引 ---
+class SprayIndex:
+    """
+    已解對戰組合的索引。資料來源為只附加的 SPRAY_INDEX_FILE (每行一筆 JSON)，
+    多個行程 (例如批次工作的 worker) 可以同時附加；每次查詢前只解析上次讀到的位置之後新附加的行，
+    檔案被重建 (換了一個檔案或變短) 時才整份重新載入。
+    查詢為在 (筆數, EMBEDDING_DIM) 的 float32 矩陣上一次算完所有距離；矩陣預先配置、容量不足時倍增。
+    """
+
+    def __init__(self, path: Path = SPRAY_INDEX_FILE):
+        self.path = Path(path)
+        self._reset(None)
+
+    def _reset(self, file_id):
+        self._file_id, self._loaded_size = file_id, 0
+        self._rows = {}     # (打者, 外野組合, 情境) -> 矩陣中的列
+        self._codes = {}    # 打者 / 外野組合名稱 -> 整數代碼，查詢時以向量比較
+        self._n = 0
+        self._embeddings = np.empty((INITIAL_CAPACITY, EMBEDDING_DIM), dtype=np.float32)
+        self._positions = np.empty((INITIAL_CAPACITY, 6))
+        self._batter_codes = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self._trio_codes = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self.batters, self.trios, self.situations = [], [], []
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._embeddings[:self._n]
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions[:self._n]
+
+    def _code(self, name: str) -> int:
+        return self._codes.setdefault(name, len(self._codes))
+
+    def _upsert(self, entry: dict):
+        key = (entry["batter"], entry["trio"], entry.get("situation", ""))
+        row = self._rows.get(key)
+        if row is None:
+            # 同一組 (打者, 外野組合, 情境) 只保留最新的解；新的組合才佔用新的一列
+            if self._n == len(self._embeddings):
+                grow = lambda a: np.concatenate([a, np.empty_like(a)])
+                self._embeddings, self._positions = grow(self._embeddings), grow(self._positions)
+                self._batter_codes, self._trio_codes = grow(self._batter_codes), grow(self._trio_codes)
+            row, self._rows[key] = self._n, self._n
+            self._n += 1
+            self.batters.append(key[0])
+            self.trios.append(key[1])
+            self.situations.append(key[2])
+            self._batter_codes[row] = self._code(key[0])
+            self._trio_codes[row] = self._code(key[1])
+        self._embeddings[row] = entry["embedding"]
+        self._positions[row] = entry["positions"]
+
+    def refresh(self):
+        try:
+            stat = self.path.stat()
+            file_id, size = (stat.st_dev, stat.st_ino), stat.st_size
+        except FileNotFoundError:
+            file_id, size = None, 0
+        if file_id != self._file_id or size < self._loaded_size:
+            self._reset(file_id)  # 索引檔被重建 (rebuild_spray_index 以 os.replace 換檔)
+        if size <= self._loaded_size:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._loaded_size)
+            chunk = f.read(size - self._loaded_size)
+        # 其他行程正在寫入、還沒有換行的最後一行留到下次再讀
+        complete = chunk.rfind(b"\n") + 1
+        for line in chunk[:complete].splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if len(entry.get("embedding", [])) != EMBEDDING_DIM:
+                continue  # 分箱設定改變前留下的舊紀錄
+            self._upsert(entry)
+        self._loaded_size += complete
+
+    def __len__(self) -> int:
+        self.refresh()
+        return self._n
+
+    def record(self, batter_name: str, fielder_names: dict, embedding, positions, situation: dict = None):
+        """附加一筆已解的最佳站位 ([lf_x, lf_y, cf_x, cf_y, rf_x, rf_y])。"""
+        entry = {"batter": batter_name, "trio": _trio_key(fielder_names), "situation": _situation_key(situation),
+                 "embedding": np.round(np.asarray(embedding, dtype=float), 5).tolist(),
+                 "positions": np.round(np.asarray(positions, dtype=float).ravel(), 3).tolist()}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 整行一次寫入 (O_APPEND)，多個行程同時附加也不會交錯
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def nearest(self, embedding, fielder_names: dict = None, k: int = 1, exclude_batter: str = None,
+                max_distance: float = None) -> pd.DataFrame:
+        """
+        回傳最相似的 k 筆紀錄 (batter, trio, situation, distance, same_trio, positions)。
+        有相同外野組合的紀錄時優先 (站位同時取決於守備員的能力)，否則在所有紀錄中找。
+        max_distance 以上的紀錄不列入候選。
+        """
+        self.refresh()
+        if not self._n:
+            return pd.DataFrame(columns=["batter", "trio", "situation", "distance", "same_trio", "positions"])
+        dist = np.sqrt(np.sum((self.embeddings - np.asarray(embedding, dtype=np.float32)) ** 2, axis=1))
+        trio_code = self._codes.get(_trio_key(fielder_names), -1) if fielder_names else -1
+        same_trio = self._trio_codes[:self._n] == trio_code
+        if exclude_batter is not None:
+            dist = np.where(self._batter_codes[:self._n] == self._codes.get(exclude_batter, -1), np.inf, dist)
+        if max_distance is not None:
+            dist = np.where(dist <= max_distance, dist, np.inf)
+        # 相同外野組合的紀錄排在前面，各自再依距離排序
+        order = np.lexsort((dist, ~same_trio))
+        order = order[np.isfinite(dist[order])][:k]
+        return pd.DataFrame({
+            "batter": [self.batters[i] for i in order], "trio": [self.trios[i] for i in order],
+            "situation": [self.situations[i] for i in order], "distance": dist[order],
+            "same_trio": same_trio[order], "positions": [self.positions[i] for i in order],
+        })
+
+_INDEX_CACHE = {}
+
+def get_spray_index() -> SprayIndex:
+    """取得 (並快取) 本行程的索引物件；每次查詢前會自動載入其他行程新附加的紀錄。"""
+    if "index" not in _INDEX_CACHE:
+        _INDEX_CACHE["index"] = SprayIndex()
+    return _INDEX_CACHE["index"]
+
+def find_warm_start(embedding, fielder_names: dict, max_distance: float = MAX_WARM_START_DISTANCE,
+                    exclude_batter: str = None) -> dict:
+    """
+    找出可作為最佳化起點的已解站位。優先使用相同外野組合中最相似的打者；
+    相同組合中沒有夠近的紀錄時，才退而使用其他組合中最相似的紀錄。
+
+    Returns:
+        dict: {"batter", "trio", "distance", "same_trio", "positions" (6 維)}；找不到夠近的紀錄時回傳 None。
+    """
+    candidates = get_spray_index().nearest(embedding, fielder_names, k=1, exclude_batter=exclude_batter,
+                                           max_distance=max_distance)
+    if candidates.empty:
+        return None
+    best = candidates.iloc[0]
+    return {"batter": best["batter"], "trio": best["trio"], "distance": float(best["distance"]),
+            "same_trio": bool(best["same_trio"]), "positions": np.asarray(best["positions"], dtype=float)}
+
+# --- 4. 從既有的最佳化結果重建 ---
+def rebuild_spray_index(optimizations_dir: Path = None) -> int:
+    """
+    掃描既有的 *_optimal.json (以 ID 命名者)，重新計算打者的嵌入向量並重寫索引檔。
+    舊的姓名命名檔案無法可靠地還原球員，會被略過。回傳寫入的筆數。
+    """
+    from src.utils.feature_engineering import calculate_batted_ball_features, COL_X_COORD, COL_Y_COORD
+    from src.utils.player_registry import get_player_registry, OPTIMIZATIONS_DIR
+
+    optimizations_dir = Path(optimizations_dir or OPTIMIZATIONS_DIR)
+    registry = get_player_registry()
+    tmp = SPRAY_INDEX_FILE.with_name(f".{SPRAY_INDEX_FILE.name}.{os.getpid()}.tmp")
+    index = SprayIndex(tmp)
+    tmp.unlink(missing_ok=True)
+    embeddings, count = {}, 0
+    for f in sorted(optimizations_dir.glob("*_vs_LF_*_CF_*_RF_*_optimal.json")):
+        parts = f.name[:-len("_optimal.json")].split("_")
+        try:
+            batter_id, fielder_ids = int(parts[0]), {parts[i]: int(parts[i + 1]) for i in (2, 4, 6)}
+            batter_name = registry.name_of(batter_id)
+            fielder_names = {p: registry.name_of(fielder_ids[p]) for p in POSITION_CODES}
+        except (ValueError, KeyError, IndexError):
+            continue
+        if batter_name not in embeddings:
+            try:
+                df = calculate_batted_ball_features(pd.read_csv(registry.batter_file(batter_id), encoding='utf-8'))
+            except (FileNotFoundError, KeyError):
+                continue
+            df = df.dropna(subset=[COL_X_COORD, COL_Y_COORD])
+            embeddings[batter_name] = spray_embedding(df[COL_X_COORD], df[COL_Y_COORD])
+        with open(f, 'r', encoding='utf-8') as fh:
+            solved = json.load(fh)
+        index.record(batter_name, fielder_names, embeddings[batter_name], [solved[p] for p in POSITION_CODES])
+        count += 1
+    SPRAY_INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+    if tmp.exists():
+        os.replace(tmp, SPRAY_INDEX_FILE)
+    _INDEX_CACHE.clear()
+    print(f"  - 擊球分佈索引已重建：{count} 筆已解的對戰組合，{len(embeddings)} 位打者。")
+    return count
+
+
+if __name__ == "__main__":
+    rebuild_spray_index()
@@ -0,0 +1,250 @@
+# 檔案位置: src/utils/stream_runner.py
+# 常駐的管線模式：從 stdin 或檔案逐行讀入 JSONL 對戰請求 (打者 × 外野組合 × 情境)，
+# 在有上限的行程池中求解，每完成一個請求就寫出一行 JSONL 結果。
+# 模型係數只發佈一次 (資料平面)，打者特徵與外野組合係數在每個行程內快取，
+# 同一外野組合的請求集中送出，讓吞吐量只受最佳化器本身限制，而不是每次的啟動與載入。
+
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import contextlib
+import numpy as np
+import pandas as pd
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, Future, FIRST_COMPLETED, wait
+
+from src.utils.catch_kernel import TeamCatchKernel, POSITION_CODES
+from src.utils.feature_engineering import calculate_batted_ball_features, filter_by_situation, COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME
+from src.utils.data_plane import DataPlane, publish_fused_coefs
+from src.utils.sweep_runner import TASK_FIELDER_COLS, make_task_id, _to_builtin, _warm_up_shared_artifacts
+
+# --- 1. 常數定義區 ---
+STREAM_BATTER_CACHE = 256   # 每個行程保留的打者特徵表數量 (LRU)
+STREAM_TRIO_CACHE = 64      # 每個行程保留的外野組合係數數量 (LRU)
+STREAM_QUEUE_FACTOR = 2     # 同時送進行程池的請求數 = 行程數 × 此倍數
+STREAM_POLL_S = 0.05        # 行程池忙碌時檢查新輸入的間隔 (秒)
+
+# --- 2. 請求解析 ---
+def parse_request(line: str) -> dict:
+    """
+    解析一行請求。欄位: batter；外野手以 "fielders": {"LF", "CF", "RF"} 或
+    lf_player / cf_player / rf_player 提供；可選 "situation" (見 filter_by_situation)、
+    "mode" ("slsqp" / "polar") 與 "id" (省略時以內容雜湊產生，與批次工作的 task_id 相同)。
+    """
+    raw = json.loads(line)
+    if not isinstance(raw, dict):
+        raise ValueError("請求必須是 JSON 物件")
+    fielders = raw.get("fielders") or {pos: raw.get(col) for pos, col in TASK_FIELDER_COLS.items()}
+    missing = [pos for pos in POSITION_CODES if not fielders.get(pos)]
+    if not raw.get("batter") or missing:
+        raise ValueError(f"請求缺少打者或外野手: {['batter'] if not raw.get('batter') else []}{missing}")
+    request = {"batter": raw["batter"], "fielders": {pos: fielders[pos] for pos in POSITION_CODES},
+               "situation": raw.get("situation") or {}}
+    request["id"] = raw.get("id", make_task_id(request))
+    request["mode"] = raw.get("mode")
+    return request
+
+def _trio_key(fielders: dict) -> tuple:
+    return tuple(fielders[pos] for pos in POSITION_CODES)
+
+# --- 3. 行程內快取與求解 (在子行程中執行) ---
+_BATTER_FEATURES = OrderedDict()
+_TRIO_COEFS = OrderedDict()
+
+def _cached(cache: OrderedDict, key, max_size: int, build):
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = cache[key] = build()
+    if len(cache) > max_size:
+        cache.popitem(last=False)
+    return value
+
+def _load_batter_features(batter_name: str):
+    from src.utils.player_registry import batter_file_path
+    df = calculate_batted_ball_features(pd.read_csv(batter_file_path(batter_name), encoding='utf-8'))
+    return df.dropna(subset=[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME])
+
+def _load_trio_coefs(fielders: dict) -> np.ndarray:
+    from src.optimization.step_04_find_optimal_position import load_fused_params, load_fused_player_coefs
+    return np.stack([load_fused_player_coefs(load_fused_params(pos), fielders[pos]) for pos in POSITION_CODES])
+
+def solve_request(request: dict, warm_start: bool = None) -> dict:
+    """
+    求解單一請求，回傳一筆可直接寫成 JSON 的結果:
+    {"id", "batter", "fielders", "situation", "status" ("ok" / "not_converged" / "error"),
+     "positions", "expected_catches", "n_balls", "n_iterations", "warm_start_from", "elapsed_ms", ["error"]}。
+    成功且未指定情境時，與 --optimize 相同地寫入共用的最佳站位 JSON 並記入擊球分佈索引。
+    """
+    from src.optimization.step_04_find_optimal_position import (
+        solve_team_positions, pick_initial_guess, INITIAL_GUESS, USE_WARM_START)
+    from src.utils.player_registry import optimization_result_path
+    from src.utils.spray_index import spray_embedding, get_spray_index
+
+    start = time.perf_counter()
+    out = {key: request[key] for key in ("id", "batter", "fielders", "situation")}
+    try:
+        batter_df = _cached(_BATTER_FEATURES, request["batter"], STREAM_BATTER_CACHE,
+                            lambda: _load_batter_features(request["batter"]))
+        batter_df = filter_by_situation(batter_df, request["situation"])
+        if batter_df.empty:
+            raise ValueError("沒有可用於最佳化的擊球數據")
+        coefs = _cached(_TRIO_COEFS, _trio_key(request["fielders"]), STREAM_TRIO_CACHE,
+                        lambda: _load_trio_coefs(request["fielders"]))
+        kernel = TeamCatchKernel(batter_df[COL_X_COORD].to_numpy(), batter_df[COL_Y_COORD].to_numpy(),
+                                 batter_df[COL_FLIGHT_TIME].to_numpy(), coefs)
+        initial_guess, warm = INITIAL_GUESS, None
+        if USE_WARM_START if warm_start is None else warm_start:
+            initial_guess, warm = pick_initial_guess(kernel, request["fielders"])
+        xy, result = solve_team_positions(kernel, request["mode"], initial_guess=initial_guess)
+
+        positions = {pos: [float(xy[2 * k]), float(xy[2 * k + 1])] for k, pos in enumerate(POSITION_CODES)}
+        out.update({"status": "ok" if result.success else "not_converged", "positions": positions,
+                    "expected_catches": float(kernel.expected_catches(xy)), "n_balls": int(kernel.n_balls),
+                    "n_iterations": int(result.nit), "warm_start_from": warm["batter"] if warm else None})
+        if result.success:
+            get_spray_index().record(request["batter"], request["fielders"],
+                                     spray_embedding(kernel.ball_x, kernel.ball_y), xy, request["situation"])
+            if not request["situation"]:
+                output_path = optimization_result_path(request["batter"], request["fielders"], for_write=True)
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(output_path, 'w') as f:
+                    json.dump(positions, f, indent=4)
+    except Exception as e:  # 單一請求失敗不應中斷整個串流
+        out.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    out["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return out
+
+def _init_stream_worker(plane: DataPlane):
+    """子行程初始化：附加係數資料平面，並把 stdout 導向 stderr，避免任何輸出混進結果串流。"""
+    from src.optimization.step_04_find_optimal_position import attach_fused_params_plane
+    sys.stdout = sys.stderr
+    attach_fused_params_plane(plane)
+
+def _completed_future(fn, *args) -> Future:
+    """單一行程模式：在本行程內立即執行，包成已完成的 Future，與行程池共用同一套流程。"""
+    fut = Future()
+    fut.set_result(fn(*args))
+    return fut
+
+# --- 4. 主流程 ---
+def _read_lines(source, lines: queue.Queue):
+    for line_no, line in enumerate(source, 1):
+        lines.put((line_no, line))
+    lines.put(None)
+
+def run_stream(source: str = None, output: str = None, workers: int = None, warm_start: bool = None) -> dict:
+    """
+    管線模式主迴圈：邊讀入請求邊求解，結果依完成順序逐行寫出 (每行都會 flush)。
+
+    輸入可以是持續寫入的管線；已讀入但尚未送出的請求依外野組合分組，
+    送出時優先延續目前的組合，使子行程的係數與打者快取保持命中。
+    無法解析的行輸出 {"line", "status": "error", "error"}。進度與統計一律寫到 stderr。
+
+    Args:
+        source (str): JSONL 請求檔；None 或 "-" 代表 stdin。
+        output (str): 結果檔；None 或 "-" 代表 stdout。
+        workers (int): 行程數 (預設為 CPU 核心數)；1 代表在本行程內依序求解。
+
+    Returns:
+        dict: {"n_requests", "n_ok", "n_not_converged", "n_errors", "elapsed_s", "requests_per_min"}。
+    """
+    workers = workers or os.cpu_count() or 1
+    in_file = sys.stdin if source in (None, "-") else open(source, 'r', encoding='utf-8')
+    out_file = sys.stdout if output in (None, "-") else open(output, 'a', encoding='utf-8')
+    counts = {"ok": 0, "not_converged": 0, "error": 0}
+
+    def emit(result: dict):
+        counts[result["status"]] += 1
+        out_file.write(json.dumps(result, ensure_ascii=False, default=_to_builtin) + "\n")
+        out_file.flush()
+
+    lines = queue.Queue()
+    threading.Thread(target=_read_lines, args=(in_file, lines), daemon=True).start()
+    pending = OrderedDict()     # 外野組合 -> 尚未送出的請求
+    in_flight = {}
+    current_trio, eof = None, False
+    start = time.time()
+
+    with contextlib.redirect_stdout(sys.stderr), contextlib.ExitStack() as stack:
+        print("==========================================")
+        print(f"開始管線模式 (使用 {workers} 個行程)，等待 JSONL 請求...")
+        print("==========================================")
+        _warm_up_shared_artifacts()
+        if workers > 1:
+            plane = stack.enter_context(DataPlane.create("stream"))
+            publish_fused_coefs(plane)
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers, initializer=_init_stream_worker,
+                                                           initargs=(plane,)))
+            submit = pool.submit
+        else:
+            submit = _completed_future
+
+        try:
+            while True:
+                # 讀入目前可用的所有請求；完全沒有工作時才阻塞等待輸入
+                block = not (in_flight or pending or eof)
+                while not eof:
+                    try:
+                        item = lines.get(block=block)
+                    except queue.Empty:
+                        break
+                    block = False
+                    if item is None:
+                        eof = True
+                        break
+                    line_no, line = item
+                    if not line.strip():
+                        continue
+                    try:
+                        request = parse_request(line)
+                    except ValueError as e:   # json.JSONDecodeError 也是 ValueError
+                        emit({"line": line_no, "status": "error", "error": f"{type(e).__name__}: {e}"})
+                        continue
+                    pending.setdefault(_trio_key(request["fielders"]), deque()).append(request)
+
+                while len(in_flight) < STREAM_QUEUE_FACTOR * workers and pending:
+                    if current_trio not in pending:
+                        current_trio = next(iter(pending))
+                    group = pending[current_trio]
+                    request = group.popleft()
+                    if not group:
+                        del pending[current_trio]
+                    in_flight[submit(solve_request, request, warm_start)] = request
+
+                if not in_flight:
+                    if eof and not pending:
+                        break
+                    continue
+                finished, _ = wait(in_flight, timeout=STREAM_POLL_S, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    request = in_flight.pop(fut)
+                    try:
+                        emit(fut.result())
+                    except Exception as e:
+                        emit({**{k: request[k] for k in ("id", "batter", "fielders", "situation")},
+                              "status": "error", "error": f"{type(e).__name__}: {e}"})
+        except KeyboardInterrupt:
+            print(f"\n⚠️ [警告] 已中斷；{len(in_flight) + sum(len(g) for g in pending.values())} 個請求未完成。")
+            raise
+        finally:
+            if out_file is not sys.stdout:
+                out_file.close()
+
+        elapsed = time.time() - start
+        n_requests = sum(counts.values())
+        stats = {"n_requests": n_requests, "n_ok": counts["ok"], "n_not_converged": counts["not_converged"],
+                 "n_errors": counts["error"], "elapsed_s": round(elapsed, 2),
+                 "requests_per_min": round(n_requests / max(elapsed, 1e-9) * 60, 1)}
+        print(f"\n--- ✅ 管線模式結束：{n_requests} 個請求 (成功 {counts['ok']}、未收斂 {counts['not_converged']}、"
+              f"失敗 {counts['error']})，{stats['requests_per_min']:.1f} 請求/分 ---")
+    if in_file is not sys.stdin:
+        in_file.close()
+    return stats
+
+
+if __name__ == "__main__":
+    run_stream(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,352 @@
+# 檔案位置: src/utils/sweep_runner.py
+# 可中斷、可分片的批次執行器：把大量 (打者 × 外野組合 × 情境) 的 step_04 / step_07 任務
+# 分給本機多個行程或多台機器 (共用同一個資料夾) 執行，每完成一個任務就原子性地寫入檢查點。
+
+import os
+import io
+import json
+import time
+import socket
+import uuid
+import hashlib
+import contextlib
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from config import RESULTS_DIR
+from src.utils.data_plane import DataPlane, publish_fused_coefs
+
+# --- 1. 常數定義區 ---
+SWEEPS_DIR = RESULTS_DIR / "sweeps"
+DONE_SUBDIR = "done"        # 每個完成的任務一個 {task_id}.json
+FAILED_SUBDIR = "failed"    # 失敗的任務 (預設不重試)
+CLAIMS_SUBDIR = "claims"    # 執行中的任務認領檔，跨機器時避免重複執行
+TASKS_FILE = "tasks.json"
+RESULTS_FILE = "results.jsonl"
+
+# 任務清單 CSV 的必要欄位；其餘欄位一律視為比賽情境篩選條件 (見 filter_by_situation)
+COL_TASK_BATTER = "batter"
+TASK_FIELDER_COLS = {"LF": "lf_player", "CF": "cf_player", "RF": "rf_player"}
+
+# 認領檔超過此秒數沒有完成，視為該機器已中斷，可由其他人接手
+CLAIM_TIMEOUT_S = 6 * 3600
+# 進度回報的最小間隔 (秒)
+PROGRESS_INTERVAL_S = 10.0
+JOB_TYPES = ("optimize", "compare")
+
+# --- 2. 任務清單 ---
+def make_task_id(task: dict) -> str:
+    """以任務內容 (打者、外野組合、情境) 的雜湊作為穩定 ID，重新執行或換機器都不變。"""
+    key = json.dumps([task["batter"], task["fielders"], task["situation"]], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def load_sweep_tasks(task_csv) -> list:
+    """
+    讀取任務清單 CSV：batter, lf_player, cf_player, rf_player，以及任意情境欄位
+    (例如 outs_when_up、inning_topbot)；情境欄位留白代表不篩選。
+    """
+    df = pd.read_csv(task_csv, encoding='utf-8')
+    required = [COL_TASK_BATTER] + list(TASK_FIELDER_COLS.values())
+    missing = [c for c in required if c not in df.columns]
+    if missing:
+        raise ValueError(f"任務清單缺少必要欄位: {missing}")
+    situation_cols = [c for c in df.columns if c not in required]
+
+    tasks, seen = [], set()
+    for row in df.to_dict('records'):
+        situation = {c: _to_builtin(row[c]) for c in situation_cols if not pd.isna(row[c])}
+        task = {"batter": row[COL_TASK_BATTER],
+                "fielders": {pos: row[col] for pos, col in TASK_FIELDER_COLS.items()},
+                "situation": situation}
+        task["task_id"] = make_task_id(task)
+        if task["task_id"] not in seen:
+            seen.add(task["task_id"])
+            tasks.append(task)
+    return tasks
+
+def _to_builtin(value):
+    """把 numpy 純量轉成 Python 內建型別；整數值的浮點數 (CSV 讀入的 2.0) 轉回 int。"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+# --- 3. 檢查點與認領 ---
+def _atomic_write_json(path: Path, payload):
+    """先寫到同目錄的暫存檔再 os.replace，中斷時不會留下寫到一半的檔案。"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, default=_to_builtin)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class SweepCheckpoint:
+    """一個批次工作的資料夾：完成/失敗的任務與認領檔都是獨立的小檔案，可安全地跨機器共用。"""
+
+    def __init__(self, sweep_dir: Path):
+        self.dir = Path(sweep_dir)
+        self.done_dir = self.dir / DONE_SUBDIR
+        self.failed_dir = self.dir / FAILED_SUBDIR
+        self.claims_dir = self.dir / CLAIMS_SUBDIR
+        for d in (self.done_dir, self.failed_dir, self.claims_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        self.host = socket.gethostname()
+        self.token = uuid.uuid4().hex
+        self._held = {}   # 本行程持有的認領檔 {task_id: 路徑}
+
+    def completed_ids(self) -> set:
+        return {p.stem for p in self.done_dir.glob("*.json")}
+
+    def failed_ids(self) -> set:
+        return {p.stem for p in self.failed_dir.glob("*.json")}
+
+    def _claim_generations(self, task_id: str) -> list:
+        gens = []
+        for path in self.claims_dir.glob(f"{task_id}.claim.*"):
+            suffix = path.name.rsplit(".", 1)[1]
+            if suffix.isdigit():
+                gens.append(int(suffix))
+        return sorted(gens)
+
+    def try_claim(self, task_id: str) -> bool:
+        """
+        認領檔依世代編號 ({task_id}.claim.{n})，最新一代的持有者才是任務的認領者。
+        已被認領時，只有在最新一代的行程已結束或逾時時，才建立下一代接手。
+        每一代都以 os.link 原子性地建立 (目標已存在即失敗)，多台機器同時判定過期時只有一個能接手；
+        接手不需要刪除別人的認領檔，不會誤刪剛建立的新認領。
+        """
+        gens = self._claim_generations(task_id)
+        if gens and not self._claim_is_stale(self.claims_dir / f"{task_id}.claim.{gens[-1]}"):
+            return False
+        path = self.claims_dir / f"{task_id}.claim.{gens[-1] + 1 if gens else 0}"
+        # 內容先寫進暫存檔再連結到認領檔的位置，其他人不會讀到寫到一半的認領檔
+        tmp = self.claims_dir / f".{path.name}.{self.token}.tmp"
+        tmp.write_text(f"{self.host} {os.getpid()} {time.time():.0f} {self.token}")
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return False
+        finally:
+            tmp.unlink(missing_ok=True)
+        self._held[task_id] = path
+        # 被取代的舊世代已不再有效，順手清掉
+        for gen in gens:
+            (self.claims_dir / f"{task_id}.claim.{gen}").unlink(missing_ok=True)
+        return True
+
+    def _claim_is_stale(self, path: Path) -> bool:
+        try:
+            host, pid, claimed_at = path.read_text().split()[:3]
+        except (FileNotFoundError, ValueError):
+            return True
+        if host == self.host and not _pid_alive(int(pid)):
+            return True
+        return time.time() - float(claimed_at) > CLAIM_TIMEOUT_S
+
+    def release(self, task_id: str):
+        """只移除本行程自己的認領檔；已被其他人接手的新世代不受影響。"""
+        path = self._held.pop(task_id, None)
+        if path is not None:
+            path.unlink(missing_ok=True)
+
+    def release_all(self):
+        for task_id in list(self._held):
+            self.release(task_id)
+
+    def mark_done(self, task: dict, result):
+        _atomic_write_json(self.done_dir / f"{task['task_id']}.json", {**task, "result": result})
+        (self.failed_dir / f"{task['task_id']}.json").unlink(missing_ok=True)
+        self.release(task["task_id"])
+
+    def mark_failed(self, task: dict, error: str):
+        _atomic_write_json(self.failed_dir / f"{task['task_id']}.json", {**task, "error": error})
+        self.release(task["task_id"])
+
+# --- 4. 工作函式 (在子行程中執行) ---
+def _run_task(job: str, task: dict, quiet: bool = True) -> tuple:
+    """執行單一任務，回傳 (結果, 錯誤訊息)。各步驟的詳細輸出在平行執行時會被收起來。"""
+    from src.optimization.step_04_find_optimal_position import run_team_optimization
+    from src.evaluation.step_07_compare_initial_vs_optimal import compare_initial_vs_optimal
+
+    func = run_team_optimization if job == "optimize" else compare_initial_vs_optimal
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log) if quiet else contextlib.nullcontext():
+            result = func(task["batter"], task["fielders"], situation=task["situation"] or None)
+    except Exception as e:  # 單一任務失敗不應中斷整個批次
+        return None, f"{type(e).__name__}: {e}"
+    if result is None:
+        errors = [line for line in log.getvalue().splitlines() if "錯誤" in line]
+        return None, errors[-1].strip() if errors else "任務未回傳結果"
+    return result, None
+
+# --- 5. 主流程 ---
+def _warm_up_shared_artifacts():
+    """在啟動子行程前，先於主行程建好球員註冊表與融合係數檔，避免多個子行程同時重建。"""
+    from src.utils.player_registry import get_player_registry
+    from src.optimization.step_04_find_optimal_position import load_fused_params
+    from src.utils.catch_kernel import POSITION_CODES
+
+    get_player_registry()
+    for pos_code in POSITION_CODES:
+        try:
+            load_fused_params(pos_code)
+        except FileNotFoundError as e:
+            print(f"  - [警告] {e}")
+
+def _format_eta(seconds: float) -> str:
+    if not np.isfinite(seconds):
+        return "--:--"
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h:d}:{m:02d}:{s:02d}"
+
+def run_sweep(task_csv, job: str = "optimize", sweep_name: str = None, workers: int = None,
+              shard: tuple = (0, 1), retry_failed: bool = False) -> Path:
+    """
+    執行 (或接續執行) 一個批次工作。
+
+    Args:
+        task_csv: 任務清單 CSV (見 load_sweep_tasks)。
+        job (str): "optimize" (step_04) 或 "compare" (step_07)。
+        sweep_name (str): 批次資料夾名稱，預設為 "{CSV 檔名}_{job}"；同名即接續執行。
+        workers (int): 本機平行行程數，預設為 CPU 核心數。
+        shard (tuple): (第幾片, 總片數)，多台機器靜態分工時使用；
+            即使不分片，多台機器共用資料夾也會透過認領檔自動分工。
+        retry_failed (bool): 是否重新執行先前失敗的任務。
+
+    Returns:
+        Path: 批次資料夾路徑 (內含 results.jsonl)。
+    """
+    if job not in JOB_TYPES:
+        raise ValueError(f"未知的任務類型: {job} (可用: {JOB_TYPES})")
+    task_csv = Path(task_csv)
+    sweep_dir = SWEEPS_DIR / (sweep_name or f"{task_csv.stem}_{job}")
+    ckpt = SweepCheckpoint(sweep_dir)
+    workers = workers or os.cpu_count() or 1
+    shard_index, shard_count = shard
+
+    print("==========================================")
+    print(f"開始執行批次工作 [{sweep_dir.name}] ({job})...")
+    print("==========================================")
+
+    tasks = load_sweep_tasks(task_csv)
+    _warm_up_shared_artifacts()
+    _atomic_write_json(sweep_dir / TASKS_FILE, {"job": job, "source": str(task_csv), "num_tasks": len(tasks)})
+    # 以 task_id 雜湊分片，與任務清單的順序無關
+    tasks = [t for t in tasks if int(t["task_id"], 16) % shard_count == shard_index]
+    skip = ckpt.completed_ids() | (set() if retry_failed else ckpt.failed_ids())
+    pending = [t for t in tasks if t["task_id"] not in skip]
+    n_total, n_skipped = len(tasks), len(tasks) - len(pending)
+    print(f"  - 本分片 {shard_index + 1}/{shard_count} 共 {n_total} 個任務，已完成 (或已失敗) {n_skipped} 個，"
+          f"剩餘 {len(pending)} 個；使用 {workers} 個行程。")
+
+    n_done = n_failed = 0
+    start = last_report = time.time()
+
+    def report(force=False):
+        nonlocal last_report
+        now = time.time()
+        if not force and now - last_report < PROGRESS_INTERVAL_S:
+            return
+        last_report = now
+        finished = n_done + n_failed
+        rate = finished / max(now - start, 1e-9)
+        remaining = len(pending) - finished
+        eta = remaining / rate if rate > 0 else float('inf')
+        print(f"  - [進度] {n_skipped + finished}/{n_total} (本次完成 {n_done}、失敗 {n_failed})，"
+              f"{rate * 60:.1f} 任務/分，預估剩餘 {_format_eta(eta)}")
+
+    def handle(task, result, error):
+        nonlocal n_done, n_failed
+        if error is None:
+            ckpt.mark_done(task, result)
+            n_done += 1
+        else:
+            ckpt.mark_failed(task, error)
+            n_failed += 1
+            print(f"  - [警告] 任務 {task['task_id']} ({task['batter']}) 失敗: {error}")
+        report()
+
+    queue = iter(pending)
+
+    def next_claimed():
+        for task in queue:
+            # 其他機器可能在這段時間內完成了這個任務
+            if (ckpt.done_dir / f"{task['task_id']}.json").exists():
+                continue
+            if ckpt.try_claim(task["task_id"]):
+                return task
+        return None
+
+    stack = contextlib.ExitStack()
+    try:
+        if workers == 1:
+            while (task := next_claimed()) is not None:
+                handle(task, *_run_task(job, task))
+        else:
+            # 係數表只發佈一次到資料平面，子行程以路徑附加，不各自讀檔或複製
+            from src.optimization.step_04_find_optimal_position import attach_fused_params_plane
+            plane = stack.enter_context(DataPlane.create("sweep"))
+            publish_fused_coefs(plane)
+            with ProcessPoolExecutor(max_workers=workers, initializer=attach_fused_params_plane,
+                                     initargs=(plane,)) as pool:
+                in_flight = {}
+                while True:
+                    # 佇列保持在行程數的兩倍，既不會閒置也不會一次認領太多任務
+                    while len(in_flight) < 2 * workers and (task := next_claimed()) is not None:
+                        in_flight[pool.submit(_run_task, job, task)] = task
+                    if not in_flight:
+                        break
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        task = in_flight.pop(fut)
+                        try:
+                            handle(task, *fut.result())
+                        except Exception as e:
+                            handle(task, None, f"{type(e).__name__}: {e}")
+    except KeyboardInterrupt:
+        print("\n⚠️ [警告] 已中斷；已完成的任務都已存檔，重新執行相同指令即可接續。")
+        raise
+    finally:
+        stack.close()
+        # 釋放本行程認領但尚未完成的任務，讓下一次執行或其他機器可以立即接手
+        ckpt.release_all()
+
+    report(force=True)
+    collect_sweep_results(sweep_dir)
+    print(f"\n--- ✅ 批次工作完成 (耗時 {_format_eta(time.time() - start)})，結果位於: {sweep_dir} ---")
+    return sweep_dir
+
+def collect_sweep_results(sweep_dir: Path) -> Path:
+    """把所有已完成任務的檢查點合併成一份 results.jsonl (可隨時重建)。"""
+    ckpt = SweepCheckpoint(sweep_dir)
+    out_path = Path(sweep_dir) / RESULTS_FILE
+    tmp = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as out:
+        for path in sorted(ckpt.done_dir.glob("*.json")):
+            with open(path, 'r', encoding='utf-8') as f:
+                out.write(json.dumps(json.load(f), ensure_ascii=False) + "\n")
+    os.replace(tmp, out_path)
+    return out_path
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("用法: python -m src.utils.sweep_runner <任務清單.csv> [optimize|compare]")
+    else:
+        run_sweep(sys.argv[1], job=sys.argv[2] if len(sys.argv) > 2 else "optimize")
@@ -0,0 +1,128 @@
+# 檔案位置: src/utils/trace_store.py
+# 精簡的 Trace 存檔 (float32、抽稀、變數子集、壓縮、分塊) 與延遲載入工具。
+# 讀取球員名單或單一球員的樣本時，只會從檔案讀出需要的部分，不會把整個後驗分佈載入記憶體。
+
+import os
+import numpy as np
+import xarray as xr
+from pathlib import Path
+
+# --- 1. 存檔策略 (預設值) ---
+TRACE_DTYPE = "float32"        # 後驗樣本的儲存精度；None 表示維持原精度
+TRACE_THIN = 1                 # 每隔幾個 draw 保留一個 (1 = 不抽稀)
+TRACE_VARS = None              # 要保留的後驗變數；None 表示全部
+TRACE_GROUPS = ["posterior", "sample_stats"]  # observed_data 已存在於處理後的 CSV，預設不重複儲存
+TRACE_COMPLEVEL = 4            # zlib 壓縮等級 (0 = 不壓縮)
+TRACE_CHUNK_DRAWS = 250        # 檔案內部分塊：每塊的 draw 數
+TRACE_CHUNK_PLAYERS = 64       # 檔案內部分塊：每塊的球員數 (讀單一球員時只需解壓少數幾塊)
+
+ENGINE = "h5netcdf"
+
+# --- 2. 存檔 ---
+def _compact_group(ds: xr.Dataset, thin: int, dtype, var_names=None) -> xr.Dataset:
+    if var_names is not None:
+        ds = ds[[v for v in var_names if v in ds.data_vars]]
+    if thin > 1 and "draw" in ds.dims:
+        ds = ds.isel(draw=slice(None, None, thin))
+    if dtype is not None:
+        ds = ds.map(lambda da: da.astype(dtype) if np.issubdtype(da.dtype, np.floating) else da)
+    return ds
+
+def _encoding(ds: xr.Dataset, complevel: int) -> dict:
+    encoding = {}
+    for name, da in ds.data_vars.items():
+        if da.ndim == 0:
+            continue
+        chunks = []
+        for dim, size in zip(da.dims, da.shape):
+            if dim == "chain":
+                chunks.append(1)
+            elif dim == "draw":
+                chunks.append(min(size, TRACE_CHUNK_DRAWS))
+            else:
+                chunks.append(min(size, TRACE_CHUNK_PLAYERS))
+        encoding[name] = {"chunksizes": tuple(max(c, 1) for c in chunks)}
+        if complevel > 0:
+            encoding[name].update(zlib=True, complevel=complevel, shuffle=True)
+    return encoding
+
+def save_trace(idata, path, dtype=TRACE_DTYPE, thin: int = TRACE_THIN, var_names=TRACE_VARS,
+               groups=TRACE_GROUPS, complevel: int = TRACE_COMPLEVEL) -> Path:
+    """
+    依存檔策略寫出精簡的 Trace (與 az.from_netcdf 相容的 netCDF 群組格式)。
+    先寫暫存檔再 os.replace，寫入中途失敗不會破壞既有的 Trace。
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    mode = "w"
+    for group in groups:
+        if group not in idata.groups():
+            continue
+        ds = _compact_group(idata[group], thin, dtype, var_names if group == "posterior" else None)
+        ds.attrs.update(trace_thin=int(thin), trace_dtype=str(dtype or "original"))
+        ds.to_netcdf(tmp, mode=mode, group=group, engine=ENGINE, encoding=_encoding(ds, complevel))
+        mode = "a"
+    os.replace(tmp, path)
+    return path
+
+# --- 3. 延遲載入 ---
+def open_posterior(path) -> xr.Dataset:
+    """
+    延遲開啟 Trace 的 posterior 群組：只讀入座標與中繼資料，
+    變數的數值要等到被索引或 .values 時才從檔案讀取。用完請 close() 或使用 with。
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"找不到 Trace 檔案: {path}")
+    return xr.open_dataset(path, group="posterior", engine=ENGINE)
+
+def read_trace_players(path) -> list:
+    """只讀取 player 座標 (球員名單)。"""
+    with open_posterior(path) as posterior:
+        return posterior["player"].values.tolist()
+
+def read_player_draws(path, player_name: str, var_names=("alpha", "beta_dist", "beta_time")) -> dict:
+    """讀取單一球員各參數的全部樣本 (形狀為 (chain, draw))，只解壓該球員所在的分塊。"""
+    with open_posterior(path) as posterior:
+        players = posterior["player"].values.tolist()
+        try:
+            idx = players.index(player_name)
+        except ValueError:
+            raise ValueError(f"在模型參數中找不到球員 '{player_name}'。")
+        return {v: posterior[v].isel(player=idx).values for v in var_names}
+
+def posterior_means(path, var_names=("alpha", "beta_dist", "beta_time"), chunk_draws: int = TRACE_CHUNK_DRAWS) -> dict:
+    """
+    逐塊 (每次 chunk_draws 個 draw) 累加計算後驗平均，記憶體用量與總樣本數無關。
+    以 float64 累加，float32 存檔也不會損失平均值的精度。
+    """
+    with open_posterior(path) as posterior:
+        n_draws = posterior.sizes["draw"]
+        means = {}
+        for v in var_names:
+            da = posterior[v].transpose("chain", "draw", ...)
+            total, count = 0.0, 0
+            for start in range(0, n_draws, chunk_draws):
+                block = da.isel(draw=slice(start, start + chunk_draws)).values
+                total = total + block.sum(axis=(0, 1), dtype=np.float64)
+                count += block.shape[0] * block.shape[1]
+            means[v] = total / count
+        return means
+
+def compact_existing_trace(path, **policy) -> Path:
+    """把既有 (例如舊版 float64、未壓縮) 的 Trace 依目前的存檔策略改寫。"""
+    import arviz as az
+    path = Path(path)
+    before = path.stat().st_size
+    idata = az.from_netcdf(path)
+    idata.load() if hasattr(idata, "load") else None
+    save_trace(idata, path, **policy)
+    print(f"  - {path.name}: {before / 1e6:.1f} MB -> {path.stat().st_size / 1e6:.1f} MB")
+    return path
+
+
+if __name__ == "__main__":
+    from config import MODELS_DIR
+    for trace_path in sorted(MODELS_DIR.glob("*/*_model_trace.nc")):
+        compact_existing_trace(trace_path)
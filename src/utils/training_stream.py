@@ -0,0 +1,127 @@
+# 檔案位置: src/utils/training_stream.py
+# 以固定大小的區塊串流讀取訓練資料，寫成緊湊型別的磁碟陣列 (memmap)，
+# 讓多季資料的模型訓練不必把所有 *_with_all.csv 一次合併進記憶體。
+
+import json
+import glob
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from sklearn.preprocessing import StandardScaler
+
+from config import PROCESSED_DATA_DIR
+
+# --- 1. 常數定義區 ---
+COL_CAUGHT = "caught"
+COL_PLAYER_NAME = "player_name"
+COL_FIELDER_DIST = "fielder_distance_to_ball"
+COL_FLIGHT_TIME = "flight_time_s"
+FEATURE_COLS = [COL_FIELDER_DIST, COL_FLIGHT_TIME]
+
+STREAM_CHUNK_ROWS = 200_000    # 每次從 CSV 讀入的列數上限
+STREAM_META_FILE = "meta.json"
+# 各欄位在磁碟上的緊湊型別
+STREAM_ARRAYS = {"dist": np.float32, "time": np.float32, "player": np.int32, "caught": np.int8}
+
+# --- 2. 建立/讀取串流陣列 ---
+def _stream_dir(position_code: str) -> Path:
+    return PROCESSED_DATA_DIR / f"{position_code}_training_stream"
+
+def _source_signature(file_list) -> list:
+    """來源檔案的 (名稱, 大小, 修改時間)，任何一項變動就需要重建。"""
+    return [[Path(f).name, Path(f).stat().st_size, int(Path(f).stat().st_mtime)] for f in sorted(file_list)]
+
+def build_training_stream(position_code: str, rebuild: bool = False) -> dict:
+    """
+    單次掃描某守備位置的所有 *_with_all.csv：逐塊丟棄缺值列、把球員姓名編碼成整數，
+    以 StandardScaler.partial_fit 累積標準化參數，並把各欄位以緊湊型別附加寫入磁碟。
+    記憶體用量只與 STREAM_CHUNK_ROWS 有關，與資料總量無關。
+
+    Returns:
+        dict: 見 open_training_stream。
+    """
+    input_dir = PROCESSED_DATA_DIR / f"{position_code}_modified_data"
+    file_list = sorted(glob.glob(str(input_dir / "*_with_all.csv")))
+    if not file_list:
+        raise FileNotFoundError(f"在 {input_dir} 中找不到任何由 step_02 產生的檔案。")
+
+    out_dir = _stream_dir(position_code)
+    signature = _source_signature(file_list)
+    meta_path = out_dir / STREAM_META_FILE
+    if not rebuild and meta_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f).get("sources") == signature:
+                return open_training_stream(position_code)
+
+    print(f"  - 正在以串流方式建立 {position_code} 的訓練陣列 (每塊最多 {STREAM_CHUNK_ROWS} 列)...")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    scaler = StandardScaler()
+    player_codes = {}
+    n_rows = 0
+    handles = {name: open(out_dir / f"{name}.bin", 'wb') for name in STREAM_ARRAYS}
+    try:
+        for file_path in file_list:
+            reader = pd.read_csv(file_path, usecols=[COL_CAUGHT, COL_PLAYER_NAME] + FEATURE_COLS,
+                                 dtype={COL_FIELDER_DIST: np.float32, COL_FLIGHT_TIME: np.float32},
+                                 chunksize=STREAM_CHUNK_ROWS, encoding='utf-8')
+            for chunk in reader:
+                chunk = chunk.dropna()
+                if chunk.empty:
+                    continue
+                scaler.partial_fit(chunk[FEATURE_COLS].to_numpy(dtype=np.float64))
+                codes = np.array([player_codes.setdefault(p, len(player_codes)) for p in chunk[COL_PLAYER_NAME]],
+                                 dtype=STREAM_ARRAYS["player"])
+                handles["dist"].write(chunk[COL_FIELDER_DIST].to_numpy(dtype=STREAM_ARRAYS["dist"]).tobytes())
+                handles["time"].write(chunk[COL_FLIGHT_TIME].to_numpy(dtype=STREAM_ARRAYS["time"]).tobytes())
+                handles["player"].write(codes.tobytes())
+                handles["caught"].write(chunk[COL_CAUGHT].to_numpy(dtype=STREAM_ARRAYS["caught"]).tobytes())
+                n_rows += len(chunk)
+    finally:
+        for h in handles.values():
+            h.close()
+
+    if n_rows == 0:
+        raise ValueError(f"清理 NaN 後，沒有可用於訓練 {position_code} 模型的數據。")
+    meta = {"n_rows": n_rows, "players": list(player_codes),
+            "scaler_mean": scaler.mean_.tolist(), "scaler_scale": scaler.scale_.tolist(),
+            "scaler_var": scaler.var_.tolist(), "sources": signature}
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    print(f"  - 串流陣列建立完成：{n_rows} 列、{len(player_codes)} 位球員，"
+          f"共 {sum((out_dir / f'{n}.bin').stat().st_size for n in STREAM_ARRAYS) / 1e6:.1f} MB。")
+    return open_training_stream(position_code)
+
+def open_training_stream(position_code: str) -> dict:
+    """
+    以唯讀記憶體映射開啟串流陣列。
+
+    Returns:
+        dict: {"n_rows", "players", "scaler" (已擬合的 StandardScaler),
+               "dist", "time", "player", "caught" (np.memmap)}
+    """
+    out_dir = _stream_dir(position_code)
+    with open(out_dir / STREAM_META_FILE, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    scaler = StandardScaler()
+    scaler.mean_ = np.asarray(meta["scaler_mean"])
+    scaler.scale_ = np.asarray(meta["scaler_scale"])
+    scaler.var_ = np.asarray(meta["scaler_var"])
+    scaler.n_features_in_ = len(FEATURE_COLS)
+    scaler.n_samples_seen_ = meta["n_rows"]
+    stream = {"n_rows": meta["n_rows"], "players": meta["players"], "scaler": scaler}
+    for name, dtype in STREAM_ARRAYS.items():
+        stream[name] = np.memmap(out_dir / f"{name}.bin", dtype=dtype, mode='r', shape=(meta["n_rows"],))
+    return stream
+
+def sample_minibatch(stream: dict, batch_size: int, rng: np.random.Generator) -> dict:
+    """
+    從串流陣列隨機抽一批資料 (索引排序後讀取，對磁碟較友善)，並套用標準化。
+    """
+    idx = np.sort(rng.integers(0, stream["n_rows"], size=batch_size))
+    scaler = stream["scaler"]
+    return {
+        "dist": ((stream["dist"][idx] - scaler.mean_[0]) / scaler.scale_[0]).astype(np.float64),
+        "time": ((stream["time"][idx] - scaler.mean_[1]) / scaler.scale_[1]).astype(np.float64),
+        "player": stream["player"][idx].astype(np.int64),
+        "caught": stream["caught"][idx].astype(np.int64),
+    }
@@ -1,5 +1,6 @@
 # 檔案位置: src/visualization/step_05_visualize_alignment.py
 
+import os
 import pandas as pd
 import numpy as np
 import json
@@ -10,13 +11,23 @@ import seaborn as sns
 import matplotlib.transforms as transforms # 確保導入 transforms
 
 # 從 config 匯入專案路徑
-from config import INPUTS_DATA_DIR, RESULTS_DIR, FIGURES_DIR, RAW_DATA_DIR
+from config import RESULTS_DIR, FIGURES_DIR, MODELS_DIR
+from src.utils.player_registry import load_initial_positions, batter_file_path, optimization_result_path, matchup_stem
 # 從 utils 導入必要的函式和常數
 from src.utils.feature_engineering import (
-    calculate_batted_ball_features, convert_positioning_to_xy,
-    COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME,
-    COL_FIELDER_NAME, COL_FIELDER_X, COL_FIELDER_Y, COL_PLAYER_NAME # 確保導入 COL_PLAYER_NAME
+    calculate_batted_ball_features,
+    COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME, COL_PLAYER_NAME # 確保導入 COL_PLAYER_NAME
 )
+from src.utils.catch_kernel import POSITION_CODES
+from src.optimization.step_04_find_optimal_position import (
+    build_team_kernel, PRUNE_TOLERANCE, MIN_RADIUS, MAX_RADIUS, MIN_ANGLE_DEG, MAX_ANGLE_DEG
+)
+
+# --- 0. 常數定義區 ---
+SURFACES_DIR = RESULTS_DIR / "surfaces"
+SURFACE_GRID_STEP_FT = 4.0                            # 熱區網格間距 (ft)
+SURFACE_X_RANGE = (-280.0, 280.0)                     # 與圖表範圍一致
+SURFACE_Y_RANGE = (0.0, 420.0)
 
 # --- 1. 繪圖輔助函式 ---
 def draw_baseball_field_v2(ax):
@@ -31,39 +42,93 @@ def draw_baseball_field_v2(ax):
     ax.scatter(bases[:, 0], bases[:, 1], c='white', ec='black', s=100, zorder=5)
 
 # --- 2. 載入初始站位的輔助函式 ---
-def load_initial_positions(fielder_names: dict) -> dict:
-    """從 positioning.csv 檔案中讀取指定球員的平均站位，並轉換為 XY 座標。"""
-    initial_positions = {}
-    for pos_code, player_name in fielder_names.items():
-        positioning_file = RAW_DATA_DIR / f"{pos_code}_positioning.csv"
-        if not positioning_file.exists():
-            print(f"[警告] 找不到初始站位檔案: {positioning_file}，無法繪製初始 {pos_code} 位置。")
-            initial_positions[pos_code] = [np.nan, np.nan]
-            continue
-            
-        df_pos_original = pd.read_csv(positioning_file, encoding='utf-8')
-        df_pos_xy = convert_positioning_to_xy(df_pos_original)
-        
-        player_pos_data = df_pos_xy[df_pos_xy[COL_FIELDER_NAME] == player_name]
-        
-        if player_pos_data.empty:
-            print(f"[警告] 在 {positioning_file.name} 中找不到球員 '{player_name}' 的初始站位。將使用該位置的平均站位。")
-            avg_x = df_pos_xy[COL_FIELDER_X].mean()
-            avg_y = df_pos_xy[COL_FIELDER_Y].mean()
-            if pd.isna(avg_x) or pd.isna(avg_y):
-                 avg_x, avg_y = {'LF': (-150, 220), 'CF': (0, 250), 'RF': (150, 220)}.get(pos_code, (0,0))
-            initial_positions[pos_code] = [avg_x, avg_y]
-        else:
-            initial_positions[pos_code] = [
-                player_pos_data.iloc[0][COL_FIELDER_X],
-                player_pos_data.iloc[0][COL_FIELDER_Y]
-            ]
-    return initial_positions
-
-# --- 3. 主流程函式 ---
-def visualize_team_alignment(batter_name: str, fielder_names: dict):
+def load_initial_positions_or_nan(fielder_names: dict) -> dict:
+    """從球員註冊表取得初始站位；站位檔案不存在時以 NaN 代替 (該點不繪製)。"""
+    try:
+        return load_initial_positions(fielder_names)
+    except FileNotFoundError as e:
+        print(f"[警告] {e}，無法繪製初始站位。")
+        return {pos_code: [np.nan, np.nan] for pos_code in fielder_names}
+
+# --- 3. 站位熱區 (期望出局數曲面) ---
+def surface_grid() -> tuple:
+    """回傳熱區網格的 (x 座標, y 座標) 一維陣列。"""
+    xs = np.arange(SURFACE_X_RANGE[0], SURFACE_X_RANGE[1] + SURFACE_GRID_STEP_FT / 2, SURFACE_GRID_STEP_FT)
+    ys = np.arange(SURFACE_Y_RANGE[0], SURFACE_Y_RANGE[1] + SURFACE_GRID_STEP_FT / 2, SURFACE_GRID_STEP_FT)
+    return xs, ys
+
+def _surface_signature(batter_name: str, fielder_names: dict, optimal_positions: dict) -> np.ndarray:
+    """最佳站位、網格設定、打者資料與模型係數檔的修改時間；任何一項改變，快取的熱區就作廢。"""
+    mtimes = [os.path.getmtime(batter_file_path(batter_name))]
+    for pos_code in POSITION_CODES:
+        fused_path = MODELS_DIR / pos_code / f"{pos_code}_fused_coefs.npz"
+        mtimes.append(os.path.getmtime(fused_path) if fused_path.exists() else 0.0)
+    positions = [c for pos_code in POSITION_CODES for c in optimal_positions[pos_code]]
+    return np.array(positions + [SURFACE_GRID_STEP_FT, *SURFACE_X_RANGE, *SURFACE_Y_RANGE, PRUNE_TOLERANCE or 0.0] + mtimes,
+                    dtype=float)
+
+def compute_catch_surfaces(batter_name: str, fielder_names: dict, optimal_positions: dict,
+                           batter_df: pd.DataFrame = None) -> dict:
+    """
+    對每位外野手，在其他兩人固定於最佳站位時，計算他移動到網格上每一點的團隊期望出局數。
+    結果依對戰組合快取在 SURFACES_DIR (.npz)，同一組合再次查詢時直接讀檔。
+
+    Returns:
+        dict: {"x" (nx,), "y" (ny,), "surfaces" (3, ny, nx)，列順序為 LF, CF, RF, "optimum" (最佳站位的期望出局數),
+               "error_bound" (觸及半徑剪枝造成的每個網格點誤差上限)}
+    """
+    signature = _surface_signature(batter_name, fielder_names, optimal_positions)
+    cache_path = SURFACES_DIR / f"{matchup_stem(batter_name, fielder_names)}_surface.npz"
+    if cache_path.exists():
+        with np.load(cache_path, allow_pickle=False) as cached:
+            if cached["signature"].shape == signature.shape and np.allclose(cached["signature"], signature):
+                return {name: cached[name] for name in ("x", "y", "surfaces", "optimum", "error_bound")}
+
+    if batter_df is None:
+        batter_df = calculate_batted_ball_features(pd.read_csv(batter_file_path(batter_name), encoding='utf-8'))
+        batter_df = batter_df.dropna(subset=[COL_X_COORD, COL_Y_COORD, COL_FLIGHT_TIME])
+    kernel = build_team_kernel(batter_df, fielder_names)
+    xs, ys = surface_grid()
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    surfaces = np.stack([kernel.fielder_surface(optimal_positions, k, grid_x, grid_y) for k in range(len(POSITION_CODES))])
+    result = {"x": xs, "y": ys, "surfaces": surfaces.astype(np.float32),
+              "optimum": np.float64(kernel.expected_catches(optimal_positions)),
+              "error_bound": np.float64(kernel.surface_error_bound())}
+    if result["error_bound"] > 0:
+        print(f"  - 站位熱區使用觸及半徑剪枝，每個網格點的誤差上限 {result['error_bound']:.2e} 出局。")
+
+    SURFACES_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        np.savez(f, signature=signature, **result)
+    os.replace(tmp, cache_path)
+    return result
+
+def draw_catch_surface(ax, surface: dict, optimal_positions: dict):
+    """
+    把三張曲面疊成一張熱區圖：每個網格點顯示「離該點最近的最佳站位」那位外野手移動到此點時，
+    團隊期望出局數相對於最佳站位的變化；扇形約束以外的區域不上色。
+    """
+    xs, ys = surface["x"], surface["y"]
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    anchors = np.array([optimal_positions[p] for p in POSITION_CODES], dtype=float)
+    nearest = np.argmin(np.hypot(grid_x[None] - anchors[:, 0, None, None], grid_y[None] - anchors[:, 1, None, None]), axis=0)
+    delta = np.take_along_axis(surface["surfaces"], nearest[None], axis=0)[0] - surface["optimum"]
+    radius = np.hypot(grid_x, grid_y)
+    angle = np.degrees(np.arctan2(grid_x, grid_y))
+    feasible = (radius >= MIN_RADIUS) & (radius <= MAX_RADIUS) & (angle >= MIN_ANGLE_DEG) & (angle <= MAX_ANGLE_DEG)
+    delta = np.ma.masked_where(~feasible, delta)
+    mesh = ax.pcolormesh(grid_x, grid_y, delta, cmap="RdYlGn", shading="auto", alpha=0.55, zorder=1,
+                         vmin=min(float(delta.min()), -1e-6), vmax=0.0)
+    cbar = plt.colorbar(mesh, ax=ax, fraction=0.035, pad=0.02)
+    cbar.set_label("Δ expected team catches vs. optimal", fontsize=10)
+    return mesh
+
+# --- 4. 主流程函式 ---
+def visualize_team_alignment(batter_name: str, fielder_names: dict, show_surface: bool = False):
     """
     為指定的打者和外野手團隊，讀取結果並視覺化初始站位與最佳站位。
+    show_surface=True 時，另外疊上各外野手移動時團隊期望出局數變化的熱區 (見 compute_catch_surfaces)。
     """
     print("==========================================")
     print(f"開始為打者 [{batter_name}] 和指定團隊繪製佈陣對比圖...")
@@ -73,12 +138,8 @@ def visualize_team_alignment(batter_name: str, fielder_names: dict):
     # 1. 載入資料
     print("  - 正在載入資料...")
     try:
-        team_str = f"LF_{fielder_names['LF']}_CF_{fielder_names['CF']}_RF_{fielder_names['RF']}".replace(" ", "_").replace(",", "")
-        batter_str = batter_name.replace(" ", "_").replace(",", "")
-        positions_filename = f"{batter_str}_vs_{team_str}_optimal.json"
-        
-        batter_file = INPUTS_DATA_DIR / "batter_spray_charts" / f"{batter_name}.csv"
-        positions_file = RESULTS_DIR / "optimizations" / positions_filename
+        batter_file = batter_file_path(batter_name)
+        positions_file = optimization_result_path(batter_name, fielder_names)
         
         if not batter_file.exists() or not positions_file.exists():
             print(f"❌ [錯誤] 缺少必要的輸入檔案 (打者數據或最佳站位 JSON)。請先執行優化步驟。")
@@ -88,7 +149,7 @@ def visualize_team_alignment(batter_name: str, fielder_names: dict):
         with open(positions_file, 'r') as f:
             optimal_positions = json.load(f)
             
-        initial_positions = load_initial_positions(fielder_names)
+        initial_positions = load_initial_positions_or_nan(fielder_names)
             
         print("  - 資料載入完成。")
         
@@ -106,8 +167,17 @@ def visualize_team_alignment(batter_name: str, fielder_names: dict):
     draw_baseball_field_v2(ax)
     print("  - 棒球場繪製完成。")
 
-    # 4. 繪製擊球密度圖 (KDE)
-    sns.kdeplot(x=batter_df[COL_X_COORD], y=batter_df[COL_Y_COORD], fill=True, cmap="Blues", ax=ax, alpha=0.6, levels=8)
+    # 4. 繪製站位熱區 (選用) 與擊球密度圖 (KDE)；有熱區時密度圖只畫等高線，避免蓋住熱區
+    if show_surface:
+        try:
+            draw_catch_surface(ax, compute_catch_surfaces(batter_name, fielder_names, optimal_positions, batter_df),
+                               optimal_positions)
+            print("  - 站位熱區繪製完成。")
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            print(f"[警告] 無法計算站位熱區: {e}")
+            show_surface = False
+    sns.kdeplot(x=batter_df[COL_X_COORD], y=batter_df[COL_Y_COORD], fill=not show_surface, cmap="Blues", ax=ax,
+                alpha=0.6, levels=8)
     print("  - 擊球密度圖繪製完成。")
     
     # ✨ [核心修正] 取消註解，並恢復原始散點樣式 (黑色, s=20, alpha=0.5)
@@ -152,9 +222,8 @@ def visualize_team_alignment(batter_name: str, fielder_names: dict):
     
     # 7. 儲存與顯示
     FIGURES_DIR.mkdir(parents=True, exist_ok=True)
-    team_str = f"LF_{fielder_names['LF']}_CF_{fielder_names['CF']}_RF_{fielder_names['RF']}".replace(" ", "_").replace(",", "")
-    batter_str = batter_name.replace(" ", "_").replace(",", "")
-    output_filename = f"{batter_str}_vs_{team_str}_alignment_comparison.png"
+    suffix = "alignment_surface" if show_surface else "alignment_comparison"
+    output_filename = f"{matchup_stem(batter_name, fielder_names)}_{suffix}.png"
     output_path = FIGURES_DIR / output_filename
     
     plt.savefig(output_path, dpi=300, facecolor='white')